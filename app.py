@@ -1,14 +1,29 @@
 import os
 import json
-import threading
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+import time
+import functools
+from datetime import datetime
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, session
 from flask_session import Session
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from flask_socketio import SocketIO, emit, join_room
 from db import db
-from models import User, Match
+from models import User
 import redis
 import game as game_module
+import matchmaking
+import ratings
+import leaderboard
+import response_cache
+import match_results
+import match_history
+import player_stats
+import presence
+import event_router
+import metrics
+import profiling
+import ratelimit
+import room_cache as room_cache_module
 from wordle_logic import evaluate_guess, random_word, is_valid_word
 
 
@@ -27,12 +42,14 @@ def create_app():
     # Redis-backed server-side sessions
     redis_url = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
     app.config["SESSION_TYPE"] = "redis"
-    app.config["SESSION_REDIS"] = redis.from_url(redis_url)
+    app.config["SESSION_REDIS"] = metrics.instrument_redis(redis.from_url(redis_url))
     app.config["SESSION_PERMANENT"] = False
     app.config["SESSION_USE_SIGNER"] = True
 
     db.init_app(app)
     Session(app)
+    metrics.instrument_flask(app)
+    profiling.instrument_flask(app)
     return app
 
 
@@ -46,30 +63,60 @@ socketio = SocketIO(
     message_queue=os.environ.get("REDIS_URL")
 )
 
+# Usernames allowed to use the /admin endpoints (comma-separated)
+ADMIN_USERNAMES = {name.strip() for name in os.environ.get("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
 # Flask-Login setup
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = "index"
 
 # Redis connection for game state and pubsub
-r = redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
-QUEUE_KEY = "matchmaking_queue"
-EVENT_CHANNEL = "events"
+r = metrics.instrument_redis(
+    redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+)
 
-# Presence tracking to prevent matching with offline/stale queue entries
-ONLINE_TTL = 600  # seconds
+# Presence tracking to prevent matching with offline/stale queue entries.
+# Refreshes are coalesced per user and written in batches (see presence).
+presence_tracker = presence.PresenceCoalescer(r)
 
 
-def touch_online(user_id: int):
-    """Mark user as online with a short TTL (refreshed by heartbeats)."""
-    try:
-        r.setex(f"user:{user_id}:online", ONLINE_TTL, "1")
-    except Exception:
-        pass
+def touch_online(user_id: int, force: bool = False):
+    """Mark user as online (force writes immediately instead of coalescing)."""
+    presence_tracker.touch(user_id, force=force)
+
+
+# /stats and /leaderboard responses, shared through Redis and invalidated
+# when a match is saved (see response_cache)
+cache = response_cache.ResponseCache(r)
+
 
+def _session_user_id():
+    """Logged-in user id from the server-side session, without a DB load."""
+    return session.get("_user_id")
 
-# Track if pubsub listener has been started
-pubsub_listener_started = False
+
+# Token buckets per user and per IP for the expensive or floodable
+# endpoints (see ratelimit); checked before any DB work
+limiter = ratelimit.RateLimiter(
+    r, on_reject=lambda action, scope: metrics.RATE_LIMITED.labels(action, scope).inc()
+)
+
+
+def _attempted_username():
+    """Username a login/register request is for, normalized; no DB lookup."""
+    data = request.get_json(silent=True) or {}
+    username = str(data.get("username", "")).strip().lower()
+    return username or None
+
+
+def _login_identity():
+    """
+    Login attempts are limited per (username, client IP): a per-username
+    bucket alone would let anyone lock an account out with bad attempts.
+    """
+    username = _attempted_username()
+    return f"{username}|{ratelimit.client_ip()}" if username else None
 
 
 @login_manager.user_loader
@@ -78,6 +125,17 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 
+def admin_required(view):
+    """Restrict a route to logged-in users listed in ADMIN_USERNAMES."""
+    @functools.wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if current_user.username not in ADMIN_USERNAMES:
+            return jsonify({"error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
 # --------------------
 # Page routes
 # --------------------
@@ -113,18 +171,16 @@ def singleplayer_page():
 @login_required
 def active_match():
     """Return current user's active match assignment (prevents missed socket events)."""
-    room = r.get(f"user:{current_user.id}:active_room")
-    if not room:
+    assignment = game_module.get_active_match(r, current_user.id)
+    if not assignment:
         return jsonify({"active": False})
 
     # Validate the room still exists; if not, clear stale assignment
-    if not r.exists(f"game:{room}:meta"):
-        r.delete(f"user:{current_user.id}:active_room")
-        r.delete(f"user:{current_user.id}:active_is_p1")
+    room, is_p1 = assignment
+    if not game_module.game_exists(r, room):
+        game_module.clear_active_match(r, current_user.id)
         return jsonify({"active": False})
 
-    is_p1_str = r.get(f"user:{current_user.id}:active_is_p1")
-    is_p1 = True if str(is_p1_str) == "1" else False
     return jsonify({"active": True, "room": room, "is_p1": is_p1})
 
 
@@ -132,6 +188,7 @@ def active_match():
 # Auth + API routes
 # --------------------
 @app.route("/register", methods=["POST"])
+@limiter.limit("register", _attempted_username)
 def register():
     """Create new user account."""
     data = request.json
@@ -163,6 +220,7 @@ def register():
 
 
 @app.route("/login", methods=["POST"])
+@limiter.limit("login", _login_identity)
 def login():
     """Authenticate user and create session."""
     data = request.json
@@ -191,18 +249,18 @@ def logout():
 
 
 @app.route("/queue", methods=["POST"])
+@limiter.limit("queue", _session_user_id)
 @login_required
 def join_queue():
     """Add authenticated user to matchmaking queue."""
     # Mark presence so matchmaker accepts this user even before Socket.IO heartbeat
-    touch_online(current_user.id)
+    touch_online(current_user.id, force=True)
 
-    # Check if already in queue
-    queue_list = r.lrange(QUEUE_KEY, 0, -1)
-    if str(current_user.id) in queue_list:
+    # Atomic, idempotent enqueue (ZADD NX), indexed by rating for the
+    # rating matchmaker
+    if not matchmaking.enqueue(r, current_user.id, rating=current_user.rating):
         return jsonify({"error": "Already in queue"}), 400
 
-    r.lpush(QUEUE_KEY, current_user.id)
     return jsonify({"queued": True, "user_id": current_user.id})
 
 
@@ -211,13 +269,24 @@ def join_queue():
 def cancel_queue():
     """Remove the current user from the matchmaking queue."""
     try:
-        r.lrem(QUEUE_KEY, 0, str(current_user.id))
+        matchmaking.dequeue(r, current_user.id)
     except Exception:
         return jsonify({"success": False, "error": "Redis error"}), 500
     return jsonify({"success": True})
 
 
+@app.route("/queue/status")
+@login_required
+def queue_status():
+    """Current user's queue position, players waiting and estimated wait."""
+    try:
+        return jsonify(matchmaking.queue_status(r, current_user.id))
+    except Exception:
+        return jsonify({"error": "Redis error"}), 500
+
+
 @app.route("/stats")
+@cache.cached("stats", _session_user_id, cache_control="private, no-cache")
 @login_required
 def get_stats():
     """Get current user's statistics."""
@@ -230,21 +299,155 @@ def get_stats():
         "total_games": total_games,
         "total_wins": total_wins,
         "total_losses": total_losses,
-        "win_rate": round(current_user.win_rate, 1)
+        "win_rate": round(current_user.win_rate, 1),
+        "rating": round(current_user.rating or ratings.DEFAULT_RATING),
+        **player_stats.profile(current_user.id),
     })
 
 
+def _leaderboard_window():
+    window = request.args.get("window", "global")
+    return window if window in leaderboard.WINDOWS else None
+
+
+def _leaderboard_page():
+    return leaderboard.page_bounds(request.args.get("page", 1, type=int),
+                                   request.args.get("per_page", 10, type=int))
+
+
+def _leaderboard_variant():
+    # Keyed by the board id (e.g. daily:20240101), so a cached daily or
+    # weekly page isn't served past the window's rollover, and by the page
+    # as top() serves it, so out-of-range values share one entry; deep
+    # pages aren't cached at all
+    window = _leaderboard_window()
+    if window is None:
+        return None
+    page, per_page = _leaderboard_page()
+    if page > leaderboard.MAX_CACHED_PAGE:
+        return None
+    return f"{leaderboard.window_id(window, datetime.utcnow())}|{page}|{per_page}"
+
+
 @app.route("/leaderboard")
-def leaderboard():
-    """Get top players by total wins."""
-    top_players = User.query.filter(User.total_games >= 1).order_by(User.total_wins.desc()).limit(10).all()
+@cache.cached("leaderboard", _leaderboard_variant)
+def get_leaderboard():
+    """
+    Top players by wins, best first.
+
+    Query: window=global|daily|weekly, page (1-based), per_page (max 100).
+    """
+    window = _leaderboard_window()
+    if window is None:
+        return jsonify({"error": "Unknown window"}), 400
+    page, per_page = _leaderboard_page()
+
+    try:
+        return jsonify(leaderboard.top(r, window, page=page, per_page=per_page))
+    except Exception:
+        return jsonify({"error": "Redis error"}), 500
+
+
+@app.route("/leaderboard/me")
+@login_required
+def leaderboard_me():
+    """Current user's rank on a board (window=global|daily|weekly)."""
+    window = _leaderboard_window()
+    if window is None:
+        return jsonify({"error": "Unknown window"}), 400
+
+    try:
+        entry = leaderboard.rank_of(r, current_user.id, window)
+    except Exception:
+        return jsonify({"error": "Redis error"}), 500
+    if entry is None:
+        return jsonify({"ranked": False})
+    return jsonify({"ranked": True, **entry})
+
+
+@app.route("/leaderboard/around")
+@login_required
+def leaderboard_around():
+    """Players ranked just above and below the current user (radius, max 50)."""
+    window = _leaderboard_window()
+    if window is None:
+        return jsonify({"error": "Unknown window"}), 400
+    radius = request.args.get("radius", 5, type=int)
+
+    try:
+        return jsonify(leaderboard.around(r, current_user.id, window, radius=radius))
+    except Exception:
+        return jsonify({"error": "Redis error"}), 500
+
+
+@app.route("/history")
+@login_required
+def history():
+    """Current user's past matches, newest first (limit, cursor from next_cursor)."""
+    limit = request.args.get("limit", match_history.DEFAULT_PAGE_SIZE, type=int)
+    try:
+        return jsonify(match_history.user_history(current_user.id, limit=limit,
+                                                  cursor=request.args.get("cursor")))
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+
+@app.route("/history/vs/<username>")
+@login_required
+def head_to_head(username):
+    """Current user's record and matches against one opponent, newest first."""
+    opponent = User.query.filter_by(username=username).first()
+    if not opponent:
+        return jsonify({"error": "Unknown player"}), 404
+
+    limit = request.args.get("limit", match_history.DEFAULT_PAGE_SIZE, type=int)
+    try:
+        page = match_history.head_to_head(current_user.id, opponent.id, limit=limit,
+                                          cursor=request.args.get("cursor"))
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    return jsonify({"record": player_stats.record_against(current_user.id, opponent.id), **page})
+
 
-    return jsonify([{
-        "username": u.username,
-        "total_games": u.total_games,
-        "total_wins": u.total_wins,
-        "win_rate": round(u.win_rate, 1)
-    } for u in top_players])
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape endpoint (see metrics)."""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
+@app.route("/admin/profile", methods=["GET", "POST"])
+@admin_required
+def admin_profile():
+    """
+    On-demand cProfile capture for this web process (see profiling).
+
+    POST {"seconds": 30, "handler": "submit_guess"} starts one; omit
+    handler to profile everything for the window. GET returns the running
+    capture's status and the last finished capture's stats.
+    """
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        try:
+            status = profiling.capture.start(data.get("seconds", 30), handler=data.get("handler"))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        except RuntimeError as e:
+            return jsonify({"error": str(e)}), 409
+        return jsonify(status)
+    return jsonify({**profiling.capture.status(), "last": profiling.capture.last()})
+
+
+@app.route("/admin/stalls")
+@admin_required
+def admin_stalls():
+    """Recent event-loop stalls in this web process, with the blocking stacks."""
+    return jsonify({
+        "pid": os.getpid(),
+        "enabled": profiling.PROFILING_ENABLED,
+        "threshold_ms": profiling.STALL_THRESHOLD_MS,
+        "stalls": profiling.stall_detector.recent(),
+    })
 
 
 @app.route("/match_info")
@@ -255,7 +458,7 @@ def match_info():
     if not room:
         return jsonify({"error": "room required"}), 400
 
-    meta = r.hgetall(f"game:{room}:meta")
+    meta = room_cache.meta(room)
     if not meta:
         return jsonify({"error": "match not found"}), 404
 
@@ -290,36 +493,42 @@ def match_info():
 # Socket.IO events
 # --------------------
 @socketio.on("connect")
-def on_connect():
+@metrics.socket_handler("connect")
+def on_connect(auth=None):
     """Handle new WebSocket connection."""
-    global pubsub_listener_started
-
     if not current_user.is_authenticated:
         emit("not_authenticated")
         return False
 
     # Mark presence
-    touch_online(current_user.id)
+    touch_online(current_user.id, force=True)
 
-    # Join private room for this user
+    # Join private room for this user and route their events to this process
     join_room(f"user:{current_user.id}")
+    events.start()
+    events.acquire(request.sid, game_module.user_channel(current_user.id))
     emit("connected", {"user_id": current_user.id, "username": current_user.username})
 
-    # Start Redis pubsub listener (only once)
-    if not pubsub_listener_started:
-        t = threading.Thread(target=start_redis_listener, daemon=True)
-        t.start()
-        pubsub_listener_started = True
-
 
 @socketio.on("presence")
+@metrics.socket_handler("presence")
 def on_presence():
     """Heartbeat from client to keep online status fresh."""
     if current_user.is_authenticated:
         touch_online(current_user.id)
 
 
+@socketio.on("queue_status")
+@metrics.socket_handler("queue_status")
+def on_queue_status():
+    """Socket variant of /queue/status; replies with a queue_status event."""
+    if not current_user.is_authenticated:
+        return
+    emit("queue_status", matchmaking.queue_status(r, current_user.id))
+
+
 @socketio.on("join_room")
+@metrics.socket_handler("join_room")
 def on_join_room(data):
     """Player joins game room after match found."""
     touch_online(current_user.id)
@@ -329,13 +538,28 @@ def on_join_room(data):
         return
 
     join_room(room)
+    events.acquire(request.sid, game_module.room_channel(room))
+    if room_cache.enabled:
+        # Invalidations for the room state cached by this process
+        events.acquire(request.sid, room_cache.channel(room))
     emit("player_joined", {
         "user_id": current_user.id,
         "username": current_user.username
     }, room=room)
 
+    # Send the authoritative deadline once; the client counts down locally
+    ends_at = game_module.get_ends_at(r, room)
+    if ends_at is not None:
+        now = time.time()
+        emit("timer_update", {
+            "ends_at": int(ends_at * 1000),
+            "server_now": int(now * 1000),
+            "time_left": max(0, int(round(ends_at - now))),
+        })
+
 
 @socketio.on("surrender")
+@metrics.socket_handler("surrender")
 def on_surrender(data):
     """End the game immediately: surrendering player loses, opponent wins."""
     room = (data or {}).get("room")
@@ -343,8 +567,7 @@ def on_surrender(data):
         emit("guess_error", {"error": "Missing room"})
         return
 
-    gkey = f"game:{room}:meta"
-    meta = r.hgetall(gkey)
+    meta = room_cache.meta(room)
     if not meta:
         emit("guess_error", {"error": "Match not found or already ended"})
         return
@@ -361,8 +584,7 @@ def on_surrender(data):
         return
 
     # Idempotency guard so two surrenders / timer don't double-save
-    end_key = f"game:{room}:ended"
-    if not r.set(end_key, "1", nx=True, ex=3600):
+    if not game_module.mark_ended(r, room):
         return  # already ended elsewhere
 
     winner_id = (p2_id if current_user.id == p1_id else p1_id)
@@ -372,45 +594,16 @@ def on_surrender(data):
     score_p2 = int(scores.get("p2", 0))
     duration = int(meta.get("duration", 300))
 
-    # Persist match + update stats
+    # Durable hand-off to the match writer in the game worker, which
+    # persists the result and announces match_saved once it's committed
     try:
-        match = Match(
-            room=room,
-            p1_id=p1_id,
-            p2_id=p2_id,
-            score_p1=score_p1,
-            score_p2=score_p2,
-            winner_id=winner_id,
-            duration=duration
-        )
-        db.session.add(match)
-
-        user1 = User.query.get(p1_id)
-        user2 = User.query.get(p2_id)
-
-        if user1:
-            user1.total_games = (user1.total_games or 0) + 1
-            if winner_id == user1.id:
-                user1.total_wins = (user1.total_wins or 0) + 1
-
-        if user2:
-            user2.total_games = (user2.total_games or 0) + 1
-            if winner_id == user2.id:
-                user2.total_wins = (user2.total_wins or 0) + 1
-
-        db.session.commit()
+        match_results.submit(r, room, p1_id, p2_id, score_p1, score_p2, winner_id,
+                             duration, reason="surrender")
     except Exception:
-        db.session.rollback()
-        r.delete(end_key)  # allow retry if DB write failed
+        game_module.clear_ended(r, room)  # allow retry if the result couldn't be queued
         emit("guess_error", {"error": "Failed to save surrender result"})
         return
 
-    # Notify both clients
-    socketio.emit("match_saved", {
-        "winner_id": winner_id,
-        "scores": {"p1": score_p1, "p2": score_p2}
-    }, room=room)
-
     socketio.emit("game_over", {
         "room": room,
         "final_scores": {"p1": score_p1, "p2": score_p2},
@@ -420,16 +613,20 @@ def on_surrender(data):
     }, room=room)
 
     # Cleanup Redis keys
-    try:
-        r.delete(f"game:{room}:time_left")
-    except Exception:
-        pass
-    game_module.end_game_cleanup(r, room)
+    game_module.end_game_cleanup(r, room, players=(p1_id, p2_id))
 
 
 @socketio.on("submit_guess")
+@metrics.socket_handler("submit_guess")
 def on_submit_guess(data):
     """Process player's word guess."""
+    # Throttle before loading the user or touching the dictionary
+    retry_after = limiter.hit("guess", user=_session_user_id(), ip=ratelimit.client_ip())
+    if retry_after is not None:
+        emit("guess_error", {"error": "Too many guesses, slow down",
+                             "retry_after": round(retry_after, 1)})
+        return
+
     touch_online(current_user.id)
 
     room = data.get("room")
@@ -450,12 +647,36 @@ def on_submit_guess(data):
         emit("guess_error", {"error": "Not a valid word"})
         return
 
-    # Get player's secret word (scoped to room)
-    secret = game_module.get_player_word(r, room, player_id)
-    if not secret:
+    if not room:
         emit("guess_error", {"error": "Game not started properly"})
         return
 
+    # A wrong guess against the cached word changes nothing in Redis, so it
+    # is answered without reading the room (the rate-limit check above is
+    # the guess's only round trip); a guess matching the cached word, or
+    # any guess while the room isn't cached, goes to Redis to be checked,
+    # scored and rotated atomically in one round trip
+    secret = None
+    if room_cache.caches(room):
+        state = room_cache.get(room)
+        secret = state.words.get(str(player_id)) if state else None
+        if secret is None:
+            emit("guess_error", {"error": "Game not started properly"})
+            return
+
+    outcome = None
+    if secret is None or guess == secret:
+        # new_word is only stored if the guess is still correct
+        new_word = random_word()
+        outcome = game_module.resolve_guess(r, room, player_id, guess, new_word)
+        if not outcome:
+            emit("guess_error", {"error": "Game not started properly"})
+            return
+        secret = outcome["secret"]
+        # Don't wait for the invalidation message: a guess handled before
+        # it arrives must be scored against the word now in Redis
+        room_cache.update_word(room, player_id, new_word if outcome["solved"] else secret)
+
     # Evaluate guess
     result = evaluate_guess(secret, guess)
     emit("guess_feedback", {
@@ -464,102 +685,116 @@ def on_submit_guess(data):
         "solved": result["solved"]
     })
 
-    # If solved, increment score and assign new word
-    if result["solved"]:
-        game_module.increment_score(r, room, player_id)
-        scores = game_module.get_scores(r, room)
-
-        socketio.emit("score_update", scores, room=room)
-
-        # Assign new word for this player
-        new_word = random_word()
-        game_module.set_player_word(r, room, player_id, new_word)
+    # If solved, the script already incremented the score and assigned a new word
+    if outcome and outcome["solved"]:
+        socketio.emit("score_update", outcome["scores"], room=room)
         emit("new_word", {"word_length": len(new_word), "message": "Correct! New word assigned"})
 
 
 @socketio.on("disconnect")
+@metrics.socket_handler("disconnect")
 def on_disconnect():
     """Handle WebSocket disconnection."""
+    events.release_sid(request.sid)
     try:
         if current_user.is_authenticated:
             # Remove from matchmaking queue to avoid stale matches
-            r.lrem(QUEUE_KEY, 0, str(current_user.id))
-            r.delete(f"user:{current_user.id}:online")
+            matchmaking.dequeue(r, current_user.id)
+            r.delete(presence.online_key(current_user.id))
+            presence_tracker.forget(current_user.id)
     except Exception:
         pass
     print(f"User {current_user.id if current_user.is_authenticated else 'unknown'} disconnected")
 
 
-# ===== Redis Pubsub Listener =====
-def start_redis_listener():
+# ===== Redis Pubsub Relay =====
+def relay_event(channel, raw):
     """
-    Background thread listening to Redis pubsub events.
-    Re-emits events to appropriate SocketIO rooms.
+    Re-emit a worker event to this process's own Socket.IO clients.
+
+    The event router only delivers events for users and rooms with sockets
+    on this process, and every process hosting one of them gets its own
+    copy, so emits skip the Socket.IO message queue (ignore_queue=True);
+    going through the queue would deliver once per relaying process.
+    Room state messages only invalidate room_cache.
     """
-    pubsub = r.pubsub()
-    pubsub.subscribe(EVENT_CHANNEL)
+    if room_cache.is_invalidation(channel):
+        room_cache.handle_invalidation(channel)
+        return
 
-    print("Redis pubsub listener started")
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError:
+        print(f"Invalid JSON in pubsub message: {raw}")
+        return
+    event_type = data.get("type")
+    metrics.observe_relay(event_type, data.get("server_now"))
+
+    if event_type == "match_found":
+        # Tell the player their room and whether they are player 1 or 2
+        uid = data.get("user_id")
+        room = data.get("room")
+        if uid and room:
+            socketio.emit(
+                "match_found",
+                {"room": room, "is_p1": bool(data.get("is_p1"))},
+                room=f"user:{uid}",
+                ignore_queue=True,
+            )
+
+    elif event_type == "timer_update":
+        room = data.get("room")
+        socketio.emit(
+            "timer_update",
+            {
+                "ends_at": data.get("ends_at"),
+                "server_now": data.get("server_now"),
+                "time_left": data.get("time_left"),
+            },
+            room=room,
+            ignore_queue=True,
+        )
 
-    for msg in pubsub.listen():
-        if msg is None or msg.get("type") != "message":
-            continue
+    elif event_type == "game_over":
+        room = data.get("room")
+        socketio.emit(
+            "game_over",
+            {
+                "room": room,
+                "final_scores": data.get("final_scores", {}),
+                "winner_id": data.get("winner_id"),
+            },
+            room=room,
+            ignore_queue=True,
+        )
 
-        try:
-            data = json.loads(msg["data"])
-            event_type = data.get("type")
-
-            if event_type == "match_found":
-                # Notify each player and tell them if they are player 1 or 2
-                players = data.get("players", [])
-                room = data.get("room")
-                if room and len(players) == 2:
-                    p1, p2 = players
-
-                    socketio.emit(
-                        "match_found",
-                        {"room": room, "is_p1": True},
-                        room=f"user:{p1}",
-                    )
-
-                    socketio.emit(
-                        "match_found",
-                        {"room": room, "is_p1": False},
-                        room=f"user:{p2}",
-                    )
-
-            elif event_type == "timer_update":
-                room = data.get("room")
-                time_left = data.get("time_left")
-                socketio.emit("timer_update", {"time_left": time_left}, room=room)
-
-            elif event_type == "game_over":
-                room = data.get("room")
-                socketio.emit(
-                    "game_over",
-                    {
-                        "room": room,
-                        "final_scores": data.get("final_scores", {}),
-                        "winner_id": data.get("winner_id"),
-                    },
-                    room=room,
-                )
-
-            elif event_type == "match_result_saved":
-                room = data.get("room")
-                socketio.emit(
-                    "match_saved",
-                    {
-                        "winner_id": data.get("winner_id"),
-                        "scores": data.get("scores"),
-                    },
-                    room=room,
-                )
-
-        except json.JSONDecodeError:
-            print(f"Invalid JSON in pubsub message: {msg.get('data')}")
-        except Exception as e:
-            print(f"Error processing pubsub message: {e}")
+    elif event_type == "match_result_saved":
+        room = data.get("room")
+        socketio.emit(
+            "match_saved",
+            {
+                "winner_id": data.get("winner_id"),
+                "scores": data.get("scores"),
+            },
+            room=room,
+            ignore_queue=True,
+        )
+
+    elif event_type == response_cache.INVALIDATE_EVENT:
+        cache.handle_event(data)
+
+
+# Subscribes to the global channel plus the user and room channels of the
+# sockets connected to this process
+events = event_router.EventRouter(r, relay_event)
+
+# Room meta and current words for rooms with sockets on this process,
+# invalidated by room state messages delivered through the router
+room_cache = room_cache_module.RoomCache(
+    r, events,
+    on_lookup=lambda result: metrics.ROOM_CACHE_LOOKUPS.labels(result).inc(),
+    on_invalidate=metrics.ROOM_CACHE_INVALIDATIONS.inc,
+)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+# event_router.py
+"""
+Per-process routing of worker events to local Socket.IO clients.
+
+Workers publish events to the channel of the user or room they concern
+(game.user_channel / game.room_channel). Each web process subscribes only
+to the channels of the users and rooms whose sockets it hosts, plus the
+global EVENT_CHANNEL for deployment-wide notices such as cache
+invalidation, so the pub/sub traffic a web process reads grows with its
+own connections rather than with global traffic.
+
+Subscriptions are refcounted per socket: the first local socket for a
+channel subscribes, the last one to disconnect unsubscribes. A single
+listener thread owns the PubSub connection; acquire/release only queue
+(un)subscribe operations that the listener applies between reads, since
+PubSub objects aren't safe to share across threads. A channel counts as
+live (is_live) once Redis has confirmed the subscription, so callers that
+cache data invalidated through a channel know when it is safe to do so;
+reset hooks run whenever the connection is re-established, since
+messages published while it was down are lost.
+"""
+import threading
+import time
+
+from game import EVENT_CHANNEL
+
+POLL_TIMEOUT = 0.1  # seconds; bounds how long a new subscription waits to take effect
+
+
+class EventRouter:
+    """
+    Args:
+        redis_client: Redis client (decode_responses=True)
+        handler: Called as handler(channel, data) for every message
+        global_channels: Channels every process always listens to
+    """
+
+    def __init__(self, redis_client, handler, global_channels=None):
+        self.r = redis_client
+        self.handler = handler
+        self.global_channels = list(global_channels or [EVENT_CHANNEL])
+        self._lock = threading.Lock()
+        self._refs = {}  # channel -> local sockets interested in it
+        self._sid_channels = {}  # socket id -> set of channels it holds
+        self._ops = []  # pending ("subscribe" | "unsubscribe", channel)
+        self._live = set()  # channels Redis has confirmed
+        self._reset_hooks = []
+        self._thread = None
+
+    def start(self):
+        """Start the listener thread once per process (safe to call repeatedly)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="event-router", daemon=True)
+            self._thread.start()
+
+    def acquire(self, sid: str, channel: str):
+        """Route channel to this process for as long as socket sid is connected."""
+        with self._lock:
+            held = self._sid_channels.setdefault(sid, set())
+            if channel in held:
+                return
+            held.add(channel)
+            self._refs[channel] = self._refs.get(channel, 0) + 1
+            if self._refs[channel] == 1:
+                self._ops.append(("subscribe", channel))
+
+    def release_sid(self, sid: str):
+        """Drop every channel held by a disconnected socket."""
+        with self._lock:
+            for channel in self._sid_channels.pop(sid, ()):
+                self._refs[channel] -= 1
+                if self._refs[channel] <= 0:
+                    del self._refs[channel]
+                    self._live.discard(channel)  # no longer to be relied on
+                    self._ops.append(("unsubscribe", channel))
+
+    def is_live(self, channel: str) -> bool:
+        """True once Redis has confirmed this process's subscription to channel."""
+        with self._lock:
+            return channel in self._live
+
+    def on_reset(self, hook):
+        """Call hook() whenever the subscription connection is (re)established."""
+        self._reset_hooks.append(hook)
+
+    def _apply_ops(self, pubsub):
+        with self._lock:
+            ops, self._ops = self._ops, []
+        # Collapse a subscribe/unsubscribe pair queued within one poll
+        final = {}
+        for op, channel in ops:
+            final[channel] = op
+        subscribe = [c for c, op in final.items() if op == "subscribe"]
+        unsubscribe = [c for c, op in final.items() if op == "unsubscribe"]
+        if subscribe:
+            pubsub.subscribe(*subscribe)
+        if unsubscribe:
+            pubsub.unsubscribe(*unsubscribe)
+
+    def _run(self):
+        print("Redis event router started")
+        while True:
+            pubsub = self.r.pubsub()
+            with self._lock:
+                self._live.clear()
+            for hook in self._reset_hooks:
+                hook()
+            try:
+                pubsub.subscribe(*self.global_channels)
+                # Re-subscribe everything held locally (matters after a reconnect)
+                with self._lock:
+                    held = list(self._refs)
+                    self._ops = []
+                if held:
+                    pubsub.subscribe(*held)
+
+                while True:
+                    self._apply_ops(pubsub)
+                    msg = pubsub.get_message(timeout=POLL_TIMEOUT)
+                    if msg is None:
+                        continue
+                    if msg["type"] in ("subscribe", "unsubscribe"):
+                        with self._lock:
+                            if msg["type"] == "subscribe":
+                                self._live.add(msg["channel"])
+                            else:
+                                self._live.discard(msg["channel"])
+                        continue
+                    if msg["type"] != "message":
+                        continue
+                    try:
+                        self.handler(msg["channel"], msg["data"])
+                    except Exception as e:
+                        print(f"Error processing pubsub message: {e}")
+            except Exception as e:
+                print(f"Event router connection error: {e}")
+                time.sleep(1)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
@@ -0,0 +1,285 @@
+# feedback_matrix.py
+"""
+Precomputed Wordle feedback for every (guess, secret) pair in the dictionary.
+
+Each word gets an integer index (its position in the sorted word list) and
+the feedback for a guess/secret pair is packed into one base-3 byte:
+position i contributes color * 3**i with gray=0, yellow=1, green=2, so all
+243 patterns fit in a uint8. The full N x N matrix (about 33 MB for the
+5.7k-word list) is built once, written to a file under CACHE_DIR and then
+memory-mapped read-only, so every web and worker process on a host shares
+the same physical pages.
+
+Build ahead of time (start.sh does this before starting services):
+    python feedback_matrix.py build
+
+Otherwise a web process builds it on first use on a background OS thread
+(get_matrix(wait=False)) and evaluates guesses directly until it is ready,
+since the build is seconds of CPU that would stall every player on the
+process's event loop. Processes on one host take a file lock around the
+build, so only one of them does the work and the rest map its file.
+"""
+import hashlib
+import mmap
+import os
+import sys
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: concurrent builders just race (harmlessly)
+    fcntl = None
+
+GRAY, YELLOW, GREEN = 0, 1, 2
+COLOR_NAMES = ("gray", "yellow", "green")
+WORD_LENGTH = 5
+NUM_PATTERNS = 3 ** WORD_LENGTH
+SOLVED_CODE = NUM_PATTERNS - 1  # all green
+
+CACHE_DIR = os.environ.get("WORDLE_CACHE_DIR") or os.path.join(os.path.dirname(__file__), "data")
+
+# Rows of guesses scored per vectorized step while building
+BUILD_CHUNK = 256
+
+_POWERS = (3 ** np.arange(WORD_LENGTH)).astype(np.uint8)
+
+
+def _decode(code: int) -> tuple:
+    colors = []
+    for _ in range(WORD_LENGTH):
+        colors.append(COLOR_NAMES[code % 3])
+        code //= 3
+    return tuple(colors)
+
+
+# code -> ("green", "gray", ...) for every possible pattern
+DECODE_TABLE = tuple(_decode(code) for code in range(NUM_PATTERNS))
+
+
+def decode(code: int) -> list:
+    """Turn a packed feedback code into a list of color names."""
+    return list(DECODE_TABLE[int(code)])
+
+
+def encode_words(words) -> np.ndarray:
+    """Encode words as an (N, 5) array of letter numbers 0-25."""
+    raw = np.frombuffer("".join(words).encode("ascii"), dtype=np.uint8)
+    return (raw.reshape(-1, WORD_LENGTH) - ord("A")).astype(np.uint8)
+
+
+def compute_codes(guesses: np.ndarray, secrets: np.ndarray) -> np.ndarray:
+    """
+    Score every guess against every secret.
+
+    Args:
+        guesses: (G, 5) encoded guesses
+        secrets: (S, 5) encoded secrets
+
+    Returns:
+        (G, S) uint8 array of packed feedback codes
+    """
+    g = guesses[:, None, :]
+    s = secrets[None, :, :]
+    green = g == s  # (G, S, 5)
+
+    # Letters of the secret not already matched by a green are available
+    # for yellows, consumed left to right like the two-pass evaluator
+    letters = np.arange(26, dtype=np.uint8)
+    counts = (secrets[:, :, None] == letters).sum(axis=1, dtype=np.int8)  # (S, 26)
+    available = np.repeat(counts[None, :, :], guesses.shape[0], axis=0)  # (G, S, 26)
+
+    rows = np.arange(guesses.shape[0])[:, None]
+    cols = np.arange(secrets.shape[0])[None, :]
+    for j in range(WORD_LENGTH):
+        available[rows, cols, secrets[:, j][None, :]] -= green[:, :, j].astype(np.int8)
+
+    colors = green.astype(np.uint8) * GREEN
+    for i in range(WORD_LENGTH):
+        letter = guesses[:, i][:, None]  # (G, 1)
+        has = available[rows, cols, letter] > 0
+        yellow = has & ~green[:, :, i]
+        colors[:, :, i] += yellow.astype(np.uint8) * YELLOW
+        available[rows, cols, letter] -= yellow.astype(np.int8)
+
+    return (colors * _POWERS).sum(axis=2, dtype=np.uint16).astype(np.uint8)
+
+
+class FeedbackMatrix:
+    """
+    Read-only guess x secret feedback table for a fixed word list.
+
+    Args:
+        words: Upper-case 5-letter words; order defines the word indices
+        codes: Flat buffer of N*N uint8 codes (mmap or bytes)
+    """
+
+    def __init__(self, words, codes):
+        self.words = list(words)
+        self.index = {w: i for i, w in enumerate(self.words)}
+        self.n = len(self.words)
+        self._buf = codes
+        self.codes = np.frombuffer(codes, dtype=np.uint8).reshape(self.n, self.n)
+
+    @staticmethod
+    def path_for(words, cache_dir: str = CACHE_DIR) -> str:
+        """Cache file name, keyed by a digest of the word list it was built from."""
+        digest = hashlib.sha1("\n".join(words).encode("ascii")).hexdigest()[:16]
+        return os.path.join(cache_dir, f"feedback_matrix-{digest}.u8")
+
+    @classmethod
+    def build(cls, words) -> bytes:
+        """Compute the full matrix in memory."""
+        encoded = encode_words(words)
+        out = np.empty((len(words), len(words)), dtype=np.uint8)
+        for start in range(0, len(words), BUILD_CHUNK):
+            stop = start + BUILD_CHUNK
+            out[start:stop] = compute_codes(encoded[start:stop], encoded)
+        return out.tobytes()
+
+    @classmethod
+    def load(cls, words, cache_dir: str = CACHE_DIR) -> "FeedbackMatrix | None":
+        """Memory-map the cached matrix for this word list, or None if it isn't built."""
+        words = list(words)
+        path = cls.path_for(words, cache_dir)
+        if not (os.path.exists(path) and os.path.getsize(path) == len(words) * len(words)):
+            return None
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(words, mm)
+
+    @classmethod
+    def load_or_build(cls, words, cache_dir: str = CACHE_DIR) -> "FeedbackMatrix":
+        """
+        Memory-map the cached matrix for this word list, building it first
+        if needed. If the cache directory isn't writable the matrix is kept
+        in process memory instead.
+        """
+        words = list(words)
+        matrix = cls.load(words, cache_dir)
+        if matrix is not None:
+            return matrix
+
+        path = cls.path_for(words, cache_dir)
+        lock = None
+        try:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                lock = open(f"{path}.lock", "a")
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+            except OSError:
+                pass  # build unlocked; the cache write below will fail too
+            # Another process may have built it while we waited
+            matrix = cls.load(words, cache_dir)
+            if matrix is not None:
+                return matrix
+
+            data = cls.build(words)
+            try:
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)  # atomic, so readers never see a partial file
+            except OSError as e:
+                print(f"Could not cache feedback matrix at {path}: {e}")
+                return cls(words, data)
+            return cls.load(words, cache_dir)
+        finally:
+            if lock is not None:
+                lock.close()  # releases the flock
+
+    def code(self, guess: str, secret: str) -> int | None:
+        """Packed feedback for one pair, or None if either word is unknown."""
+        gi = self.index.get(guess)
+        si = self.index.get(secret)
+        if gi is None or si is None:
+            return None
+        return self._buf[gi * self.n + si]
+
+    def colors(self, guess: str, secret: str) -> list | None:
+        """Color names for one pair, or None if either word is unknown."""
+        code = self.code(guess, secret)
+        return None if code is None else list(DECODE_TABLE[code])
+
+    def indices(self, words) -> np.ndarray:
+        """Map words to their indices (KeyError for unknown words)."""
+        return np.fromiter((self.index[w] for w in words), dtype=np.int64)
+
+    def score_many(self, guess: str, secrets) -> np.ndarray:
+        """
+        Score one guess against many secrets in a single vectorized lookup.
+
+        Args:
+            guess: Upper-case guess word
+            secrets: Words, or an integer array of word indices
+
+        Returns:
+            uint8 array of packed codes, one per secret (see decode())
+        """
+        row = self.codes[self.index[guess]]
+        if isinstance(secrets, np.ndarray) and secrets.dtype.kind in "iu":
+            return row[secrets]
+        return row[self.indices(secrets)]
+
+
+_matrix = None
+_matrix_lock = threading.Lock()
+_builder = None  # background build thread, once started
+
+
+def _native_thread(**kwargs):
+    """A real OS thread even under eventlet, so CPU work doesn't hold the hub."""
+    try:
+        from eventlet import patcher
+        return patcher.original("threading").Thread(**kwargs)
+    except ImportError:
+        return threading.Thread(**kwargs)
+
+
+def _build_in_background(words):
+    global _matrix
+    try:
+        _matrix = FeedbackMatrix.load_or_build(words)
+        print("Feedback matrix built")
+    except Exception as e:
+        print(f"Feedback matrix build failed, staying on direct evaluation: {e}")
+
+
+def get_matrix(words, wait: bool = True) -> FeedbackMatrix | None:
+    """
+    Process-wide FeedbackMatrix for the given (sorted) word list.
+
+    A matrix already on disk is mapped straight away. Otherwise wait=True
+    builds it here, and wait=False starts the build on a background OS
+    thread and returns None until it is ready.
+    """
+    global _matrix, _builder
+    if _matrix is not None or (_builder is not None and not wait):
+        return _matrix
+    with _matrix_lock:
+        if _matrix is None:
+            _matrix = FeedbackMatrix.load(words)
+        if _matrix is None and wait:
+            _matrix = FeedbackMatrix.load_or_build(words)
+        elif _matrix is None and _builder is None:
+            print("Feedback matrix not built yet; building in the background")
+            _builder = _native_thread(target=_build_in_background, args=(list(words),),
+                                      name="feedback-matrix-build", daemon=True)
+            _builder.start()
+    return _matrix
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["build"]:
+        print("usage: python feedback_matrix.py build")
+        sys.exit(2)
+
+    import time
+    from word_dictionary import get_dictionary
+
+    t0 = time.perf_counter()
+    matrix = get_matrix(list(get_dictionary()))
+    print(f"Feedback matrix ready: {matrix.n} words, "
+          f"{matrix.n * matrix.n / 1e6:.1f} MB, {time.perf_counter() - t0:.1f}s")
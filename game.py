@@ -1,56 +1,214 @@
+import json
+import os
 import time
 import uuid
+from redis_scripts import cached_script
 from wordle_logic import random_word
 
 # TTL for Redis keys to prevent memory leaks
 GAME_TTL = 60 * 60  # 1 hour
-DEFAULT_DURATION = 300  # 5 minutes
+DEFAULT_DURATION = int(os.environ.get("GAME_DURATION", "300"))  # seconds; 5 minutes
+
+# Store active match assignment per user (avoids missing match_found when page reloads)
+ACTIVE_MATCH_TTL = 60 * 60  # 1 hour
+
+# Deployment-wide notices go to EVENT_CHANNEL; events for one user or one
+# room go to that user's or room's own channel, so each web process only
+# receives events for the sockets it hosts (see event_router)
+EVENT_CHANNEL = "events"
+START_GAME_STREAM = "stream:start_game"
+START_GAME_STREAM_MAXLEN = 10000
+
+# Sorted set of running rooms scored by their expected end time (epoch seconds).
+# game_worker scans it to find and re-adopt rooms whose worker went away.
+DEADLINE_INDEX_KEY = "games:deadlines"
+
+# Key layout
+# ----------
+# A room lives in one hash, game:{<room>}, holding the meta fields below,
+# each player's current secret word (word:<player id>) and the ended flag.
+# The braces are a Redis Cluster hash tag, so the room hash and its lease
+# key always land on the same slot and can be touched by one command or
+# script. Each user's match assignment is a single "<room>|<is_p1>" string.
+#
+# Only the single-room commands and scripts (resolve_guess, mark_ended, the
+# lease) are Cluster-safe. create_match / queue_create_match run one
+# MULTI/EXEC over the room hash, both user:<id> keys, DEADLINE_INDEX_KEY and
+# START_GAME_STREAM, which live in different slots, so a Cluster rejects it
+# (CROSSSLOT); match creation needs restructuring before this can run on
+# one.
+META_FIELDS = ("p1", "p2", "score_p1", "score_p2", "duration", "started_at", "ends_at")
+
+
+def room_key(room: str) -> str:
+    return f"game:{{{room}}}"
+
+
+def lease_key(room: str) -> str:
+    return f"game:{{{room}}}:lease"
+
+
+def word_field(player_id) -> str:
+    return f"word:{player_id}"
+
+
+def active_match_key(user_id) -> str:
+    return f"user:{user_id}:active_match"
 
-def create_game(r, p1_id, p2_id, duration=DEFAULT_DURATION) -> str:
-    """Initialize a new game in Redis with two players."""
-    room = str(uuid.uuid4())
 
-    gkey = f"game:{room}:meta"
-    timer_key = f"game:{room}:timer"
+# Check a guess, score it and rotate in the next word in one atomic call,
+# announcing the new word on the room's state channel (see room_cache).
+# KEYS: room hash
+# ARGV: player id, guess, next word, room state channel
+# Returns nil if the game/word is gone or the game has ended,
+# else {secret, solved, score_p1, score_p2}
+RESOLVE_GUESS_LUA = """
+local state = redis.call('HMGET', KEYS[1], 'word:' .. ARGV[1], 'p1', 'ended')
+local secret = state[1]
+if not secret or state[3] then
+    return false
+end
+if secret ~= ARGV[2] then
+    return {secret, 0}
+end
+local field = 'score_p2'
+if state[2] == ARGV[1] then
+    field = 'score_p1'
+end
+redis.call('HINCRBY', KEYS[1], field, 1)
+redis.call('HSET', KEYS[1], 'word:' .. ARGV[1], ARGV[3])
+redis.call('PUBLISH', ARGV[4], 'word')
+local scores = redis.call('HMGET', KEYS[1], 'score_p1', 'score_p2')
+return {secret, 1, scores[1] or '0', scores[2] or '0'}
+"""
 
-    # Store meta and timer
-    r.hset(gkey, mapping={
+# Set the ended flag on a room that still exists. Returns 1 if this call
+# ended the game, 0 if it had already ended, -1 if the room is gone.
+# KEYS: room hash   ARGV: room state channel
+MARK_ENDED_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local ended = redis.call('HSETNX', KEYS[1], 'ended', '1')
+if ended == 1 then
+    redis.call('PUBLISH', ARGV[1], 'ended')
+end
+return ended
+"""
+
+
+def _queue_game_state(pipe, room: str, p1_id, p2_id, duration: int):
+    """Queue the Redis writes that make up a new game's state on pipe."""
+    started_at = time.time()
+    ends_at = started_at + int(duration)
+
+    gkey = room_key(room)
+
+    # Store meta and initial secret words; ends_at (epoch ms) is the
+    # authoritative game clock
+    pipe.hset(gkey, mapping={
         "p1": str(p1_id),
         "p2": str(p2_id),
         "score_p1": 0,
         "score_p2": 0,
         "duration": int(duration),
-        "started_at": int(time.time()),
+        "started_at": int(started_at),
+        "ends_at": int(ends_at * 1000),
+        word_field(p1_id): random_word(),
+        word_field(p2_id): random_word(),
     })
-    r.set(timer_key, int(duration))
+    pipe.expire(gkey, GAME_TTL)
+    pipe.zadd(DEADLINE_INDEX_KEY, {room: ends_at})
+
+
+def create_game(r, p1_id, p2_id, duration=DEFAULT_DURATION) -> str:
+    """Initialize a new game in Redis with two players."""
+    room = str(uuid.uuid4())
+    pipe = r.pipeline(transaction=True)
+    _queue_game_state(pipe, room, p1_id, p2_id, duration)
+    pipe.execute()
+    return room
+
+
+def user_channel(user_id) -> str:
+    """Pub/sub channel for events addressed to one user."""
+    return f"{EVENT_CHANNEL}:user:{user_id}"
+
+
+def room_channel(room: str) -> str:
+    """Pub/sub channel for events addressed to one game room."""
+    return f"{EVENT_CHANNEL}:room:{room}"
 
-    # Assign initial secret words per player
-    set_player_word(r, room, p1_id, random_word())
-    set_player_word(r, room, p2_id, random_word())
 
-    # TTLs
-    r.expire(gkey, GAME_TTL)
-    r.expire(timer_key, GAME_TTL)
-    r.expire(f"game:{room}:player:{p1_id}:word", GAME_TTL)
-    r.expire(f"game:{room}:player:{p2_id}:word", GAME_TTL)
+def room_state_channel(room: str) -> str:
+    """
+    Pub/sub channel announcing changes to a room's cached state (a new
+    word, the game ending, the room being deleted); see room_cache.
+    """
+    return f"{EVENT_CHANNEL}:room_state:{room}"
 
+
+def queue_create_match(pipe, p1_id, p2_id, duration=DEFAULT_DURATION) -> str:
+    """
+    Queue every write for a new match on pipe and return its room id.
+
+    Covers the game state, both players' active match assignments, the
+    match_found event and the start_game stream entry, so callers can
+    batch several matches into one pipeline.
+    """
+    room = str(uuid.uuid4())
+    _queue_game_state(pipe, room, p1_id, p2_id, duration)
+
+    # Persist match assignment for each user so the web UI can recover
+    # even if the SocketIO event is missed (navigation / refresh).
+    pipe.setex(active_match_key(p1_id), ACTIVE_MATCH_TTL, f"{room}|1")
+    pipe.setex(active_match_key(p2_id), ACTIVE_MATCH_TTL, f"{room}|0")
+
+    players = [str(p1_id), str(p2_id)]
+
+    # Notify each player's web process via pubsub that match was found
+    for uid, is_p1 in ((p1_id, True), (p2_id, False)):
+        pipe.publish(user_channel(uid), json.dumps({
+            "type": "match_found",
+            "room": room,
+            "user_id": str(uid),
+            "is_p1": is_p1,
+        }))
+
+    # Signal game_worker to start timer for this room. The stream keeps
+    # the message until a worker acks it, so restarts don't lose games.
+    pipe.xadd(
+        START_GAME_STREAM,
+        {"room": room, "players": json.dumps(players)},
+        maxlen=START_GAME_STREAM_MAXLEN,
+        approximate=True,
+    )
     return room
 
 
-def get_player_word(r, room: str, player_id) -> str | None:
-    key = f"game:{room}:player:{player_id}:word"
-    word = r.get(key)
-    return word
+def create_match(r, p1_id, p2_id, duration=DEFAULT_DURATION) -> str:
+    """Create a match and announce it in one MULTI/EXEC round trip."""
+    pipe = r.pipeline(transaction=True)
+    room = queue_create_match(pipe, p1_id, p2_id, duration)
+    pipe.execute()
+    return room
+
 
+def get_active_match(r, user_id) -> tuple | None:
+    """Return (room, is_p1) for the user's current match, or None."""
+    value = r.get(active_match_key(user_id))
+    if not value:
+        return None
+    room, _, is_p1 = value.rpartition("|")
+    return room, is_p1 == "1"
 
-def set_player_word(r, room: str, player_id, word: str):
-    key = f"game:{room}:player:{player_id}:word"
-    r.set(key, word)
-    r.expire(key, GAME_TTL)
+
+def clear_active_match(r, user_id):
+    r.delete(active_match_key(user_id))
 
 
 def increment_score(r, room: str, player_id):
-    gkey = f"game:{room}:meta"
+    gkey = room_key(room)
     p1 = r.hget(gkey, "p1")
     p1_str = p1.decode() if isinstance(p1, bytes) else str(p1)
     player_str = str(player_id)
@@ -61,33 +219,93 @@ def increment_score(r, room: str, player_id):
         r.hincrby(gkey, "score_p2", 1)
 
 
+def resolve_guess(r, room: str, player_id, guess: str, next_word: str) -> dict | None:
+    """
+    Resolve a guess in a single round trip.
+
+    Compares the guess with the player's secret word and, if it matches,
+    increments that player's score and stores next_word, all atomically so
+    racing guesses can't lose updates.
+
+    Returns None if the game or word no longer exists or the game has
+    already ended, otherwise a dict with
+    the secret that was guessed against, whether it was solved, and (when
+    solved) the updated scores.
+    """
+    result = cached_script(r, RESOLVE_GUESS_LUA)(
+        keys=[room_key(room)],
+        args=[str(player_id), guess, next_word, room_state_channel(room)],
+        client=r,
+    )
+    if not result:
+        return None
+
+    secret = result[0].decode() if isinstance(result[0], bytes) else result[0]
+    solved = bool(int(result[1]))
+    scores = None
+    if solved:
+        scores = {"p1": int(result[2]), "p2": int(result[3])}
+    return {"secret": secret, "solved": solved, "scores": scores}
+
+
 def get_scores(r, room: str) -> dict:
-    gkey = f"game:{room}:meta"
-    score_p1 = r.hget(gkey, "score_p1")
-    score_p2 = r.hget(gkey, "score_p2")
+    score_p1, score_p2 = r.hmget(room_key(room), "score_p1", "score_p2")
     return {"p1": int(score_p1 or 0), "p2": int(score_p2 or 0)}
 
 
+def get_ends_at(r, room: str) -> float | None:
+    """Return the room's deadline as epoch seconds, or None if unknown."""
+    ends_at, started_at, duration = r.hmget(room_key(room), "ends_at", "started_at", "duration")
+    if ends_at:
+        return int(ends_at) / 1000.0
+    if started_at:
+        return int(started_at) + int(duration or DEFAULT_DURATION)
+    return None
+
+
 def get_game_meta(r, room: str) -> dict:
-    gkey = f"game:{room}:meta"
-    return r.hgetall(gkey)
-
-
-def end_game_cleanup(r, room: str):
-    """Remove Redis keys for this room and clear active match assignments."""
-    meta = get_game_meta(r, room) or {}
-    p1 = meta.get("p1")
-    p2 = meta.get("p2")
-
-    # Delete game keys
-    r.delete(f"game:{room}:meta")
-    r.delete(f"game:{room}:timer")
-
-    if p1:
-        r.delete(f"game:{room}:player:{p1}:word")
-        r.delete(f"user:{p1}:active_room")
-        r.delete(f"user:{p1}:active_is_p1")
-    if p2:
-        r.delete(f"game:{room}:player:{p2}:word")
-        r.delete(f"user:{p2}:active_room")
-        r.delete(f"user:{p2}:active_is_p1")
+    """Return the room's meta fields (never the secret words); {} if gone."""
+    values = r.hmget(room_key(room), *META_FIELDS)
+    if values[0] is None:
+        return {}
+    return {k: v for k, v in zip(META_FIELDS, values) if v is not None}
+
+
+def game_exists(r, room: str) -> bool:
+    return bool(r.exists(room_key(room)))
+
+
+def mark_ended(r, room: str) -> bool:
+    """
+    Idempotency guard so two surrenders / timer don't double-save.
+
+    Returns True only for the single caller that ended a still-running game.
+    """
+    return cached_script(r, MARK_ENDED_LUA)(
+        keys=[room_key(room)], args=[room_state_channel(room)], client=r
+    ) == 1
+
+
+def clear_ended(r, room: str):
+    """Undo mark_ended so a failed save can be retried."""
+    r.hdel(room_key(room), "ended")
+
+
+def end_game_cleanup(r, room: str, players=None):
+    """
+    Remove this room's state and clear both players' active match assignments.
+
+    The room hash and lease share a hash slot and go in one DEL; the user
+    assignments and index entry ride along in the same round trip.
+    """
+    if players is None:
+        players = r.hmget(room_key(room), "p1", "p2")
+
+    pipe = r.pipeline(transaction=False)
+    pipe.delete(room_key(room), lease_key(room))
+    pipe.publish(room_state_channel(room), "deleted")
+    for uid in players:
+        if uid:
+            pipe.delete(active_match_key(uid))
+    pipe.zrem(DEADLINE_INDEX_KEY, room)
+    pipe.execute()
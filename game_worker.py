@@ -5,11 +5,16 @@ Game timer and match persistence worker.
 Manages game timers and persists match results to database.
 
 Responsibilities:
-- Run countdown timers for active games
-- Publish timer updates via Redis pubsub
+- Track each room's deadline (one scheduler thread for all rooms)
+- Publish low-frequency timer resyncs via Redis pubsub
 - Calculate winners when time expires
-- Save match records to PostgreSQL
-- Update player statistics
+- Save match records to PostgreSQL and update player statistics, in
+  batches, from the match results stream (see match_results)
+
+Game starts arrive on a Redis Stream read through a consumer group, and
+each room is owned by whichever worker holds its lease key, so any number
+of game_worker processes can run side by side. A restarted worker
+re-adopts orphaned rooms by scanning the deadline index.
 
 Run as a separate process:
     python game_worker.py
@@ -17,7 +22,10 @@ Run as a separate process:
 import os
 import time
 import json
+import heapq
+import socket
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -25,15 +33,40 @@ load_dotenv()
 import redis
 from flask import Flask
 from db import db
-from models import Match, User
+import models  # noqa: F401  (registers the tables for create_all)
 import game as game_module
+import match_results
+import metrics
 
 REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///local.db")
-EVENT_CHANNEL = "events"
-START_GAME_CHANNEL = "start_game"
+START_GAME_STREAM = game_module.START_GAME_STREAM
+START_GAME_GROUP = "game_workers"
+
+# Unique consumer / lease owner name for this process
+WORKER_ID = os.environ.get("GAME_WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+# A room belongs to the worker holding its lease key (game:{<room>}:lease). Leases are renewed
+# well inside their TTL; if a worker dies, the lease lapses and another
+# worker adopts the room on its next recovery scan.
+LEASE_TTL_MS = int(os.environ.get("GAME_LEASE_TTL_MS", "15000"))
+LEASE_RENEW_INTERVAL = LEASE_TTL_MS / 3000.0  # seconds
+RECOVERY_INTERVAL = float(os.environ.get("GAME_RECOVERY_INTERVAL", "10"))
+RECOVERY_BATCH = 500
+
+# Stream messages left pending this long by a dead consumer get reclaimed
+CLAIM_IDLE_MS = 30000
+
+# Clients count down locally from ends_at; the worker only rebroadcasts the
+# deadline this often so they can correct drift
+TIMER_RESYNC_INTERVAL = float(os.environ.get("TIMER_RESYNC_INTERVAL", "30"))
+
+# Threads available for game-over persistence so slow DB writes never stall
+# the timer scheduler
+EXPIRY_WORKERS = int(os.environ.get("GAME_WORKER_EXPIRY_THREADS", "4"))
 
-GAME_TTL = 60 * 60  # 1 hour
+# Scrape listener for this worker (METRICS_PORT overrides, 0 disables)
+METRICS_PORT = 9101
 
 # Redis connection
 r = redis.from_url(REDIS_URL, decode_responses=True)
@@ -53,63 +86,215 @@ def make_app_for_db():
 
 app = make_app_for_db()
 
-def run_timer_for_room(room: str):
+# Extend a lease only if this worker still owns it
+_renew_lease = r.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+""")
+
+
+def acquire_lease(room: str) -> bool:
+    """Try to take ownership of a room. Returns True if this worker owns it."""
+    key = game_module.lease_key(room)
+    if r.set(key, WORKER_ID, nx=True, px=LEASE_TTL_MS):
+        return True
+    return r.get(key) == WORKER_ID
+
+
+def renew_leases(rooms) -> list:
+    """Renew leases for the given rooms in one round trip; returns rooms lost."""
+    rooms = list(rooms)
+    if not rooms:
+        return []
+    pipe = r.pipeline(transaction=False)
+    for room in rooms:
+        _renew_lease(keys=[game_module.lease_key(room)], args=[WORKER_ID, LEASE_TTL_MS], client=pipe)
+    results = pipe.execute()
+    return [room for room, ok in zip(rooms, results) if not ok]
+
+
+class RoomScheduler:
     """
-    Run countdown timer for a specific game room.
+    Drive the clock for every active room from a single thread.
 
-    Publishes timer updates every second.
-    When timer expires, triggers game_over handling.
+    Each room's authoritative end time is the ``ends_at`` field in its meta
+    hash; clients count down locally from it. Rooms sit in a min-heap keyed
+    by their next wake-up, which is either a low-frequency resync broadcast
+    or the deadline itself, whichever comes first. Each pass pops every
+    room that is due and does the Redis work for all of them in pipelines.
 
     Args:
-        room: Game room identifier
+        redis_client: Redis connection used for timers and pubsub
+        on_expire: Called with the room id once its deadline passes
+        resync_interval: Seconds between timer_update resync broadcasts
     """
-    timer_key = f"game:{room}:time_left"
-    end_key = f"game:{room}:ended"
-    meta_key = f"game:{room}:meta"
 
-    # Ensure timer exists (try to match the game duration if available)
-    if not r.exists(timer_key):
-        meta = r.hgetall(meta_key)
-        duration = int(meta.get("duration", 300)) if meta else 300
-        r.set(timer_key, duration)
-        r.expire(timer_key, GAME_TTL)
+    def __init__(self, redis_client, on_expire=None, resync_interval=None):
+        self.r = redis_client
+        self.on_expire = on_expire or handle_game_over
+        self.resync_interval = resync_interval or TIMER_RESYNC_INTERVAL
+        self._heap = []
+        self._owned = {}
+        self._cond = threading.Condition()
+        self._expiry_pool = ThreadPoolExecutor(
+            max_workers=EXPIRY_WORKERS, thread_name_prefix="game-over"
+        )
 
-    print(f"Timer started for room {room}")
+    def __len__(self):
+        with self._cond:
+            return len(self._owned)
 
-    while True:
-        try:
-            # If game already ended (e.g., surrender), stop the timer thread
-            if r.exists(end_key) or not r.exists(meta_key):
-                break
-
-            # Atomic decrement
-            time_left = r.decr(timer_key)
-
-            if time_left < 0:
-                break
-
-            # Publish timer update every second
-            r.publish(
-                EVENT_CHANNEL,
-                json.dumps(
-                    {"type": "timer_update", "room": room, "time_left": int(time_left)}
-                ),
-            )
+    def pending_wakeups(self) -> int:
+        """Heap entries, including stale ones not yet discarded."""
+        with self._cond:
+            return len(self._heap)
+
+    def owns(self, room: str) -> bool:
+        with self._cond:
+            return room in self._owned
+
+    def owned_rooms(self) -> list:
+        with self._cond:
+            return list(self._owned)
+
+    def drop_room(self, room: str):
+        """Stop tracking a room (its heap entry is discarded lazily)."""
+        with self._cond:
+            self._owned.pop(room, None)
+
+    def add_room(self, room: str):
+        """Load the room's deadline and schedule its first wake-up."""
+        if self.owns(room):
+            return
+
+        ends_at = game_module.get_ends_at(self.r, room)
+        if ends_at is None:
+            print(f"No deadline found for room {room}")
+            return
 
-            # Check if time expired
-            if int(time_left) <= 0:
+        self._schedule(room, ends_at)
+        print(f"Timer started for room {room} (ends in {ends_at - time.time():.0f}s)")
+
+    def run(self):
+        """Scheduler loop: sleep until the earliest wake-up, then service it."""
+        while True:
+            due = self._pop_due()
+            try:
+                self._service_rooms(due)
+            except redis.RedisError as e:
+                print(f"Redis error in timer scheduler: {e}")
+                self._retry(due)
+                time.sleep(1)
+            except Exception as e:
+                print(f"Error in timer scheduler: {e}")
+                self._retry(due)
+
+    def _retry(self, due):
+        """
+        Reschedule due rooms still owned after a failed service; their heap
+        entries are already popped, and recovery skips owned rooms, so
+        nothing else would ever wake them again.
+        """
+        for _, room in due:
+            with self._cond:
+                ends_at = self._owned.get(room)
+            if ends_at is not None:
+                self._push(room, min(ends_at, time.time() + 1))
+
+    def start(self) -> threading.Thread:
+        t = threading.Thread(target=self.run, name="room-scheduler", daemon=True)
+        t.start()
+        return t
+
+    def _schedule(self, room: str, ends_at: float):
+        with self._cond:
+            self._owned[room] = ends_at
+        self._push(room, min(ends_at, time.time() + self.resync_interval))
+
+    def _push(self, room: str, wake_at: float):
+        with self._cond:
+            heapq.heappush(self._heap, (wake_at, room))
+            self._cond.notify()
+
+    def _pop_due(self):
+        """Block until at least one room is due and return all due entries."""
+        with self._cond:
+            while True:
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    break
+                timeout = (self._heap[0][0] - now) if self._heap else None
+                self._cond.wait(timeout)
+
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if entry[1] in self._owned:
+                    due.append(entry)
+            return due
+
+    def _service_rooms(self, due):
+        """Expire rooms past their deadline and resync the rest, pipelined."""
+        if not due:
+            return
+
+        # If game already ended (e.g., surrender) or is gone, drop the room
+        pipe = self.r.pipeline(transaction=False)
+        for _, room in due:
+            pipe.hmget(game_module.room_key(room), "p1", "ended")
+        states = pipe.execute()
+
+        now = time.time()
+        pipe = self.r.pipeline(transaction=False)
+        wakeups = []
+        for (wake_at, room), (p1, ended) in zip(due, states):
+            with self._cond:
+                ends_at = self._owned.get(room)
+            if ends_at is None or ended or not p1:
+                self.drop_room(room)
+                continue
+
+            if now >= ends_at:
                 print(f"Time's up for room {room}")
-                handle_game_over(room)
-                break
+                metrics.TIMER_DRIFT.labels("expire").observe(now - ends_at)
+                self.drop_room(room)
+                metrics.GAME_OVER_IN_FLIGHT.inc()
+                self._expiry_pool.submit(self._expire, room)
+                continue
 
-            time.sleep(1)
+            metrics.TIMER_DRIFT.labels("resync").observe(max(0.0, now - wake_at))
+
+            # Low-frequency resync so clients can correct local drift
+            pipe.publish(
+                game_module.room_channel(room),
+                json.dumps(timer_sync_payload(room, ends_at, now)),
+            )
+            wakeups.append((room, min(ends_at, now + self.resync_interval)))
+        pipe.execute()
+        # Only once the resyncs went out, so a failure leaves one entry per room
+        for room, wake_at in wakeups:
+            self._push(room, wake_at)
+
+    def _expire(self, room: str):
+        try:
+            self.on_expire(room)
+        finally:
+            metrics.GAME_OVER_IN_FLIGHT.dec()
+
+
+def timer_sync_payload(room: str, ends_at: float, now: float | None = None) -> dict:
+    """Build a timer_update event carrying the authoritative deadline."""
+    now = time.time() if now is None else now
+    return {
+        "type": "timer_update",
+        "room": room,
+        "ends_at": int(ends_at * 1000),
+        "server_now": int(now * 1000),
+        "time_left": max(0, int(round(ends_at - now))),
+    }
 
-        except redis.RedisError as e:
-            print(f"Redis error in timer for {room}: {e}")
-            break
-        except Exception as e:
-            print(f"Error in timer for {room}: {e}")
-            break
 
 def handle_game_over(room: str):
     """
@@ -117,8 +302,8 @@ def handle_game_over(room: str):
 
     - Fetch final scores from Redis
     - Determine winner
-    - Persist match to database
-    - Update player statistics
+    - Queue the result for the match writer (which persists it, updates
+      player statistics and announces match_result_saved)
     - Notify clients via pubsub
     - Clean up Redis keys
 
@@ -127,11 +312,8 @@ def handle_game_over(room: str):
     """
     print(f"Processing game over for room {room}")
 
-    end_key = f"game:{room}:ended"
-    meta_key = f"game:{room}:meta"
-
     # Idempotency guard (prevents double-save if surrender already ended it)
-    if not r.set(end_key, "1", nx=True, ex=3600):
+    if not game_module.mark_ended(r, room):
         return
 
     try:
@@ -140,7 +322,7 @@ def handle_game_over(room: str):
         score_p1 = scores.get("p1", 0)
         score_p2 = scores.get("p2", 0)
 
-        game_meta = r.hgetall(meta_key)
+        game_meta = game_module.get_game_meta(r, room)
 
         if not game_meta:
             print(f"No game metadata found for room {room}")
@@ -165,59 +347,18 @@ def handle_game_over(room: str):
         else:
             print(f"Tie game! ({score_p1} - {score_p2})")
 
-        # Persist to database
-        with app.app_context():
-            try:
-                match = Match(
-                    room=room,
-                    p1_id=int(p1),
-                    p2_id=int(p2),
-                    score_p1=int(score_p1),
-                    score_p2=int(score_p2),
-                    winner_id=winner_id,
-                    duration=duration,
-                )
-                db.session.add(match)
-
-                user1 = User.query.get(int(p1))
-                user2 = User.query.get(int(p2))
-
-                if user1:
-                    user1.total_games = (user1.total_games or 0) + 1
-                    if winner_id == user1.id:
-                        user1.total_wins = (user1.total_wins or 0) + 1
-
-                if user2:
-                    user2.total_games = (user2.total_games or 0) + 1
-                    if winner_id == user2.id:
-                        user2.total_wins = (user2.total_wins or 0) + 1
-
-                db.session.commit()
-                print(f"Match saved to database (ID: {match.id})")
-
-            except Exception as e:
-                db.session.rollback()
-                # allow retry if DB save failed
-                r.delete(end_key)
-                print(f"Database error saving match: {e}")
-                return
-
-        # Publish match result saved event
-        r.publish(
-            EVENT_CHANNEL,
-            json.dumps(
-                {
-                    "type": "match_result_saved",
-                    "room": room,
-                    "winner_id": winner_id,
-                    "scores": {"p1": score_p1, "p2": score_p2},
-                }
-            ),
-        )
+        # Durable hand-off to the match writer
+        try:
+            match_results.submit(r, room, p1, p2, score_p1, score_p2, winner_id, duration)
+        except redis.RedisError as e:
+            # allow retry if the result couldn't be queued
+            game_module.clear_ended(r, room)
+            print(f"Could not queue result for {room}: {e}")
+            return
 
         # Publish game_over event for clients
         r.publish(
-            EVENT_CHANNEL,
+            game_module.room_channel(room),
             json.dumps(
                 {
                     "type": "game_over",
@@ -229,53 +370,160 @@ def handle_game_over(room: str):
         )
 
         # Clean up Redis keys
-        game_module.end_game_cleanup(r, room)
+        game_module.end_game_cleanup(r, room, players=(p1, p2))
         print(f"Cleaned up Redis keys for room {room}")
 
     except Exception as e:
         print(f"Error handling game over for {room}: {e}")
 
+
+def ensure_consumer_group():
+    """Create the start-game consumer group (and stream) if missing."""
+    try:
+        r.xgroup_create(START_GAME_STREAM, START_GAME_GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def handle_start_message(scheduler: RoomScheduler, msg_id: str, fields: dict):
+    """Adopt the room named in a start_game message, then ack it."""
+    room = fields.get("room")
+    if room and acquire_lease(room):
+        print(f"Starting timer for room {room}")
+        scheduler.add_room(room)
+    # Rooms leased by another worker are already running there
+    r.xack(START_GAME_STREAM, START_GAME_GROUP, msg_id)
+
+
+def claim_stale_messages(scheduler: RoomScheduler):
+    """Take over start messages left unacked by a consumer that died."""
+    _, messages, _ = r.xautoclaim(
+        START_GAME_STREAM, START_GAME_GROUP, WORKER_ID,
+        min_idle_time=CLAIM_IDLE_MS, start_id="0-0", count=100,
+    )
+    for msg_id, fields in messages:
+        if fields is not None:
+            handle_start_message(scheduler, msg_id, fields)
+
+
+def recover_rooms(scheduler: RoomScheduler):
+    """
+    Scan the deadline index and adopt running rooms nobody holds a lease on.
+
+    Rooms whose metadata is gone (expired or cleaned up) are pruned from
+    the index along the way.
+    """
+    adopted = 0
+    start = 0
+    while True:
+        rooms = r.zrange(game_module.DEADLINE_INDEX_KEY, start, start + RECOVERY_BATCH - 1)
+        if not rooms:
+            break
+        start += len(rooms)
+
+        candidates = [room for room in rooms if not scheduler.owns(room)]
+        if not candidates:
+            continue
+
+        pipe = r.pipeline(transaction=False)
+        for room in candidates:
+            pipe.hmget(game_module.room_key(room), "p1", "ended")
+        states = pipe.execute()
+
+        stale = [room for room, (p1, _) in zip(candidates, states) if not p1]
+        live = [room for room, (p1, ended) in zip(candidates, states) if p1 and not ended]
+        if stale:
+            r.zrem(game_module.DEADLINE_INDEX_KEY, *stale)
+            start -= len(stale)
+
+        pipe = r.pipeline(transaction=False)
+        for room in live:
+            pipe.set(game_module.lease_key(room), WORKER_ID, nx=True, px=LEASE_TTL_MS)
+        for room, won in zip(live, pipe.execute()):
+            if won:
+                scheduler.add_room(room)
+                adopted += 1
+
+    if adopted:
+        print(f"Recovered {adopted} orphaned room(s)")
+
+
 def start_game_worker():
     """
     Main worker loop.
 
-    Subscribes to start_game channel and spawns timer threads
-    for each new game.
+    Reads start_game messages from the stream through the consumer group and
+    hands each new game to the shared room scheduler. Between reads it
+    renews room leases, reclaims messages from dead consumers and re-adopts
+    orphaned rooms.
     """
-    print("Game worker started")
-    print(f"Listening on channel: {START_GAME_CHANNEL}")
+    print(f"Game worker {WORKER_ID} started")
+    print(f"Consuming stream: {START_GAME_STREAM} (group {START_GAME_GROUP})")
 
-    pubsub = r.pubsub()
-    pubsub.subscribe(START_GAME_CHANNEL)
+    scheduler = RoomScheduler(r)
+    scheduler.start()
 
-    for msg in pubsub.listen():
-        if msg is None or msg.get("type") != "message":
-            continue
+    metrics.safe_gauge(metrics.ACTIVE_ROOMS, lambda: len(scheduler))
+    metrics.safe_gauge(metrics.SCHEDULED_WAKEUPS, scheduler.pending_wakeups)
+    metrics.safe_gauge(metrics.WORKER_THREADS, threading.active_count)
+    metrics.start_server(METRICS_PORT)
+    ensure_consumer_group()
 
-        try:
-            data = json.loads(msg["data"])
-            room = data.get("room")
-
-            if not room:
-                continue
+    writer = match_results.MatchResultWriter(r, app)
+    writer.start()
+    print(f"Match writer consuming {match_results.RESULTS_STREAM} (group {match_results.RESULTS_GROUP})")
 
-            print(f"Starting timer for room {room}")
+    last_renew = time.monotonic()
+    last_recovery = 0.0
+    block_ms = int(min(LEASE_RENEW_INTERVAL, RECOVERY_INTERVAL) * 1000)
 
-            timer_thread = threading.Thread(
-                target=run_timer_for_room, args=(room,), daemon=True
+    while True:
+        try:
+            now = time.monotonic()
+            if now - last_renew >= LEASE_RENEW_INTERVAL:
+                for room in renew_leases(scheduler.owned_rooms()):
+                    print(f"Lost lease for room {room}")
+                    scheduler.drop_room(room)
+                last_renew = now
+
+            if now - last_recovery >= RECOVERY_INTERVAL:
+                claim_stale_messages(scheduler)
+                recover_rooms(scheduler)
+                last_recovery = now
+
+            response = r.xreadgroup(
+                START_GAME_GROUP, WORKER_ID, {START_GAME_STREAM: ">"},
+                count=100, block=block_ms,
             )
-            timer_thread.start()
-
-        except json.JSONDecodeError:
-            print(f"Invalid JSON in start_game message: {msg.get('data')}")
+            for _, messages in response or []:
+                for msg_id, fields in messages:
+                    try:
+                        handle_start_message(scheduler, msg_id, fields)
+                    except redis.RedisError as e:
+                        # Left pending; reclaimed by claim_stale_messages
+                        print(f"Redis error starting room from {msg_id}: {e}")
+
+        except redis.ResponseError as e:
+            if "NOGROUP" in str(e):
+                ensure_consumer_group()
+            else:
+                print(f"Redis error in game worker: {e}")
+                time.sleep(1)
+        except redis.RedisError as e:
+            print(f"Redis error in game worker: {e}")
+            time.sleep(1)
         except Exception as e:
-            print(f"Error starting game timer: {e}")
+            print(f"Error in game worker loop: {e}")
+            time.sleep(1)
+
 
 if __name__ == "__main__":
     print("=" * 60)
     print("WORDLE BATTLE - GAME WORKER")
     print("=" * 60)
 
+    # Schema changes are applied by migrate.py (release phase / start.sh)
     with app.app_context():
         db.create_all()
         print("Database tables verified")
@@ -0,0 +1,304 @@
+# leaderboard.py
+"""
+Leaderboards kept in Redis sorted sets.
+
+Each board is a sorted set of user ids scored by wins plus a hash of games
+played, for three windows:
+
+    leaderboard:{global}:wins / :games
+    leaderboard:{daily:20260101}:wins / :games      (UTC day)
+    leaderboard:{weekly:2026W01}:wins / :games      (ISO week, UTC)
+
+Daily and weekly keys expire WINDOW_GRACE after their window closes. Every
+player who finished a match is on the board (losers are added with a
+ZINCRBY of 0), matching the old "total_games >= 1" filter. Usernames are
+kept in one hash so a page of results needs no database access. Keys are
+hash-tagged so a board's temporary rebuild copy lands in the same cluster
+slot and can be RENAMEd over it.
+
+Boards are updated incrementally when a match is saved (record_match).
+Rebuild them from the matches table with:
+    python leaderboard.py rebuild [--if-missing] [--force]
+Only rebuild with the match writers (game workers) stopped: increments
+they make while the rebuild copies are filled are lost when the copies
+are renamed over the live boards. start.sh's --if-missing run happens
+before any worker starts; the command refuses to run while a writer has
+read the results stream in the last WRITER_IDLE_MS unless given --force.
+"""
+import sys
+from datetime import datetime, timedelta
+
+import redis
+
+WINDOWS = ("global", "daily", "weekly")
+NAMES_KEY = "leaderboard:{names}"
+
+WINDOW_GRACE = 86400  # seconds a closed daily/weekly board stays readable
+REBUILD_BATCH = 1000  # matches read per database round trip when rebuilding
+MAX_PAGE_SIZE = 100
+MAX_CACHED_PAGE = 20  # deeper pages are read straight from Redis, not response-cached
+WRITER_IDLE_MS = 30000  # a results-stream consumer seen this recently counts as running
+
+
+def window_id(window: str, when: datetime) -> str:
+    """Board id for the window containing when (a naive UTC datetime)."""
+    if window == "global":
+        return "global"
+    if window == "daily":
+        return f"daily:{when:%Y%m%d}"
+    if window == "weekly":
+        year, week, _ = when.isocalendar()
+        return f"weekly:{year}W{week:02d}"
+    raise ValueError(f"unknown leaderboard window {window!r}")
+
+
+def window_end(window: str, when: datetime) -> datetime | None:
+    """When the window containing when closes (None for global)."""
+    day = datetime(when.year, when.month, when.day)
+    if window == "daily":
+        return day + timedelta(days=1)
+    if window == "weekly":
+        return day + timedelta(days=7 - when.weekday())
+    return None
+
+
+def wins_key(board: str) -> str:
+    return f"leaderboard:{{{board}}}:wins"
+
+
+def games_key(board: str) -> str:
+    return f"leaderboard:{{{board}}}:games"
+
+
+def _board_ttl(window: str, when: datetime, now: datetime) -> int | None:
+    end = window_end(window, when)
+    if end is None:
+        return None
+    return max(1, int((end - now).total_seconds()) + WINDOW_GRACE)
+
+
+def queue_record_match(pipe, p1, p2, winner_id, names=None, when: datetime = None):
+    """
+    Queue the board updates for one finished match on a pipeline.
+
+    Args:
+        pipe: Redis pipeline
+        p1, p2: Player user ids
+        winner_id: Winning user id, or None for a tie
+        names: Optional {user_id: username} to refresh the names hash
+        when: Match time (naive UTC), default now
+    """
+    now = datetime.utcnow()
+    when = when or now
+    players = (str(p1), str(p2))
+    winner = None if winner_id is None else str(winner_id)
+
+    for window in WINDOWS:
+        board = window_id(window, when)
+        for uid in players:
+            pipe.zincrby(wins_key(board), 1 if uid == winner else 0, uid)
+            pipe.hincrby(games_key(board), uid, 1)
+        ttl = _board_ttl(window, when, now)
+        if ttl is not None:
+            pipe.expire(wins_key(board), ttl)
+            pipe.expire(games_key(board), ttl)
+
+    if names:
+        pipe.hset(NAMES_KEY, mapping={str(uid): name for uid, name in names.items()})
+
+
+def record_match(r, p1, p2, winner_id, names=None, when: datetime = None):
+    """Update every board for one finished match in a single round trip."""
+    pipe = r.pipeline(transaction=False)
+    queue_record_match(pipe, p1, p2, winner_id, names=names, when=when)
+    pipe.execute()
+
+
+def _entries(r, board: str, members, start_rank: int) -> list:
+    """Decorate [(uid, wins), ...] with rank, username, games and win rate."""
+    if not members:
+        return []
+    uids = [uid for uid, _ in members]
+    pipe = r.pipeline(transaction=False)
+    pipe.hmget(games_key(board), uids)
+    pipe.hmget(NAMES_KEY, uids)
+    games, names = pipe.execute()
+
+    entries = []
+    for i, ((uid, wins), played, name) in enumerate(zip(members, games, names)):
+        wins = int(wins)
+        played = int(played or 0)
+        entries.append({
+            "rank": start_rank + i + 1,
+            "user_id": int(uid),
+            "username": name,
+            "total_games": played,
+            "total_wins": wins,
+            "win_rate": round(wins / played * 100, 1) if played else 0.0,
+        })
+    return entries
+
+
+def page_bounds(page: int, per_page: int) -> tuple:
+    """(page, per_page) as top() serves them: page from 1, per_page 1..MAX_PAGE_SIZE."""
+    return max(1, page), max(1, min(per_page, MAX_PAGE_SIZE))
+
+
+def top(r, window: str = "global", page: int = 1, per_page: int = 10) -> list:
+    """One page of the board, best first."""
+    board = window_id(window, datetime.utcnow())
+    page, per_page = page_bounds(page, per_page)
+    start = (page - 1) * per_page
+    members = r.zrevrange(wins_key(board), start, start + per_page - 1, withscores=True)
+    return _entries(r, board, members, start)
+
+
+def rank_of(r, user_id, window: str = "global") -> dict | None:
+    """The user's 1-based rank and totals, or None if they aren't on the board."""
+    board = window_id(window, datetime.utcnow())
+    pipe = r.pipeline(transaction=False)
+    pipe.zrevrank(wins_key(board), str(user_id))
+    pipe.zscore(wins_key(board), str(user_id))
+    pipe.zcard(wins_key(board))
+    rank, wins, size = pipe.execute()
+    if rank is None:
+        return None
+    entry = _entries(r, board, [(str(user_id), wins)], rank)[0]
+    entry["players"] = int(size)
+    return entry
+
+
+def around(r, user_id, window: str = "global", radius: int = 5) -> list:
+    """Up to radius players either side of the user, including them."""
+    board = window_id(window, datetime.utcnow())
+    rank = r.zrevrank(wins_key(board), str(user_id))
+    if rank is None:
+        return []
+    radius = max(0, min(radius, MAX_PAGE_SIZE // 2))
+    start = max(0, rank - radius)
+    members = r.zrevrange(wins_key(board), start, rank + radius, withscores=True)
+    return _entries(r, board, members, start)
+
+
+def active_writers(r, idle_ms: int = WRITER_IDLE_MS) -> list:
+    """Match writers that have read the results stream within idle_ms."""
+    import match_results
+
+    try:
+        consumers = r.xinfo_consumers(match_results.RESULTS_STREAM, match_results.RESULTS_GROUP)
+    except redis.ResponseError:
+        return []  # no stream or group yet: nothing has ever written
+    return [c["name"] for c in consumers if c["idle"] < idle_ms]
+
+
+def rebuild(r, batch_size: int = REBUILD_BATCH):
+    """
+    Repopulate every board from the database.
+
+    Run it only while no match writer is running (see active_writers):
+    increments made to the live boards during a rebuild are lost when the
+    rebuilt copies replace them.
+
+    Matches are read in keyset-paginated batches (id > last id) so memory
+    stays flat however large the table is. Boards are built under temporary
+    keys and renamed over the live ones at the end, so readers never see a
+    half-built board. Daily and weekly boards whose window closed more than
+    WINDOW_GRACE ago are skipped. Needs an application context.
+    """
+    from models import Match, User
+
+    now = datetime.utcnow()
+    touched = {}  # board -> (window, a datetime inside it)
+    suffix = ":rebuild"
+
+    def tmp(key):
+        return key + suffix
+
+    last_id = 0
+    total = 0
+    while True:
+        rows = (Match.query
+                .with_entities(Match.id, Match.p1_id, Match.p2_id, Match.winner_id, Match.created_at)
+                .filter(Match.id > last_id)
+                .order_by(Match.id)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            break
+
+        pipe = r.pipeline(transaction=False)
+        for match_id, p1, p2, winner_id, created_at in rows:
+            for window in WINDOWS:
+                end = window_end(window, created_at)
+                if end is not None and (now - end).total_seconds() > WINDOW_GRACE:
+                    continue
+                board = window_id(window, created_at)
+                if board not in touched:
+                    touched[board] = (window, created_at)
+                    pipe.delete(tmp(wins_key(board)), tmp(games_key(board)))
+                for uid in (str(p1), str(p2)):
+                    pipe.zincrby(tmp(wins_key(board)), 1 if uid == str(winner_id) else 0, uid)
+                    pipe.hincrby(tmp(games_key(board)), uid, 1)
+        pipe.execute()
+
+        last_id = rows[-1][0]
+        total += len(rows)
+
+    # Usernames, also streamed by id
+    r.delete(tmp(NAMES_KEY))
+    last_id = 0
+    while True:
+        users = (User.query.with_entities(User.id, User.username)
+                 .filter(User.id > last_id)
+                 .order_by(User.id)
+                 .limit(batch_size)
+                 .all())
+        if not users:
+            break
+        r.hset(tmp(NAMES_KEY), mapping={str(uid): name for uid, name in users})
+        last_id = users[-1][0]
+
+    pipe = r.pipeline(transaction=False)
+    if r.exists(tmp(NAMES_KEY)):
+        pipe.rename(tmp(NAMES_KEY), NAMES_KEY)
+    if "global" not in touched:
+        pipe.delete(wins_key("global"), games_key("global"))
+    for board, (window, when) in touched.items():
+        for key in (wins_key(board), games_key(board)):
+            pipe.rename(tmp(key), key)
+            ttl = _board_ttl(window, when, now)
+            if ttl is not None:
+                pipe.expire(key, ttl)
+    pipe.execute()
+    return total
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    flags = set(args[1:])
+    if not args or args[0] != "rebuild" or not flags <= {"--if-missing", "--force"}:
+        print("usage: python leaderboard.py rebuild [--if-missing] [--force]")
+        sys.exit(2)
+
+    import os
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    r = redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+
+    if "--if-missing" in flags and r.exists(wins_key("global")):
+        print("Leaderboard already present, skipping rebuild")
+        sys.exit(0)
+
+    writers = active_writers(r)
+    if writers and "--force" not in flags:
+        print(f"Match writers are running ({', '.join(writers)}); their leaderboard updates "
+              f"during the rebuild would be lost. Stop the game workers first, or pass --force.")
+        sys.exit(1)
+
+    from migrate import make_app_for_db
+
+    app = make_app_for_db()
+    with app.app_context():
+        count = rebuild(r)
+    print(f"Leaderboards rebuilt from {count} matches")
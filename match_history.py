@@ -0,0 +1,110 @@
+# match_history.py
+"""
+Per-player match history with keyset pagination.
+
+Pages are ordered newest first by (created_at, id) and continue from an
+opaque cursor holding the last row's key, so fetching page 1000 costs the
+same as page 1: each query is a range scan of (p1_id, created_at) or
+(p2_id, created_at) that stops after one page, where OFFSET would walk
+every earlier row. A player can be on either side of a match, so the two
+index ranges are read separately and merged rather than OR-ed into one
+query the planner can't serve from a single index.
+"""
+import base64
+import heapq
+from datetime import datetime
+
+from sqlalchemy import select, tuple_
+
+from db import db
+from models import Match, User
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(match: Match) -> str:
+    raw = f"{match.created_at.isoformat()}|{match.id}"
+    return base64.urlsafe_b64encode(raw.encode("ascii")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(created_at, id) from a cursor; ValueError if it's malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("ascii")
+        created_at, match_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(match_id)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def _newest_first(conditions, cursor, limit: int):
+    query = select(Match).where(*conditions)
+    if cursor is not None:
+        query = query.where(tuple_(Match.created_at, Match.id) < cursor)
+    return query.order_by(Match.created_at.desc(), Match.id.desc()).limit(limit)
+
+
+def _page(queries, limit: int) -> tuple:
+    """Merge newest-first result sets; returns (matches, next_cursor)."""
+    sides = [db.session.execute(q).scalars().all() for q in queries]
+    merged = list(heapq.merge(*sides, key=lambda m: (m.created_at, m.id), reverse=True))
+    more = len(merged) > limit
+    matches = merged[:limit]
+    return matches, (encode_cursor(matches[-1]) if more and matches else None)
+
+
+def _describe(matches, user_id: int) -> list:
+    """Matches from user_id's point of view, with opponent usernames."""
+    opponent_ids = {m.p2_id if m.p1_id == user_id else m.p1_id for m in matches}
+    names = dict(db.session.execute(
+        select(User.id, User.username).where(User.id.in_(opponent_ids))
+    ).all()) if opponent_ids else {}
+
+    entries = []
+    for m in matches:
+        mine_p1 = m.p1_id == user_id
+        opponent_id = m.p2_id if mine_p1 else m.p1_id
+        if m.winner_id is None:
+            result = "tie"
+        else:
+            result = "win" if m.winner_id == user_id else "loss"
+        entries.append({
+            "id": m.id,
+            "room": m.room,
+            "opponent": {"id": opponent_id, "username": names.get(opponent_id)},
+            "my_score": m.score_p1 if mine_p1 else m.score_p2,
+            "opponent_score": m.score_p2 if mine_p1 else m.score_p1,
+            "result": result,
+            "duration": m.duration,
+            "played_at": m.created_at.isoformat(),
+        })
+    return entries
+
+
+def user_history(user_id: int, limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None) -> dict:
+    """
+    One page of a player's matches, newest first.
+
+    Returns {"matches": [...], "next_cursor": str or None}. Raises
+    ValueError for a malformed cursor.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    key = decode_cursor(cursor) if cursor else None
+    matches, next_cursor = _page([
+        _newest_first([Match.p1_id == user_id], key, limit + 1),
+        _newest_first([Match.p2_id == user_id], key, limit + 1),
+    ], limit)
+    return {"matches": _describe(matches, user_id), "next_cursor": next_cursor}
+
+
+def head_to_head(user_id: int, opponent_id: int, limit: int = DEFAULT_PAGE_SIZE,
+                 cursor: str | None = None) -> dict:
+    """One page of the matches between two players, newest first."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    key = decode_cursor(cursor) if cursor else None
+    matches, next_cursor = _page([
+        _newest_first([Match.p1_id == user_id, Match.p2_id == opponent_id], key, limit + 1),
+        _newest_first([Match.p1_id == opponent_id, Match.p2_id == user_id], key, limit + 1),
+    ], limit)
+    return {"matches": _describe(matches, user_id), "next_cursor": next_cursor}
@@ -0,0 +1,373 @@
+# match_results.py
+"""
+Write-behind persistence for finished matches.
+
+Whichever path ends a game (timer expiry in the game worker, surrender in
+the web tier) only appends the final result to the durable RESULTS_STREAM
+and moves on. A MatchResultWriter thread in each game worker reads the
+stream through the RESULTS_GROUP consumer group and flushes results in
+batches, one database transaction per batch:
+
+    - one bulk INSERT into matches that skips rooms already saved (ON
+      CONFLICT on the unique matches.room), returning the rooms it did
+      insert; only those go on to the steps below, so a redelivered or
+      duplicated result, even one flushed by two writers at once, is
+      counted once
+    - one SELECT of the players' current rating and game count
+    - one executemany of UPDATE users SET total_games = total_games + n,
+      total_wins = total_wins + w, rating = rating + d, so stats are
+      incremented in the database and concurrent batches can't lose updates
+    - the player_stats / head_to_head updates (see player_stats)
+
+Only after the commit are the messages acknowledged, the leaderboards and
+response cache updated and match_result_saved published for each room.
+A writer that dies mid-batch, or can't reach the database, leaves its
+messages pending; another writer reclaims them after CLAIM_IDLE_MS. A
+batch that fails for any other reason is split in half and each half
+retried, down to the single entry at fault, which is moved to
+DEAD_LETTER_STREAM so it can't hold the rest of the batch back.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+import redis
+from sqlalchemy import insert, select, update, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError, InterfaceError, OperationalError
+
+from db import db
+from models import Match, User
+from game import room_channel
+import leaderboard
+import player_stats
+import ratings
+import response_cache
+
+RESULTS_STREAM = "stream:match_results"
+RESULTS_GROUP = "match_writers"
+RESULTS_STREAM_MAXLEN = 100000  # approximate; acknowledged entries are trimmed eventually
+DEAD_LETTER_STREAM = "stream:match_results:dead"
+
+# The database is unreachable rather than the batch being at fault: keep
+# the whole batch pending instead of splitting it
+TRANSIENT_DB_ERRORS = (OperationalError, InterfaceError)
+
+WRITER_ID = os.environ.get("MATCH_WRITER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+FLUSH_BATCH = int(os.environ.get("MATCH_WRITER_BATCH", "500"))
+FLUSH_INTERVAL_MS = int(os.environ.get("MATCH_WRITER_INTERVAL_MS", "200"))
+CLAIM_IDLE_MS = 30000
+CLAIM_INTERVAL = 10
+
+
+def submit(r, room: str, p1, p2, score_p1: int, score_p2: int, winner_id,
+           duration: int, reason: str = "timeout") -> str:
+    """
+    Queue a finished match for persistence. Returns the stream entry id.
+
+    Args:
+        r: Redis client or pipeline
+        room: Game room identifier
+        p1, p2: Player user ids
+        score_p1, score_p2: Final scores
+        winner_id: Winning user id, or None for a tie
+        duration: Match length in seconds
+        reason: "timeout" or "surrender"
+    """
+    return r.xadd(
+        RESULTS_STREAM,
+        {
+            "room": room,
+            "p1": str(p1),
+            "p2": str(p2),
+            "score_p1": str(int(score_p1)),
+            "score_p2": str(int(score_p2)),
+            "winner_id": "" if winner_id is None else str(winner_id),
+            "duration": str(int(duration)),
+            "reason": reason,
+            "ended_at": f"{time.time():.3f}",
+        },
+        maxlen=RESULTS_STREAM_MAXLEN,
+        approximate=True,
+    )
+
+
+def parse_result(fields: dict) -> dict | None:
+    """Stream entry fields -> result dict, or None if the entry is malformed."""
+    try:
+        winner = fields.get("winner_id") or None
+        return {
+            "room": fields["room"],
+            "p1_id": int(fields["p1"]),
+            "p2_id": int(fields["p2"]),
+            "score_p1": int(fields["score_p1"]),
+            "score_p2": int(fields["score_p2"]),
+            "winner_id": None if winner is None else int(winner),
+            "duration": int(fields.get("duration") or 300),
+            "ended_at": float(fields.get("ended_at") or time.time()),
+        }
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+def _winner_slot(result: dict):
+    if result["winner_id"] is None:
+        return None
+    return 1 if result["winner_id"] == result["p1_id"] else 2
+
+
+def _insert_new_matches(rows: list) -> set:
+    """Insert match rows, skipping rooms already saved; returns the rooms inserted."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = (dialect_insert(Match).on_conflict_do_nothing(index_elements=["room"])
+                .returning(Match.room))
+        return set(db.session.execute(stmt, rows).scalars())
+
+    # No ON CONFLICT: insert row by row, each in a savepoint
+    inserted = set()
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(Match), [row])
+            inserted.add(row["room"])
+        except IntegrityError:
+            pass
+    return inserted
+
+
+def persist_batch(results: list) -> tuple:
+    """
+    Save a batch of results in one transaction. Needs an app context.
+
+    Returns (saved, names): the results actually inserted (rooms already in
+    the database or repeated within the batch are dropped) in stream order,
+    and {user_id: username} for their players.
+    """
+    seen = set()
+    unique = []
+    for result in results:
+        if result["room"] not in seen:
+            seen.add(result["room"])
+            unique.append(result)
+    if not unique:
+        return [], {}
+
+    inserted = _insert_new_matches([
+        {
+            "room": res["room"],
+            "p1_id": res["p1_id"],
+            "p2_id": res["p2_id"],
+            "score_p1": res["score_p1"],
+            "score_p2": res["score_p2"],
+            "winner_id": res["winner_id"],
+            "duration": res["duration"],
+            "created_at": datetime.utcfromtimestamp(res["ended_at"]),
+        }
+        for res in unique
+    ])
+    fresh = [res for res in unique if res["room"] in inserted]
+    if not fresh:
+        db.session.commit()
+        return [], {}
+
+    user_ids = {res["p1_id"] for res in fresh} | {res["p2_id"] for res in fresh}
+    players = {}
+    names = {}
+    for uid, username, rating, games in db.session.execute(
+        select(User.id, User.username, User.rating, User.total_games).where(User.id.in_(user_ids))
+    ):
+        names[uid] = username
+        players[uid] = {"rating": rating if rating is not None else ratings.DEFAULT_RATING,
+                        "games": games or 0, "wins": 0, "delta": 0.0, "played": 0}
+
+    # Ratings move match by match in stream order, as if each had been
+    # saved on its own
+    for res in fresh:
+        a, b = players.get(res["p1_id"]), players.get(res["p2_id"])
+        if a is not None and b is not None:
+            d1, d2 = ratings.rating_deltas(
+                a["rating"] + a["delta"], b["rating"] + b["delta"], _winner_slot(res),
+                a["games"] + a["played"], b["games"] + b["played"],
+            )
+            a["delta"] += d1
+            b["delta"] += d2
+        for uid in (res["p1_id"], res["p2_id"]):
+            if uid in players:
+                players[uid]["played"] += 1
+                if res["winner_id"] == uid:
+                    players[uid]["wins"] += 1
+
+    increments = [
+        {"uid": uid, "n_games": p["played"], "n_wins": p["wins"], "d_rating": p["delta"]}
+        for uid, p in players.items() if p["played"]
+    ]
+    users = User.__table__
+    if increments:
+        db.session.execute(
+            update(users)
+            .where(users.c.id == bindparam("uid"))
+            .values(
+                total_games=users.c.total_games + bindparam("n_games"),
+                total_wins=users.c.total_wins + bindparam("n_wins"),
+                rating=users.c.rating + bindparam("d_rating"),
+            ),
+            increments,
+        )
+    player_stats.apply_results(fresh)
+    db.session.commit()
+    return fresh, names
+
+
+def announce_saved(r, saved: list, names: dict = None):
+    """Leaderboards, cache invalidation and match_result_saved for saved results."""
+    if not saved:
+        return
+
+    try:
+        pipe = r.pipeline(transaction=False)
+        for res in saved:
+            leaderboard.queue_record_match(
+                pipe, res["p1_id"], res["p2_id"], res["winner_id"],
+                when=datetime.utcfromtimestamp(res["ended_at"]),
+            )
+        if names:
+            pipe.hset(leaderboard.NAMES_KEY, mapping={str(uid): n for uid, n in names.items()})
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"Failed to update leaderboards: {e}")
+
+    try:
+        response_cache.invalidate(r, "stats", {uid for res in saved for uid in (res["p1_id"], res["p2_id"])})
+        response_cache.invalidate(r, "leaderboard")
+    except redis.RedisError as e:
+        print(f"Failed to invalidate cached stats: {e}")
+
+    pipe = r.pipeline(transaction=False)
+    for res in saved:
+        pipe.publish(room_channel(res["room"]), json.dumps({
+            "type": "match_result_saved",
+            "room": res["room"],
+            "winner_id": res["winner_id"],
+            "scores": {"p1": res["score_p1"], "p2": res["score_p2"]},
+        }))
+    pipe.execute()
+
+
+def ensure_group(r):
+    """Create the writer consumer group (and stream) if missing."""
+    try:
+        r.xgroup_create(RESULTS_STREAM, RESULTS_GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+class MatchResultWriter:
+    """
+    Background thread draining RESULTS_STREAM into the database.
+
+    Args:
+        redis_client: Redis client (decode_responses=True)
+        app: Flask app whose context is used for database access
+        batch_size: Most results flushed per transaction
+        interval_ms: How long a read blocks waiting for the batch to fill
+    """
+
+    def __init__(self, redis_client, app, batch_size: int = FLUSH_BATCH,
+                 interval_ms: int = FLUSH_INTERVAL_MS, consumer: str = WRITER_ID):
+        self.r = redis_client
+        self.app = app
+        self.batch_size = batch_size
+        self.interval_ms = interval_ms
+        self.consumer = consumer
+        self._thread = None
+
+    def start(self):
+        ensure_group(self.r)
+        self._thread = threading.Thread(target=self.run, name="match-result-writer", daemon=True)
+        self._thread.start()
+
+    def flush(self, messages) -> int:
+        """Persist and acknowledge one batch of (id, fields). Returns rows inserted."""
+        if not messages:
+            return 0
+        results = [res for res in (parse_result(fields) for _, fields in messages) if res]
+        failure = None
+        with self.app.app_context():
+            try:
+                saved, names = persist_batch(results)
+            except TRANSIENT_DB_ERRORS:
+                db.session.rollback()
+                raise  # left pending and retried
+            except Exception as e:
+                db.session.rollback()
+                failure = e
+        if failure is not None:
+            return self._isolate_failure(messages, failure)
+        self.r.xack(RESULTS_STREAM, RESULTS_GROUP, *(msg_id for msg_id, _ in messages))
+        announce_saved(self.r, saved, names)
+        for res in saved:
+            print(f"Match saved to database (room {res['room']})")
+        return len(saved)
+
+    def _isolate_failure(self, messages, error) -> int:
+        """
+        Flush each half of a failed batch on its own, so one bad entry
+        doesn't keep the rest pending; a single failing entry is moved to
+        DEAD_LETTER_STREAM and acknowledged. Returns rows inserted.
+        """
+        if len(messages) > 1:
+            mid = len(messages) // 2
+            return self.flush(messages[:mid]) + self.flush(messages[mid:])
+        msg_id, fields = messages[0]
+        pipe = self.r.pipeline(transaction=True)
+        pipe.xadd(DEAD_LETTER_STREAM, {**fields, "source_id": msg_id, "error": repr(error)[:500]})
+        pipe.xack(RESULTS_STREAM, RESULTS_GROUP, msg_id)
+        pipe.execute()
+        print(f"Match result {msg_id} (room {fields.get('room')}) moved to "
+              f"{DEAD_LETTER_STREAM}: {error}")
+        return 0
+
+    def claim_stale(self) -> int:
+        """Flush results left pending by a writer that stopped."""
+        flushed = 0
+        start = "0-0"
+        while True:
+            start, messages, _ = self.r.xautoclaim(
+                RESULTS_STREAM, RESULTS_GROUP, self.consumer,
+                min_idle_time=CLAIM_IDLE_MS, start_id=start, count=self.batch_size,
+            )
+            messages = [(msg_id, fields) for msg_id, fields in messages if fields]
+            flushed += self.flush(messages)
+            if start == "0-0":
+                return flushed
+
+    def run(self):
+        last_claim = 0.0
+        while True:
+            try:
+                now = time.monotonic()
+                if now - last_claim >= CLAIM_INTERVAL:
+                    last_claim = now
+                    self.claim_stale()
+
+                response = self.r.xreadgroup(
+                    RESULTS_GROUP, self.consumer, {RESULTS_STREAM: ">"},
+                    count=self.batch_size, block=self.interval_ms,
+                )
+                for _, messages in response or []:
+                    self.flush(messages)
+            except redis.ResponseError as e:
+                if "NOGROUP" in str(e):
+                    ensure_group(self.r)
+                else:
+                    print(f"Redis error in match writer: {e}")
+                    time.sleep(1)
+            except Exception as e:
+                print(f"Error flushing match results: {e}")
+                time.sleep(1)
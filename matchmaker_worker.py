@@ -1,55 +1,275 @@
+import math
 import os
 import time
 import redis
-import json
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from game import (
+    create_match, queue_create_match, active_match_key, EVENT_CHANNEL, START_GAME_STREAM
+)
+import matchmaking
+import metrics
+import presence
+from ratings import DEFAULT_RATING
+
 REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
 r = redis.from_url(REDIS_URL, decode_responses=True)
 
-QUEUE_KEY = "matchmaking_queue"
-EVENT_CHANNEL = "events"
-START_GAME_CHANNEL = "start_game"
+QUEUE_KEY = matchmaking.QUEUE_KEY
 
-# Store active match assignment per user (avoids missing match_found when page reloads)
-ACTIVE_MATCH_TTL = 60 * 60  # 1 hour
+# "rating" (the default) pairs each of the longest-waiting players with the
+# closest-rated opponent; "single" pairs the two oldest players per loop and
+# "batch" drains up to MATCHMAKER_BATCH_SIZE queued users and pairs them all
+# at once, both first come first served regardless of rating
+MATCHMAKER_MODE = os.environ.get("MATCHMAKER_MODE", "rating").lower()
+MATCHMAKER_BATCH_SIZE = int(os.environ.get("MATCHMAKER_BATCH_SIZE", "100"))
+BATCH_IDLE_SLEEP = 0.5  # seconds to wait when a batch leaves one player unpaired
 
-# Online presence key written by the web server on Socket.IO connect + heartbeat
-ONLINE_KEY_FMT = "user:{uid}:online"
-ACTIVE_ROOM_FMT = "user:{uid}:active_room"
+# Rating mode: acceptable rating gap starts at RATING_WINDOW_BASE and grows
+# by RATING_WINDOW_GROWTH per second waited, up to RATING_WINDOW_MAX; after
+# RATING_FALLBACK_AFTER seconds any opponent will do, so an outlier with
+# nobody within the window still gets a game
+RATING_WINDOW_BASE = float(os.environ.get("RATING_WINDOW_BASE", "50"))
+RATING_WINDOW_GROWTH = float(os.environ.get("RATING_WINDOW_GROWTH", "10"))
+RATING_WINDOW_MAX = float(os.environ.get("RATING_WINDOW_MAX", "400"))
+RATING_FALLBACK_AFTER = float(os.environ.get("RATING_FALLBACK_AFTER", "90"))
+RATING_ANCHORS = int(os.environ.get("RATING_ANCHORS", "50"))  # oldest players examined per cycle
+RATING_IDLE_SLEEP = 0.5  # seconds between cycles that made no match
 
-def is_online(uid: str) -> bool:
-    try:
-        return bool(r.exists(ONLINE_KEY_FMT.format(uid=uid)))
-    except Exception:
-        return False
+# Scrape listener for this worker (METRICS_PORT overrides, 0 disables)
+METRICS_PORT = 9102
+
+
+def record_matched(waits):
+    """Feed matched players' waits to the queue estimate and to metrics."""
+    waits = list(waits)
+    matchmaking.record_waits(r, waits)
+    observe_matched(waits)
+
+
+def observe_matched(waits):
+    """Count matched players' waits in metrics only (claim_pair already recorded them)."""
+    waits = list(waits)
+    metrics.MATCHES_CREATED.inc(len(waits) // 2)
+    for waited in waits:
+        metrics.TIME_TO_MATCH.observe(max(0.0, waited))
 
-def has_active_match(uid: str) -> bool:
-    try:
-        return bool(r.exists(ACTIVE_ROOM_FMT.format(uid=uid)))
-    except Exception:
-        return False
 
 def pop_valid_player(timeout: int):
-    """Pop a player from the queue who is online and not already in an active match."""
+    """
+    Pop the longest-waiting player who is online and not already in an
+    active match. Returns (uid, enqueued_at) or None on timeout.
+    """
     while True:
-        result = r.brpop(QUEUE_KEY, timeout=timeout)
+        result = matchmaking.pop_oldest(r, timeout=timeout)
         if not result:
             return None
 
-        _, uid = result
-        uid = str(uid)
+        eligible = filter_eligible([result])
+        if eligible:
+            return eligible[0]
+
+
+def match_one_pair() -> int:
+    """
+    Single mode: pop two valid players and create their match.
+
+    Returns the number of matches created (0 or 1).
+    """
+    first = pop_valid_player(timeout=0)
+    if not first:
+        return 0
+    p1, p1_enqueued = first
+    print(f"Player {p1} pulled from queue")
+
+    second = pop_valid_player(timeout=2)
+    if not second:
+        # Only one player available; put them back at the front of
+        # the line and wait a little longer
+        print(f"No second valid player found, returning {p1} to queue")
+        matchmaking.requeue(r, p1, p1_enqueued)
+        time.sleep(1)
+        return 0
+    p2, p2_enqueued = second
 
-        if not is_online(uid):
+    print(f"Player {p2} pulled from queue")
+
+    # Ensure we don't match a player with themselves
+    if str(p1) == str(p2):
+        print(f"Same player ID detected ({p1}), pushing back")
+        matchmaking.requeue(r, p1, p1_enqueued)
+        return 0
+
+    # Create the game, both assignments and the start events in
+    # one MULTI/EXEC round trip
+    room = create_match(r, p1, p2)
+    print(f"Matched: Player {p1} vs Player {p2} in room {room}")
+
+    now = time.time()
+    record_matched([now - p1_enqueued, now - p2_enqueued])
+    return 1
+
+
+def filter_eligible(candidates: list) -> list:
+    """
+    Keep queued (uid, enqueued_at) entries whose user is online and has no
+    active match: one MGET for everyone's presence, then one for the active
+    matches of those still online.
+    """
+    if not candidates:
+        return []
+    online = []
+    flags = presence.online_many(r, [uid for uid, _ in candidates])
+    for (uid, enqueued_at), is_online in zip(candidates, flags):
+        if is_online:
+            online.append((uid, enqueued_at))
+        else:
             print(f"Discarding offline queued user {uid}")
-            continue
-        if has_active_match(uid):
+    if not online:
+        return []
+
+    eligible = []
+    active = r.mget([active_match_key(uid) for uid, _ in online])
+    for (uid, enqueued_at), active_room in zip(online, active):
+        if active_room:
             print(f"Discarding already-matched queued user {uid}")
+        else:
+            eligible.append((uid, enqueued_at))
+    return eligible
+
+
+def match_batch(batch_size: int, timeout: float = 0) -> int:
+    """
+    Batch mode: drain up to batch_size queued users, pair every eligible
+    one in FIFO order and create all of the rooms in a single pipeline.
+    A leftover odd player goes back with their original place in line.
+
+    Returns the number of matches created.
+    """
+    candidates = matchmaking.pop_batch(r, batch_size, timeout=timeout)
+    eligible = filter_eligible(candidates)
+
+    pairs = [(eligible[i], eligible[i + 1]) for i in range(0, len(eligible) - 1, 2)]
+    if len(eligible) % 2:
+        matchmaking.requeue(r, *eligible[-1])
+    if not pairs:
+        if eligible:
+            # Nobody to pair with yet; don't spin on the same player
+            time.sleep(BATCH_IDLE_SLEEP)
+        return 0
+
+    pipe = r.pipeline(transaction=True)
+    rooms = [queue_create_match(pipe, p1, p2) for (p1, _), (p2, _) in pairs]
+    try:
+        pipe.execute()
+    except redis.RedisError:
+        # Nothing was created; give everyone their place back
+        matchmaking.requeue_many(r, [entry for pair in pairs for entry in pair])
+        raise
+
+    for ((p1, _), (p2, _)), room in zip(pairs, rooms):
+        print(f"Matched: Player {p1} vs Player {p2} in room {room}")
+
+    now = time.time()
+    record_matched([now - at for pair in pairs for _, at in pair])
+    return len(pairs)
+
+
+def rating_window(waited: float) -> float:
+    """Largest rating gap accepted for a player who has waited this long."""
+    if waited >= RATING_FALLBACK_AFTER:
+        return math.inf
+    return min(RATING_WINDOW_MAX, RATING_WINDOW_BASE + RATING_WINDOW_GROWTH * max(0.0, waited))
+
+
+def match_by_rating(anchors: int = RATING_ANCHORS) -> int:
+    """
+    Rating mode: for each of the longest-waiting players, find the closest
+    rated opponent among the other anchors and in the rating index and pair
+    them if the gap is within the anchor's window, which widens the longer
+    they wait (and opens fully after RATING_FALLBACK_AFTER).
+
+    The other anchors are considered first because ratings tie a lot
+    (every new player starts at DEFAULT_RATING): the index returns the same
+    boundary members to every anchor with a tied rating, and once the first
+    anchor has taken them the rest would find nobody.
+
+    Each cycle costs a fixed number of round trips and O(log n) index
+    lookups per anchor, so it doesn't slow down as the queue grows. Pairs
+    are claimed with a script that only succeeds if both players are still
+    queued, so concurrent matchmakers and cancels can't double-book anyone.
+
+    Returns the number of matches created.
+    """
+    oldest = matchmaking.oldest(r, anchors)
+    if len(oldest) < 2:
+        time.sleep(RATING_IDLE_SLEEP)
+        return 0
+
+    eligible = filter_eligible(oldest)
+    stale = {uid for uid, _ in oldest} - {uid for uid, _ in eligible}
+    if stale:
+        matchmaking.drop_many(r, stale)
+
+    # Players queued without a rating (e.g. requeued by another mode) are
+    # indexed at the default so they can still be found
+    rated = matchmaking.ratings_of(r, [uid for uid, _ in eligible])
+    missing = {uid: DEFAULT_RATING for (uid, _), rating in zip(eligible, rated) if rating is None}
+    if missing:
+        r.zadd(matchmaking.RATING_KEY, missing, nx=True)
+    entries = [(uid, DEFAULT_RATING if rating is None else rating)
+               for (uid, _), rating in zip(eligible, rated)]
+    enqueued = dict(eligible)
+
+    # Best in-window opponent per anchor, oldest anchor first
+    now = time.time()
+    proposals = []
+    proposed = set()
+    taken = set(stale)
+    for (uid, rating), nearby in zip(entries, matchmaking.nearest_rated(r, entries)):
+        if uid in proposed:
+            continue
+        window = rating_window(now - enqueued[uid])
+        best = None
+        for other, other_rating in entries + nearby:
+            gap = abs(other_rating - rating)
+            if other == uid or other in taken or other in proposed or gap > window:
+                continue
+            if best is None or gap < best[1]:
+                best = (other, gap)
+        if best:
+            proposals.append((uid, best[0]))
+            proposed.update((uid, best[0]))
+
+    # Opponents outside the anchor set haven't been checked yet
+    unchecked = list({other for _, other in proposals if other not in enqueued})
+    if unchecked:
+        ok = {uid for uid, _ in filter_eligible([(uid, 0.0) for uid in unchecked])}
+        bad = set(unchecked) - ok
+        if bad:
+            matchmaking.drop_many(r, bad)
+            taken |= bad
+
+    matches = 0
+    for p1, p2 in proposals:
+        if p1 in taken or p2 in taken:
+            continue
+        claimed = matchmaking.claim_pair(r, p1, p2)
+        taken.update((p1, p2))
+        if not claimed:
             continue
+        room = create_match(r, p1, p2)
+        print(f"Matched: Player {p1} vs Player {p2} in room {room}")
+        now = time.time()
+        observe_matched([now - claimed[0], now - claimed[1]])
+        matches += 1
 
-        return uid
+    if not matches:
+        # Let windows widen and more players arrive
+        time.sleep(RATING_IDLE_SLEEP)
+    return matches
 
 
 def start_matchmaker():
@@ -57,64 +277,26 @@ def start_matchmaker():
     Main matchmaking loop.
 
     Blocks waiting for players in queue, pairs them, creates games,
-    and publishes match_found events.
+    and publishes match_found events. By default players are paired by
+    rating (see match_by_rating); MATCHMAKER_MODE=single pairs them first
+    come first served two at a time, and MATCHMAKER_MODE=batch up to
+    MATCHMAKER_BATCH_SIZE players per cycle.
     """
-    print("Matchmaker worker started")
+    print(f"Matchmaker worker started (mode: {MATCHMAKER_MODE})")
     print(f"Watching queue: {QUEUE_KEY}")
-    print(f"Publishing to: {EVENT_CHANNEL}, {START_GAME_CHANNEL}")
+    print(f"Publishing to: {EVENT_CHANNEL}:user:<id>, {START_GAME_STREAM}")
+
+    metrics.safe_gauge(metrics.QUEUE_DEPTH, lambda: r.zcard(QUEUE_KEY))
+    metrics.start_server(METRICS_PORT)
 
     while True:
         try:
-            p1 = pop_valid_player(timeout=0)
-            if not p1:
-                continue
-            print(f"Player {p1} pulled from queue")
-
-            p2 = pop_valid_player(timeout=2)
-            if not p2:
-                # Only one player available, push back and wait longer
-                print(f"No second valid player found, pushing {p1} back to queue")
-                r.lpush(QUEUE_KEY, p1)
-                time.sleep(1)
-                continue
-
-            print(f"Player {p2} pulled from queue")
-
-            # Ensure we don't match a player with themselves
-            if str(p1) == str(p2):
-                print(f"Same player ID detected ({p1}), pushing back")
-                r.lpush(QUEUE_KEY, p1)
-                continue
-
-            # Import here to avoid circular dependencies
-            from game import create_game
-
-            # Create game in Redis
-            room = create_game(r, p1, p2)
-
-            # Persist match assignment for each user so the web UI can recover
-            # even if the SocketIO event is missed (navigation / refresh).
-            r.setex(f"user:{p1}:active_room", ACTIVE_MATCH_TTL, room)
-            r.setex(f"user:{p1}:active_is_p1", ACTIVE_MATCH_TTL, "1")
-            r.setex(f"user:{p2}:active_room", ACTIVE_MATCH_TTL, room)
-            r.setex(f"user:{p2}:active_is_p1", ACTIVE_MATCH_TTL, "0")
-
-            print(f"Matched: Player {p1} vs Player {p2} in room {room}")
-
-            # Notify web server via pubsub that match was found
-            match_found_payload = {
-                "type": "match_found",
-                "room": room,
-                "players": [str(p1), str(p2)]
-            }
-            r.publish(EVENT_CHANNEL, json.dumps(match_found_payload))
-
-            # Signal game_worker to start timer for this room
-            start_game_payload = {
-                "room": room,
-                "players": [str(p1), str(p2)]
-            }
-            r.publish(START_GAME_CHANNEL, json.dumps(start_game_payload))
+            if MATCHMAKER_MODE == "batch":
+                match_batch(MATCHMAKER_BATCH_SIZE)
+            elif MATCHMAKER_MODE == "rating":
+                match_by_rating()
+            else:
+                match_one_pair()
 
         except redis.RedisError as e:
             print(f"Redis error in matchmaker: {e}")
@@ -0,0 +1,243 @@
+"""
+Matchmaking queue stored in Redis.
+
+The queue is a sorted set of user ids scored by enqueue time (epoch
+seconds), so membership, position and removal are all O(log n) and a
+player who is put back keeps their place in line. Enqueue is a ZADD NX,
+which makes it atomic and idempotent.
+
+Queued players are also indexed by rating in a second sorted set
+(RATING_KEY, scored by rating) so the rating matchmaker can find the
+nearest opponent with a range query instead of scanning the queue. Both
+sets are written and cleared together.
+"""
+import time
+
+from redis_scripts import cached_script
+
+QUEUE_KEY = "matchmaking:queue"
+RATING_KEY = "matchmaking:ratings"
+
+# Running averages used to estimate how long a queued player will wait
+WAIT_STATS_KEY = "matchmaking:wait_stats"
+WAIT_EWMA_ALPHA = 0.2
+
+# Fold one observed wait into the exponentially weighted average.
+# KEYS: stats hash   ARGV: observed wait (s), alpha
+UPDATE_WAIT_LUA = """
+local prev = tonumber(redis.call('HGET', KEYS[1], 'avg_wait'))
+local obs = tonumber(ARGV[1])
+local avg = obs
+if prev then
+    avg = prev + tonumber(ARGV[2]) * (obs - prev)
+end
+redis.call('HSET', KEYS[1], 'avg_wait', tostring(avg))
+redis.call('HINCRBY', KEYS[1], 'matched', 1)
+return tostring(avg)
+"""
+
+# Atomically take two players out of the pool, only if both are still
+# queued (another matchmaker or a cancel may have got there first), and
+# fold both players' waits into the average as UPDATE_WAIT_LUA does.
+# KEYS: queue, rating index, stats hash   ARGV: uid a, uid b, now, alpha
+# Returns {enqueued_at_a, enqueued_at_b} or false
+CLAIM_PAIR_LUA = """
+local a = redis.call('ZSCORE', KEYS[1], ARGV[1])
+local b = redis.call('ZSCORE', KEYS[1], ARGV[2])
+if not a or not b then
+    return false
+end
+redis.call('ZREM', KEYS[1], ARGV[1], ARGV[2])
+redis.call('ZREM', KEYS[2], ARGV[1], ARGV[2])
+local avg = tonumber(redis.call('HGET', KEYS[3], 'avg_wait'))
+for _, enqueued_at in ipairs({a, b}) do
+    local obs = math.max(0, tonumber(ARGV[3]) - tonumber(enqueued_at))
+    if avg then
+        avg = avg + tonumber(ARGV[4]) * (obs - avg)
+    else
+        avg = obs
+    end
+end
+redis.call('HSET', KEYS[3], 'avg_wait', tostring(avg))
+redis.call('HINCRBY', KEYS[3], 'matched', 2)
+return {a, b}
+"""
+
+
+def enqueue(r, user_id, rating: float | None = None) -> bool:
+    """
+    Add a user to the queue. Returns False if they were already queued.
+
+    When rating is given the user is also indexed in RATING_KEY for the
+    rating matchmaker.
+    """
+    if rating is None:
+        return bool(r.zadd(QUEUE_KEY, {str(user_id): time.time()}, nx=True))
+    pipe = r.pipeline(transaction=True)
+    pipe.zadd(QUEUE_KEY, {str(user_id): time.time()}, nx=True)
+    pipe.zadd(RATING_KEY, {str(user_id): float(rating)})
+    added, _ = pipe.execute()
+    return bool(added)
+
+
+def dequeue(r, user_id) -> bool:
+    """Remove a user from the queue. Returns False if they weren't queued."""
+    pipe = r.pipeline(transaction=True)
+    pipe.zrem(QUEUE_KEY, str(user_id))
+    pipe.zrem(RATING_KEY, str(user_id))
+    removed, _ = pipe.execute()
+    return bool(removed)
+
+
+def drop_many(r, user_ids):
+    """Remove several users from the queue and the rating index."""
+    user_ids = [str(uid) for uid in user_ids]
+    if not user_ids:
+        return
+    pipe = r.pipeline(transaction=True)
+    pipe.zrem(QUEUE_KEY, *user_ids)
+    pipe.zrem(RATING_KEY, *user_ids)
+    pipe.execute()
+
+
+def pop_oldest(r, timeout: float = 0):
+    """
+    Block until someone is queued and pop the longest-waiting user.
+
+    Returns (user_id, enqueued_at) or None on timeout.
+    """
+    result = r.bzpopmin(QUEUE_KEY, timeout=timeout)
+    if not result:
+        return None
+    _, uid, enqueued_at = result
+    r.zrem(RATING_KEY, str(uid))
+    return str(uid), float(enqueued_at)
+
+
+def pop_batch(r, count: int, timeout: float = 0) -> list:
+    """
+    Block until someone is queued, then pop up to count of the
+    longest-waiting users. Returns [(user_id, enqueued_at), ...] in FIFO
+    order, or [] on timeout.
+    """
+    first = pop_oldest(r, timeout=timeout)
+    if not first:
+        return []
+    batch = [first]
+    if count > 1:
+        for uid, enqueued_at in r.zpopmin(QUEUE_KEY, count - 1):
+            batch.append((str(uid), float(enqueued_at)))
+        if len(batch) > 1:
+            r.zrem(RATING_KEY, *(uid for uid, _ in batch[1:]))
+    return batch
+
+
+def requeue(r, user_id, enqueued_at: float):
+    """Put a popped user back with their original place in line."""
+    r.zadd(QUEUE_KEY, {str(user_id): enqueued_at}, nx=True)
+
+
+def requeue_many(r, entries):
+    """requeue() for several (user_id, enqueued_at) pairs in one command."""
+    entries = list(entries)
+    if entries:
+        r.zadd(QUEUE_KEY, {str(uid): at for uid, at in entries}, nx=True)
+
+
+def oldest(r, count: int) -> list:
+    """The count longest-waiting users as [(user_id, enqueued_at), ...]."""
+    return [(str(uid), float(at)) for uid, at in r.zrange(QUEUE_KEY, 0, count - 1, withscores=True)]
+
+
+def nearest_rated(r, entries, limit: int = 2) -> list:
+    """
+    For each (user_id, rating), fetch the closest rated players on either
+    side in one pipelined round trip: up to limit at or above the rating
+    and up to limit at or below it (O(log n) each).
+
+    Returns one list of (user_id, rating) candidates per entry, which may
+    include the user themselves.
+    """
+    pipe = r.pipeline(transaction=False)
+    for _, rating in entries:
+        pipe.zrangebyscore(RATING_KEY, rating, "+inf", start=0, num=limit, withscores=True)
+        pipe.zrevrangebyscore(RATING_KEY, rating, "-inf", start=0, num=limit, withscores=True)
+    results = pipe.execute()
+    out = []
+    for i in range(len(entries)):
+        above, below = results[2 * i], results[2 * i + 1]
+        out.append([(str(uid), float(score)) for uid, score in above + below])
+    return out
+
+
+def ratings_of(r, user_ids) -> list:
+    """Indexed rating for each user id (None where not indexed)."""
+    user_ids = [str(uid) for uid in user_ids]
+    if not user_ids:
+        return []
+    return [None if v is None else float(v) for v in r.zmscore(RATING_KEY, user_ids)]
+
+
+def claim_pair(r, a, b):
+    """
+    Take both users out of the pool if both are still queued, recording
+    their waits for estimated_wait in the same call.
+
+    Returns (enqueued_at_a, enqueued_at_b), or None if either was gone.
+    """
+    result = cached_script(r, CLAIM_PAIR_LUA)(
+        keys=[QUEUE_KEY, RATING_KEY, WAIT_STATS_KEY],
+        args=[str(a), str(b), time.time(), WAIT_EWMA_ALPHA],
+        client=r,
+    )
+    if not result:
+        return None
+    return float(result[0]), float(result[1])
+
+
+def record_waits(r, waits):
+    """
+    Record how long matched players waited (feeds estimated_wait), in one
+    pipelined round trip. claim_pair records its own pair's waits.
+    """
+    waits = list(waits)
+    if not waits:
+        return
+    pipe = r.pipeline(transaction=False)
+    for waited in waits:
+        cached_script(r, UPDATE_WAIT_LUA)(
+            keys=[WAIT_STATS_KEY], args=[max(0.0, waited), WAIT_EWMA_ALPHA], client=pipe
+        )
+    pipe.execute()
+
+
+def queue_status(r, user_id) -> dict:
+    """
+    Where the user stands in the queue, in one round trip.
+
+    Returns {"queued": False} if they aren't queued, otherwise their
+    1-based position, the number of players waiting, seconds waited so far
+    and an estimate of the seconds left until a match.
+    """
+    pipe = r.pipeline(transaction=False)
+    pipe.zrank(QUEUE_KEY, str(user_id))
+    pipe.zscore(QUEUE_KEY, str(user_id))
+    pipe.zcard(QUEUE_KEY)
+    pipe.hget(WAIT_STATS_KEY, "avg_wait")
+    rank, enqueued_at, waiting, avg_wait = pipe.execute()
+
+    if rank is None or enqueued_at is None:
+        return {"queued": False}
+
+    waited = max(0.0, time.time() - float(enqueued_at))
+    estimate = None
+    if avg_wait is not None:
+        estimate = round(max(0.0, float(avg_wait) - waited))
+
+    return {
+        "queued": True,
+        "position": int(rank) + 1,
+        "waiting": int(waiting),
+        "waited": round(waited),
+        "estimated_wait": estimate,
+    }
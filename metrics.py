@@ -0,0 +1,219 @@
+# metrics.py
+"""
+Prometheus metrics for the web tier and the workers.
+
+The web tier serves /metrics itself; the matchmaker and game worker have
+no HTTP server, so each starts a small scrape listener (start_server) on
+METRICS_PORT. With several web processes (WEB_CONCURRENCY > 1) a scrape
+of /metrics only reaches one of them; set PROMETHEUS_MULTIPROC_DIR for
+the web processes to an empty directory and /metrics aggregates all of
+them instead.
+
+Per-request work is tallied in a greenlet/thread-local scope opened by
+begin_request() and closed by end_request(): every Redis round trip
+(one per command or pipeline, counted at the connection) and every SQL
+statement executed inside it is added to the scope and observed per
+handler when it closes.
+"""
+import functools
+import os
+import threading
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+    start_http_server,
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import profiling
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# Handler latencies are milliseconds to low seconds; waits and lags run longer
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+WAIT_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+# ---- web tier ----
+HTTP_LATENCY = Histogram(
+    "wordle_http_request_seconds", "HTTP request latency",
+    ["route", "method", "status"], buckets=LATENCY_BUCKETS,
+)
+SOCKET_LATENCY = Histogram(
+    "wordle_socketio_handler_seconds", "Socket.IO event handler latency",
+    ["event"], buckets=LATENCY_BUCKETS,
+)
+REDIS_PER_REQUEST = Histogram(
+    "wordle_redis_roundtrips_per_request", "Redis round trips per HTTP request or socket event",
+    ["handler"], buckets=COUNT_BUCKETS,
+)
+DB_PER_REQUEST = Histogram(
+    "wordle_db_queries_per_request", "SQL statements per HTTP request or socket event",
+    ["handler"], buckets=COUNT_BUCKETS,
+)
+RELAY_LAG = Histogram(
+    "wordle_relay_lag_seconds", "Worker publish to web-process relay delay (timestamped events)",
+    ["event"], buckets=LAG_BUCKETS,
+)
+RELAYED = Counter("wordle_relayed_events_total", "Pub/sub events relayed to local sockets", ["event"])
+ROOM_CACHE_LOOKUPS = Counter(
+    "wordle_room_cache_lookups_total", "Room state cache lookups (hit, miss, bypass)", ["result"],
+)
+ROOM_CACHE_INVALIDATIONS = Counter(
+    "wordle_room_cache_invalidations_total", "Cached rooms dropped by room state messages",
+)
+RATE_LIMITED = Counter(
+    "wordle_rate_limited_total", "Requests rejected by the rate limiter", ["action", "scope"],
+)
+
+# ---- matchmaker ----
+QUEUE_DEPTH = Gauge("wordle_matchmaking_queue_depth", "Players waiting in the matchmaking queue")
+TIME_TO_MATCH = Histogram(
+    "wordle_time_to_match_seconds", "Time from joining the queue to being matched",
+    buckets=WAIT_BUCKETS,
+)
+MATCHES_CREATED = Counter("wordle_matches_created_total", "Matches created by the matchmaker")
+
+# ---- game worker ----
+ACTIVE_ROOMS = Gauge("wordle_active_rooms", "Rooms whose clock this game worker drives")
+SCHEDULED_WAKEUPS = Gauge("wordle_scheduler_heap_entries", "Pending wake-ups in the room scheduler")
+GAME_OVER_IN_FLIGHT = Gauge("wordle_game_over_in_flight", "Expired rooms queued or being finalized")
+WORKER_THREADS = Gauge("wordle_worker_threads", "Live threads in this worker process")
+TIMER_DRIFT = Histogram(
+    "wordle_timer_drift_seconds", "How late the scheduler serviced a room's wake-up",
+    ["kind"], buckets=LAG_BUCKETS,
+)
+
+
+# ---- per-request tallies ----
+_scope = threading.local()  # greenlet-local under the eventlet worker
+
+
+def begin_request():
+    _scope.redis = 0
+    _scope.db = 0
+    _scope.active = True
+
+
+def end_request(handler: str):
+    if not getattr(_scope, "active", False):
+        return
+    _scope.active = False
+    REDIS_PER_REQUEST.labels(handler).observe(_scope.redis)
+    DB_PER_REQUEST.labels(handler).observe(_scope.db)
+
+
+def _counting_connection(base):
+    class CountingConnection(base):
+        def send_packed_command(self, command, check_health=True):
+            if getattr(_scope, "active", False):
+                _scope.redis += 1
+            return super().send_packed_command(command, check_health)
+
+    CountingConnection.__name__ = f"Counting{base.__name__}"
+    return CountingConnection
+
+
+def instrument_redis(client):
+    """Count the client's round trips (commands and whole pipelines) per request."""
+    pool = client.connection_pool
+    if not getattr(pool.connection_class, "_counts_roundtrips", False):
+        pool.connection_class = _counting_connection(pool.connection_class)
+        pool.connection_class._counts_roundtrips = True
+    return client
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_scope, "active", False):
+        _scope.db += 1
+
+
+def instrument_flask(app):
+    """Time every HTTP request and tally its Redis and DB work."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+        begin_request()
+
+    @app.teardown_request
+    def _observe(exc):
+        start = g.pop("_metrics_start", None)
+        if start is None:
+            return
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        status = getattr(g, "_metrics_status", 500 if exc else 200)
+        HTTP_LATENCY.labels(route, request.method, str(status)).observe(time.perf_counter() - start)
+        end_request(route)
+
+    @app.after_request
+    def _record_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+
+def socket_handler(name: str):
+    """Decorator timing a Socket.IO handler and tallying its Redis and DB work."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            begin_request()
+            start = time.perf_counter()
+            try:
+                # Also the hook for on-demand handler profiling
+                with profiling.capture.around(name):
+                    return fn(*args, **kwargs)
+            finally:
+                SOCKET_LATENCY.labels(name).observe(time.perf_counter() - start)
+                end_request(f"socket:{name}")
+        return wrapper
+    return decorator
+
+
+def observe_relay(event_type: str, sent_at_ms=None):
+    """Count a relayed event and, if it carries its publish time, its lag."""
+    RELAYED.labels(event_type or "unknown").inc()
+    if sent_at_ms:
+        RELAY_LAG.labels(event_type).observe(max(0.0, time.time() - float(sent_at_ms) / 1000.0))
+
+
+# ---- exposition ----
+def render():
+    """(body, content_type) for a scrape of this process (or all web processes)."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def start_server(default_port: int):
+    """
+    Serve /metrics for a worker on METRICS_PORT (default_port if unset;
+    0 disables it). A port already taken, e.g. by a second worker on the
+    same host, is reported and skipped rather than fatal.
+    """
+    port = int(os.environ.get("METRICS_PORT", default_port))
+    if not port:
+        return
+    try:
+        start_http_server(port)
+        print(f"Metrics listener on :{port}/metrics")
+    except OSError as e:
+        print(f"Metrics listener not started on :{port}: {e}")
+
+
+def safe_gauge(gauge, fn):
+    """Have gauge report fn() at scrape time (0 if it fails)."""
+    def read():
+        try:
+            return fn()
+        except Exception:
+            return 0
+    gauge.set_function(read)
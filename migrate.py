@@ -0,0 +1,97 @@
+# migrate.py
+"""
+Idempotent schema migrations.
+
+db.create_all() only creates missing tables; it never alters existing
+ones. This script creates anything missing and then applies the column
+and index additions below, skipping whatever is already in place, so it
+is safe to run on every deploy (start.sh and the Procfile release phase
+do). It is deliberately not run by the web or worker processes: several
+starting at once would race on the DDL, and drop_duplicates deletes rows.
+
+Run:
+    python migrate.py
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from flask import Flask
+from sqlalchemy import inspect, text
+from db import db
+import models  # noqa: F401  (registers the tables)
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///local.db")
+
+# (table, column, DDL fragment) added when missing
+COLUMNS = [
+    ("users", "rating", "rating FLOAT NOT NULL DEFAULT 1500"),
+]
+
+
+def make_app_for_db():
+    """Create Flask app context for database operations."""
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    return app
+
+
+def add_missing_columns():
+    inspector = inspect(db.engine)
+    for table, column, ddl in COLUMNS:
+        existing = {c["name"] for c in inspector.get_columns(table)}
+        if column in existing:
+            continue
+        with db.engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {ddl}"))
+        print(f"Added column {table}.{column}")
+
+
+def drop_duplicates(table, columns):
+    """Delete all but the first (lowest id) row of each group of duplicates."""
+    cols = ", ".join(c.name for c in columns)
+    with db.engine.begin() as conn:
+        deleted = conn.execute(text(
+            f"DELETE FROM {table.name} WHERE id NOT IN "
+            f"(SELECT MIN(id) FROM {table.name} GROUP BY {cols})"
+        )).rowcount
+    if deleted:
+        print(f"Deleted {deleted} duplicate rows from {table.name} ({cols}); totals saved "
+              f"with them were counted twice (`python player_stats.py backfill` rebuilds "
+              f"player_stats and head_to_head)")
+
+
+def add_missing_indexes():
+    """
+    Create any index declared on a model that the database lacks, and
+    rebuild one the model now declares unique (dropping duplicate rows
+    first) if the database's copy isn't.
+    """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {ix["name"]: ix for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            current = existing.get(index.name)
+            if current is not None and (not index.unique or current["unique"]):
+                continue
+            if current is not None:
+                drop_duplicates(table, index.columns)
+                index.drop(db.engine)
+            index.create(db.engine)
+            print(f"Created {'unique ' if index.unique else ''}index {index.name}")
+
+
+def migrate():
+    db.create_all()
+    add_missing_columns()
+    add_missing_indexes()
+
+
+if __name__ == "__main__":
+    app = make_app_for_db()
+    with app.app_context():
+        migrate()
+        print("Database schema up to date")
@@ -12,6 +12,7 @@ class User(UserMixin, db.Model):
    
     total_games = db.Column(db.Integer, default=0, nullable=False)
     total_wins = db.Column(db.Integer, default=0, nullable=False)
+    rating = db.Column(db.Float, default=1500.0, server_default="1500", nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     def set_password(self, password: str):
@@ -34,9 +35,16 @@ class User(UserMixin, db.Model):
 
 class Match(db.Model):
     __tablename__ = "matches"
+    __table_args__ = (
+        # Per-player history, newest first (see match_history)
+        db.Index("ix_matches_p1_id_created_at", "p1_id", "created_at"),
+        db.Index("ix_matches_p2_id_created_at", "p2_id", "created_at"),
+        db.Index("ix_matches_winner_id", "winner_id"),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    room = db.Column(db.String(128), nullable=False, index=True)
+    # Unique so the match writer can insert idempotently (see match_results)
+    room = db.Column(db.String(128), nullable=False, index=True, unique=True)
     
     p1_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     p2_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
@@ -55,3 +63,42 @@ class Match(db.Model):
 
     def __repr__(self):
         return f"<Match {self.room}: {self.p1_id} ({self.score_p1}) vs {self.p2_id} ({self.score_p2})>"
+
+
+class PlayerStats(db.Model):
+    """Per-player aggregates, maintained incrementally as matches are saved (see player_stats)."""
+    __tablename__ = "player_stats"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+
+    games_played = db.Column(db.Integer, default=0, nullable=False)
+    words_solved = db.Column(db.Integer, default=0, nullable=False)
+    best_score = db.Column(db.Integer, default=0, nullable=False)
+    current_streak = db.Column(db.Integer, default=0, nullable=False)
+    longest_streak = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    @property
+    def average_score(self) -> float:
+        """Average words solved per game."""
+        if not self.games_played:
+            return 0.0
+        return self.words_solved / self.games_played
+
+    def __repr__(self):
+        return f"<PlayerStats {self.user_id}: {self.games_played} games>"
+
+
+class HeadToHead(db.Model):
+    """One player's record against one opponent (one row per direction)."""
+    __tablename__ = "head_to_head"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    opponent_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+
+    wins = db.Column(db.Integer, default=0, nullable=False)
+    losses = db.Column(db.Integer, default=0, nullable=False)
+    ties = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<HeadToHead {self.user_id} vs {self.opponent_id}: {self.wins}-{self.losses}-{self.ties}>"
@@ -0,0 +1,181 @@
+# player_stats.py
+"""
+Incrementally maintained player statistics.
+
+player_stats holds one row per player (games, words solved, best score,
+current and longest win streak) and head_to_head one row per (player,
+opponent) direction, so a profile or a rivalry record is a primary-key
+read. Both are updated by apply_results() from the match writer, in the
+same transaction that inserts the matches, and never by scanning the
+matches table. Missing rows are first inserted as zeros with ON CONFLICT
+DO NOTHING, so two writers handling a player's first games at once can't
+both insert one. Streaks depend on match order, so the affected
+player_stats rows are then read with SELECT ... FOR UPDATE (a no-op on
+SQLite, which serializes writers anyway) before the new values are
+written back; head-to-head counts are plain in-database increments.
+
+Rebuild both tables from the match history with:
+    python player_stats.py backfill
+(run it while no game worker is writing results).
+"""
+import sys
+from datetime import datetime
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from db import db
+from models import HeadToHead, Match, PlayerStats
+
+BACKFILL_CHUNK = 5000
+
+_STAT_FIELDS = ("games_played", "words_solved", "best_score", "current_streak", "longest_streak")
+
+
+def _fold(stats: dict, score: int, won: bool):
+    stats["games_played"] += 1
+    stats["words_solved"] += score
+    stats["best_score"] = max(stats["best_score"], score)
+    stats["current_streak"] = stats["current_streak"] + 1 if won else 0
+    stats["longest_streak"] = max(stats["longest_streak"], stats["current_streak"])
+
+
+def _insert_missing(model, rows: list, keys: list):
+    """Insert rows whose primary key (keys) isn't in the table yet."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        db.session.execute(dialect_insert(model).on_conflict_do_nothing(index_elements=keys), rows)
+        return
+
+    # No ON CONFLICT: insert row by row, each in a savepoint
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(model), [row])
+        except IntegrityError:
+            pass
+
+
+def apply_results(results: list):
+    """
+    Fold a batch of saved results (match_results dicts, in match order)
+    into player_stats and head_to_head. Runs inside the caller's
+    transaction; needs an app context.
+    """
+    if not results:
+        return
+    now = datetime.utcnow()
+
+    user_ids = {res["p1_id"] for res in results} | {res["p2_id"] for res in results}
+    _insert_missing(PlayerStats, [
+        {"user_id": uid, "updated_at": now, **dict.fromkeys(_STAT_FIELDS, 0)} for uid in user_ids
+    ], ["user_id"])
+    rows = db.session.execute(
+        select(PlayerStats.user_id, *(getattr(PlayerStats, f) for f in _STAT_FIELDS))
+        .where(PlayerStats.user_id.in_(user_ids))
+        .with_for_update()
+    ).all()
+    stats = {row[0]: dict(zip(_STAT_FIELDS, row[1:])) for row in rows}
+
+    pairs = {}  # (user_id, opponent_id) -> [wins, losses, ties]
+    for res in results:
+        winner = res["winner_id"]
+        for me, them, score in ((res["p1_id"], res["p2_id"], res["score_p1"]),
+                                (res["p2_id"], res["p1_id"], res["score_p2"])):
+            _fold(stats[me], score, winner == me)
+            counts = pairs.setdefault((me, them), [0, 0, 0])
+            counts[0 if winner == me else 2 if winner is None else 1] += 1
+
+    table = PlayerStats.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.user_id == bindparam("uid"))
+        .values(updated_at=now, **{f: bindparam(f"v_{f}") for f in _STAT_FIELDS}),
+        [{"uid": uid, **{f"v_{f}": stats[uid][f] for f in _STAT_FIELDS}} for uid in user_ids],
+    )
+
+    _insert_missing(HeadToHead, [
+        {"user_id": u, "opponent_id": o, "wins": 0, "losses": 0, "ties": 0} for u, o in pairs
+    ], ["user_id", "opponent_id"])
+    table = HeadToHead.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.user_id == bindparam("uid"), table.c.opponent_id == bindparam("oid"))
+        .values(wins=table.c.wins + bindparam("n_wins"),
+                losses=table.c.losses + bindparam("n_losses"),
+                ties=table.c.ties + bindparam("n_ties")),
+        [{"uid": u, "oid": o, "n_wins": n[0], "n_losses": n[1], "n_ties": n[2]}
+         for (u, o), n in pairs.items()],
+    )
+
+
+def profile(user_id: int) -> dict:
+    """A player's aggregates (zeros if they haven't finished a match)."""
+    row = db.session.get(PlayerStats, user_id)
+    if row is None:
+        return {"words_solved": 0, "best_score": 0, "average_score": 0.0,
+                "current_streak": 0, "longest_streak": 0}
+    return {
+        "words_solved": row.words_solved,
+        "best_score": row.best_score,
+        "average_score": round(row.average_score, 2),
+        "current_streak": row.current_streak,
+        "longest_streak": row.longest_streak,
+    }
+
+
+def record_against(user_id: int, opponent_id: int) -> dict:
+    """user_id's wins, losses and ties against opponent_id."""
+    row = db.session.get(HeadToHead, (user_id, opponent_id))
+    if row is None:
+        return {"wins": 0, "losses": 0, "ties": 0}
+    return {"wins": row.wins, "losses": row.losses, "ties": row.ties}
+
+
+def backfill(chunk: int = BACKFILL_CHUNK) -> int:
+    """
+    Rebuild player_stats and head_to_head from the matches table.
+
+    Matches are streamed in id order (the writer inserts them in the order
+    they finished) in keyset-paginated chunks, each folded in and committed
+    on its own, so memory stays flat. Returns the number of matches read.
+    """
+    db.session.execute(delete(HeadToHead))
+    db.session.execute(delete(PlayerStats))
+    db.session.commit()
+
+    last_id = 0
+    total = 0
+    while True:
+        rows = db.session.execute(
+            select(Match.id, Match.p1_id, Match.p2_id, Match.score_p1, Match.score_p2, Match.winner_id)
+            .where(Match.id > last_id)
+            .order_by(Match.id)
+            .limit(chunk)
+        ).all()
+        if not rows:
+            break
+        apply_results([
+            {"p1_id": p1, "p2_id": p2, "score_p1": s1, "score_p2": s2, "winner_id": winner}
+            for _, p1, p2, s1, s2, winner in rows
+        ])
+        db.session.commit()
+        last_id = rows[-1][0]
+        total += len(rows)
+        print(f"  {total} matches folded")
+    return total
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        print("usage: python player_stats.py backfill")
+        sys.exit(2)
+
+    from migrate import make_app_for_db
+
+    app = make_app_for_db()
+    with app.app_context():
+        count = backfill()
+    print(f"Player stats rebuilt from {count} matches")
@@ -0,0 +1,153 @@
+# presence.py
+"""
+Online presence.
+
+A user is online while user:<id>:online exists; the web tier refreshes it
+(SETEX ONLINE_TTL) whenever the user does something and deletes it on
+disconnect, and the matchmaker skips queued users whose key is gone.
+
+Refreshing on every socket event is wasteful: the key lives ONLINE_TTL
+(600 s) and a fast typist sends a guess every second or two. The
+PresenceCoalescer in each web process writes a user's key at most once
+per REFRESH_INTERVAL and batches those refreshes into one pipeline every
+FLUSH_INTERVAL. The first touch a process sees for a user, and forced
+touches (connect, joining the queue), are written immediately so a new
+or returning player is visible to the matchmaker straight away.
+
+A disconnect handled by another process deletes the key without clearing
+this process's record, so touches inside REFRESH_INTERVAL also re-check
+the key with SET NX (restoring it only if it's gone), at most once per
+CHECK_INTERVAL per user. CHECK_INTERVAL defaults to the client's 20 s
+heartbeat, so a deleted key comes back as soon as it would have without
+coalescing, and a player guessing every second costs about three
+commands a minute instead of sixty.
+"""
+import os
+import threading
+import time
+
+ONLINE_TTL = 600  # seconds
+ONLINE_KEY_FMT = "user:{uid}:online"
+
+REFRESH_INTERVAL = float(os.environ.get("PRESENCE_REFRESH_INTERVAL", "60"))
+FLUSH_INTERVAL = float(os.environ.get("PRESENCE_FLUSH_INTERVAL", "1"))
+CHECK_INTERVAL = float(os.environ.get("PRESENCE_CHECK_INTERVAL", "20"))
+
+
+def online_key(uid) -> str:
+    return ONLINE_KEY_FMT.format(uid=uid)
+
+
+def online_many(r, uids) -> list:
+    """Presence of each user id, in order, with one MGET."""
+    uids = list(uids)
+    if not uids:
+        return []
+    return [bool(v) for v in r.mget([online_key(uid) for uid in uids])]
+
+
+class PresenceCoalescer:
+    """
+    Rate-limits and batches presence refreshes for one process.
+
+    Args:
+        redis_client: Redis client
+        refresh_interval: Minimum seconds between writes for one user
+            (must stay well below ttl)
+        flush_interval: Seconds between batched flushes
+        check_interval: Minimum seconds between SET NX re-checks for one user
+        ttl: Lifetime of the presence key
+
+    touches counts calls to touch(); commands counts the SETEX and SET NX
+    commands actually sent to Redis, and restored the re-checks that found
+    the key gone.
+    """
+
+    def __init__(self, redis_client, refresh_interval: float = REFRESH_INTERVAL,
+                 flush_interval: float = FLUSH_INTERVAL, check_interval: float = CHECK_INTERVAL,
+                 ttl: int = ONLINE_TTL):
+        self.r = redis_client
+        self.refresh_interval = refresh_interval
+        self.flush_interval = flush_interval
+        self.check_interval = check_interval
+        self.ttl = ttl
+        self._last = {}  # uid -> monotonic time of its last write (or queued write)
+        self._checked = {}  # uid -> monotonic time of its last queued re-check
+        self._pending = set()
+        self._checks = set()  # uids to SET NX in the next batch
+        self._lock = threading.Lock()
+        self._flusher = None
+        self.touches = 0
+        self.commands = 0
+        self.restored = 0
+
+    def touch(self, uid, force: bool = False):
+        """Note activity for uid; writes now, later in a batch, or not at all."""
+        uid = str(uid)
+        now = time.monotonic()
+        with self._lock:
+            self.touches += 1
+            last = self._last.get(uid)
+            if not force and last is not None and now - last < self.refresh_interval:
+                checked = max(last, self._checked.get(uid, last))
+                if uid not in self._pending and now - checked >= self.check_interval:
+                    self._checked[uid] = now
+                    self._checks.add(uid)
+                    self._ensure_flusher()
+                return
+            self._last[uid] = now
+            self._checked.pop(uid, None)
+            if not force and last is not None:
+                self._pending.add(uid)
+                self._checks.discard(uid)
+                self._ensure_flusher()
+                return
+            self._pending.discard(uid)
+            self._checks.discard(uid)
+        self._write([uid])
+
+    def forget(self, uid):
+        """The user's key was deleted (disconnect); their next touch writes at once."""
+        uid = str(uid)
+        with self._lock:
+            self._last.pop(uid, None)
+            self._checked.pop(uid, None)
+            self._pending.discard(uid)
+            self._checks.discard(uid)
+
+    def flush(self):
+        """Write every pending refresh and re-check in one pipeline."""
+        with self._lock:
+            pending, self._pending = self._pending, set()
+            checks, self._checks = self._checks, set()
+            # Entries older than the TTL can't suppress a write any more
+            cutoff = time.monotonic() - self.ttl
+            if len(self._last) > 10000:
+                self._last = {uid: t for uid, t in self._last.items() if t > cutoff}
+                self._checked = {uid: t for uid, t in self._checked.items() if uid in self._last}
+        if pending or checks:
+            self._write(pending, checks)
+
+    def _write(self, uids, checks=()):
+        uids = list(uids)
+        try:
+            pipe = self.r.pipeline(transaction=False)
+            for uid in uids:
+                pipe.setex(online_key(uid), self.ttl, "1")
+            for uid in checks:
+                pipe.set(online_key(uid), "1", ex=self.ttl, nx=True)
+            results = pipe.execute()
+            self.commands += len(results)
+            self.restored += sum(1 for ok in results[len(uids):] if ok)
+        except Exception:
+            pass
+
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._run, name="presence-flusher", daemon=True)
+            self._flusher.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
@@ -0,0 +1,242 @@
+# profiling.py
+"""
+On-demand profiling and hub-stall detection for a web process.
+
+Every greenlet of an eventlet web process shares one OS thread, so a call
+that blocks without yielding (password hashing, a synchronous DB commit,
+a slow Redis reply) freezes every connected player. Two tools help find
+such calls:
+
+- Capture: cProfile for a time window, or for every call of one handler
+  (an HTTP route rule such as "/login", or a Socket.IO event such as
+  "submit_guess"), started at runtime through the admin endpoints. Other
+  greenlets that run while a profiled handler waits on I/O are included,
+  so look at tottime rather than cumtime for handler captures.
+- StallDetector: a heartbeat greenlet records when the hub last ran; a
+  native OS thread checks it and, when the hub hasn't come round for
+  longer than STALL_THRESHOLD_MS, logs the stack of whatever is running
+  on the hub thread and keeps it for the admin endpoint. It is started
+  with PROFILING_ENABLED=1 and is a no-op outside eventlet.
+
+Captures and stalls are per process; with several web processes each
+admin request reaches only the one that served it (see "pid").
+"""
+import cProfile
+import collections
+import contextlib
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+STALL_THRESHOLD_MS = float(os.environ.get("STALL_THRESHOLD_MS", "100"))
+HEARTBEAT_INTERVAL = 0.02  # seconds between hub heartbeats
+MAX_CAPTURE_SECONDS = 300
+STALLS_KEPT = 50
+
+
+def _green() -> bool:
+    """True in a monkey-patched eventlet process (all greenlets on one OS thread)."""
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return False
+    return patcher.is_monkey_patched("thread")
+
+
+class Capture:
+    """One cProfile capture at a time: a time window or a single handler."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profile = None
+        self._target = None  # None = everything on this thread, else a handler name
+        self._until = 0.0
+        self._depth = 0
+        self._calls = 0
+        self._started_at = None
+        self._last = None  # report of the last finished capture
+
+    def start(self, seconds: float, handler: str | None = None) -> dict:
+        """
+        Begin a capture. Raises ValueError for parameters this process can't
+        capture with and RuntimeError if a capture is already running.
+        """
+        if handler is None and not _green():
+            # cProfile only sees the thread that enables it, which here
+            # would be the admin request's own
+            raise ValueError("Time-window captures need the eventlet worker; capture a handler")
+        seconds = max(1.0, min(float(seconds), MAX_CAPTURE_SECONDS))
+        with self._lock:
+            if self._profile is not None:
+                raise RuntimeError("A capture is already running")
+            self._profile = cProfile.Profile()
+            self._target = handler
+            self._until = time.monotonic() + seconds
+            self._depth = 0
+            self._calls = 0
+            self._started_at = time.time()
+        if handler is None:
+            self._profile.enable()
+        # Green under eventlet, so the stop runs on the hub thread that was profiled
+        timer = threading.Timer(seconds, self.stop)
+        timer.daemon = True
+        timer.start()
+        return self.status()
+
+    def stop(self):
+        """End the running capture (if any) and keep its stats."""
+        with self._lock:
+            profile, self._profile = self._profile, None
+            if profile is None:
+                return
+            target, calls, started_at = self._target, self._calls, self._started_at
+        profile.disable()
+        out = io.StringIO()
+        try:
+            pstats.Stats(profile, stream=out).sort_stats("tottime").print_stats(60)
+        except TypeError:
+            out.write("No calls were captured\n")
+        what = f"handler {target} ({calls} calls)" if target else "time window"
+        self._last = {
+            "capture": what,
+            "started_at": started_at,
+            "seconds": round(time.time() - started_at, 1),
+            "stats": out.getvalue(),
+        }
+
+    @contextlib.contextmanager
+    def around(self, handler: str):
+        """Profile this call if it is the handler being captured."""
+        profile = self._profile
+        if profile is None or self._target != handler:
+            yield
+            return
+        if time.monotonic() > self._until:
+            self.stop()
+            yield
+            return
+        with self._lock:
+            self._calls += 1
+            self._depth += 1
+            if self._depth == 1:
+                profile.enable()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._depth -= 1
+                if self._depth == 0:
+                    profile.disable()
+
+    def status(self) -> dict:
+        with self._lock:
+            running = self._profile is not None
+            return {
+                "pid": os.getpid(),
+                "running": running,
+                "target": self._target if running else None,
+                "seconds_left": max(0.0, round(self._until - time.monotonic(), 1)) if running else 0,
+                "calls": self._calls if running else 0,
+            }
+
+    def last(self) -> dict | None:
+        return self._last
+
+
+class StallDetector:
+    """
+    Log the hub thread's stack whenever the eventlet hub stalls.
+
+    Args:
+        threshold_ms: Stall length that triggers a report
+        keep: Most recent stalls kept for the admin endpoint
+    """
+
+    def __init__(self, threshold_ms: float = STALL_THRESHOLD_MS, keep: int = STALLS_KEPT):
+        self.threshold = threshold_ms / 1000.0
+        self.stalls = collections.deque(maxlen=keep)
+        self._beat = time.monotonic()
+        self._hub_ident = None
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self) -> bool:
+        """Start once per process; returns False when not running under eventlet."""
+        with self._lock:
+            if self._started:
+                return True
+            try:
+                import eventlet
+                from eventlet import patcher
+            except ImportError:
+                return False
+            if not _green():
+                return False
+            self._started = True
+
+        self._hub_ident = patcher.original("threading").get_ident()
+        eventlet.spawn(self._heartbeat, eventlet.sleep)
+        native = patcher.original("threading").Thread(
+            target=self._watch, args=(patcher.original("time").sleep,),
+            name="stall-detector", daemon=True,
+        )
+        native.start()
+        print(f"Hub stall detector started (threshold {self.threshold * 1000:.0f} ms)")
+        return True
+
+    def _heartbeat(self, sleep):
+        while True:
+            self._beat = time.monotonic()
+            sleep(HEARTBEAT_INTERVAL)
+
+    def _watch(self, sleep):
+        """Runs on a native thread, so it keeps going while the hub is blocked."""
+        current = None  # (heartbeat, record) of the stall being reported
+        while True:
+            sleep(self.threshold / 2)
+            beat = self._beat
+            if current is not None and beat != current[0]:
+                # The hub is back; record how long the stall really lasted
+                current[1]["stalled_ms"] = round((beat - current[0] - HEARTBEAT_INTERVAL) * 1000)
+                current = None
+            stalled = time.monotonic() - beat
+            if stalled < self.threshold or current is not None:
+                continue
+            frame = sys._current_frames().get(self._hub_ident)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(no frame)"
+            record = {"at": time.time(), "stalled_ms": round(stalled * 1000), "stack": stack}
+            self.stalls.append(record)
+            current = (beat, record)
+            print(f"Hub stalled for over {stalled * 1000:.0f} ms; blocking stack:\n{stack}")
+
+    def recent(self) -> list:
+        return list(self.stalls)
+
+
+capture = Capture()
+stall_detector = StallDetector()
+
+
+def instrument_flask(app):
+    """Profile HTTP routes on demand and start the stall detector if enabled."""
+    from flask import g, request
+
+    @app.before_request
+    def _begin_capture():
+        if PROFILING_ENABLED:
+            stall_detector.start()
+        if capture._profile is not None and request.url_rule is not None:
+            stack = contextlib.ExitStack()
+            stack.enter_context(capture.around(request.url_rule.rule))
+            g._profiling_stack = stack
+
+    @app.teardown_request
+    def _end_capture(exc):
+        stack = g.pop("_profiling_stack", None)
+        if stack is not None:
+            stack.close()
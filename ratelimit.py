@@ -0,0 +1,195 @@
+# ratelimit.py
+"""
+Token-bucket rate limiting in Redis, per user and per client IP.
+
+Each (action, scope, identity) has a bucket holding up to `capacity`
+tokens that refills at capacity / period tokens per second; a request
+spends one token or is rejected with the time until one is available.
+The refill-and-spend is one Lua script using the Redis server clock, so
+every web process shares the same buckets and never races on them. The
+user and IP buckets of a request are checked together by one call of the
+script, which spends from them only if all of them have a token: a
+request one scope rejects doesn't use up the other's allowance.
+
+Limits are "capacity/period_seconds" strings, overridable per action and
+scope with RATELIMIT_<ACTION>_<SCOPE> (e.g. RATELIMIT_GUESS_USER=10/5);
+RATELIMIT_ENABLED=0 turns limiting off. Checks run before any database
+or dictionary work: users are identified from the session (or the
+username being tried, for register, and that username together with the
+client IP for login, so nobody can lock another account out), never by
+loading them, and a Redis failure lets the request through.
+"""
+import math
+import os
+from functools import wraps
+
+from flask import jsonify, request
+
+from redis_scripts import cached_script
+
+KEY_PREFIX = "ratelimit"
+
+RATELIMIT_ENABLED = os.environ.get("RATELIMIT_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# Proxies in front of the web tier that append to X-Forwarded-For; 0 uses
+# the socket peer address. On Railway every request arrives through its
+# edge proxy, so the peer address is the proxy's and one hop is trusted
+# by default there (otherwise every client would share one IP bucket).
+TRUSTED_PROXIES = int(os.environ.get(
+    "RATELIMIT_TRUSTED_PROXIES", "1" if os.environ.get("RAILWAY_ENVIRONMENT") else "0"
+))
+
+# action -> scope -> "capacity/period_seconds"
+DEFAULT_LIMITS = {
+    "guess": {"user": "10/5", "ip": "60/5"},
+    "queue": {"user": "5/30", "ip": "30/30"},
+    "login": {"user": "10/300", "ip": "20/60"},
+    "register": {"user": "3/300", "ip": "5/300"},
+}
+
+# Refill every bucket and spend from all of them only if all allow.
+# KEYS: bucket hashes   ARGV: cost, then capacity and refill per second per key
+# Returns {seconds until allowed (string, "0" if allowed), then per key
+# 1 if that bucket lacked the tokens}
+TOKEN_BUCKET_LUA = """
+local cost = tonumber(ARGV[1])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local tokens = {}
+local short = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local level = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens[i] = math.min(capacity, level + math.max(0, now - ts) * rate)
+    short[i] = 0
+    if tokens[i] < cost then
+        short[i] = 1
+        wait = math.max(wait, (cost - tokens[i]) / rate)
+    end
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    local level = tokens[i]
+    if wait == 0 then
+        level = level - cost
+    end
+    redis.call('HSET', key, 'tokens', tostring(level), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000))
+end
+local result = {tostring(wait)}
+for i = 1, #short do
+    result[i + 1] = short[i]
+end
+return result
+"""
+
+
+def parse_limit(spec: str) -> tuple:
+    """Parse "capacity/period_seconds" into (capacity, refill per second)."""
+    capacity, _, period = spec.partition("/")
+    capacity, period = float(capacity), float(period or 1)
+    if capacity <= 0 or period <= 0:
+        raise ValueError(f"Invalid rate limit {spec!r}")
+    return capacity, capacity / period
+
+
+def load_limits(defaults: dict = DEFAULT_LIMITS) -> dict:
+    """Default limits with any RATELIMIT_<ACTION>_<SCOPE> overrides applied."""
+    limits = {}
+    for action, scopes in defaults.items():
+        limits[action] = {
+            scope: parse_limit(os.environ.get(f"RATELIMIT_{action.upper()}_{scope.upper()}", spec))
+            for scope, spec in scopes.items()
+        }
+    return limits
+
+
+def bucket_key(action: str, scope: str, identity) -> str:
+    return f"{KEY_PREFIX}:{action}:{scope}:{identity}"
+
+
+def client_ip() -> str:
+    """
+    The client address: the X-Forwarded-For entry added by the outermost
+    of TRUSTED_PROXIES proxies (each appends the address it was reached
+    from; anything earlier is client-supplied and can't be trusted).
+    """
+    if TRUSTED_PROXIES and request.headers.get("X-Forwarded-For"):
+        route = request.access_route
+        return route[-min(TRUSTED_PROXIES, len(route))]
+    return request.remote_addr or "unknown"
+
+
+class RateLimiter:
+    """
+    Args:
+        redis_client: Redis client (decode_responses=True)
+        limits: action -> scope -> (capacity, refill per second); see load_limits
+        enabled: False makes every check pass
+        on_reject: Called with (action, scope) for each rejection
+    """
+
+    def __init__(self, redis_client, limits=None, enabled: bool = RATELIMIT_ENABLED, on_reject=None):
+        self.r = redis_client
+        self.limits = load_limits() if limits is None else limits
+        self.enabled = enabled
+        self.on_reject = on_reject
+
+    def hit(self, action: str, user=None, ip=None) -> float | None:
+        """
+        Spend a token from each of the action's buckets that applies.
+
+        Returns None if the request may proceed, otherwise the seconds
+        until it would be allowed.
+        """
+        if not self.enabled:
+            return None
+        checks = [(scope, identity) for scope, identity in (("user", user), ("ip", ip))
+                  if identity is not None and scope in self.limits.get(action, {})]
+        if not checks:
+            return None
+
+        args = [1]
+        for scope, _ in checks:
+            args.extend(self.limits[action][scope])
+        try:
+            wait, *short = cached_script(self.r, TOKEN_BUCKET_LUA)(
+                keys=[bucket_key(action, scope, identity) for scope, identity in checks], args=args
+            )
+        except Exception:
+            return None  # fail open: a Redis outage shouldn't lock everyone out
+
+        if not any(int(s) for s in short):
+            return None
+        if self.on_reject:
+            for (scope, _), s in zip(checks, short):
+                if int(s):
+                    self.on_reject(action, scope)
+        return float(wait)
+
+    def limit(self, action: str, user_fn=None):
+        """
+        Decorator rejecting over-limit HTTP requests with 429 before the
+        view (or login_required beneath it) runs.
+
+        Args:
+            action: Key into the limits table
+            user_fn: Returns the user identity for this request, or None
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                retry_after = self.hit(action, user=user_fn() if user_fn else None, ip=client_ip())
+                if retry_after is not None:
+                    resp = jsonify({"error": "Too many requests", "retry_after": round(retry_after, 1)})
+                    resp.status_code = 429
+                    resp.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+                    return resp
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
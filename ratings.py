@@ -0,0 +1,43 @@
+"""
+Elo-style player ratings.
+
+Ratings start at DEFAULT_RATING and move after every finished match by
+K * (actual - expected). New players use a larger K so they reach their
+level quickly, Glicko-style, before settling to the regular K.
+"""
+
+DEFAULT_RATING = 1500.0
+
+K_PROVISIONAL = 40.0
+K_ESTABLISHED = 20.0
+PROVISIONAL_GAMES = 30
+
+
+def expected_score(rating_a: float, rating_b: float) -> float:
+    """Probability that a player rated rating_a beats one rated rating_b."""
+    return 1.0 / (1.0 + 10 ** ((rating_b - rating_a) / 400.0))
+
+
+def k_factor(games_played: int) -> float:
+    return K_PROVISIONAL if (games_played or 0) < PROVISIONAL_GAMES else K_ESTABLISHED
+
+
+def rating_deltas(rating_1: float, rating_2: float, winner: int | None,
+                  games_1: int = 0, games_2: int = 0) -> tuple:
+    """
+    Rating changes for both players of one match.
+
+    Args:
+        rating_1, rating_2: Ratings before the match
+        winner: 1 or 2 for the winning player, None for a tie
+        games_1, games_2: Games each player had played before this one
+
+    Returns:
+        (delta_1, delta_2)
+    """
+    actual_1 = 0.5 if winner is None else (1.0 if winner == 1 else 0.0)
+    exp_1 = expected_score(rating_1, rating_2)
+    delta_1 = k_factor(games_1) * (actual_1 - exp_1)
+    delta_2 = k_factor(games_2) * ((1.0 - actual_1) - (1.0 - exp_1))
+    return delta_1, delta_2
+
@@ -0,0 +1,17 @@
+# redis_scripts.py
+"""
+Shared cache of registered Lua scripts.
+
+Each script is registered once per process and keyed by its source; the
+Script object runs against whichever client (or pipeline) is passed as
+client=, so modules can share one across connections.
+"""
+_scripts = {}
+
+
+def cached_script(r, source: str):
+    """Return a cached Script object; it runs against whichever client is passed."""
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = r.register_script(source)
+    return script
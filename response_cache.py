@@ -0,0 +1,196 @@
+# response_cache.py
+"""
+Two-tier cache for JSON GET responses.
+
+A small per-process LRU (entries live LOCAL_TTL seconds) sits in front of a
+shared Redis tier (REDIS_TTL seconds), so a lobby refresh storm is served
+from memory and only the first request in each process after a change
+reaches Redis, and only the first across all processes reaches the view
+(and the database). Every cached response carries an ETag; a request whose
+If-None-Match matches gets an empty 304.
+
+Entries are grouped by name ("stats", "leaderboard") and keyed by a
+variant (user id, query string). When matches are saved, invalidate()
+deletes the affected Redis entries and publishes a cache_invalidate event
+on EVENT_CHANNEL so each web process drops its local copies too.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, Response
+
+from game import EVENT_CHANNEL
+from redis_scripts import cached_script
+
+KEY_PREFIX = "respcache"
+REDIS_TTL = 60
+LOCAL_TTL = 5
+LOCAL_SIZE = 1024
+
+INVALIDATE_EVENT = "cache_invalidate"
+
+# Drop every entry of one name.  KEYS: variant index set   ARGV: entry key prefix
+INVALIDATE_ALL_LUA = """
+local variants = redis.call('SMEMBERS', KEYS[1])
+for _, v in ipairs(variants) do
+    redis.call('DEL', ARGV[1] .. v)
+end
+redis.call('DEL', KEYS[1])
+return #variants
+"""
+
+
+def entry_prefix(name: str) -> str:
+    # Hash-tagged by name so the index and its entries share a cluster slot
+    return f"{KEY_PREFIX}:{{{name}}}:"
+
+
+def entry_key(name: str, variant: str) -> str:
+    return entry_prefix(name) + variant
+
+
+def index_key(name: str) -> str:
+    return f"{KEY_PREFIX}:{{{name}}}"
+
+
+class LocalLRU:
+    """Thread-safe LRU of (name, variant) -> (expires_at, etag, body)."""
+
+    def __init__(self, size: int = LOCAL_SIZE, ttl: float = LOCAL_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def set(self, key, etag: str, body: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def drop(self, name: str, variants=None):
+        """Forget one name's entries (all of them when variants is None)."""
+        with self._lock:
+            if variants is None:
+                for key in [k for k in self._entries if k[0] == name]:
+                    del self._entries[key]
+            else:
+                for variant in variants:
+                    self._entries.pop((name, str(variant)), None)
+
+
+class ResponseCache:
+    """
+    Args:
+        redis_client: Shared tier (decode_responses=True)
+        local_size, local_ttl: In-process LRU capacity and entry lifetime
+        redis_ttl: Lifetime of shared entries in seconds
+    """
+
+    def __init__(self, redis_client, local_size: int = LOCAL_SIZE,
+                 local_ttl: float = LOCAL_TTL, redis_ttl: int = REDIS_TTL):
+        self.r = redis_client
+        self.local = LocalLRU(local_size, local_ttl)
+        self.redis_ttl = redis_ttl
+
+    def get(self, name: str, variant: str):
+        """(etag, body) from the local tier, then Redis; None on a miss."""
+        hit = self.local.get((name, variant))
+        if hit is not None:
+            return hit
+        try:
+            etag, body = self.r.hmget(entry_key(name, variant), "etag", "body")
+        except Exception:
+            return None
+        if etag is None or body is None:
+            return None
+        self.local.set((name, variant), etag, body)
+        return etag, body
+
+    def set(self, name: str, variant: str, body: str) -> str:
+        """Store a response body in both tiers; returns its ETag."""
+        etag = hashlib.sha1(body.encode("utf-8")).hexdigest()
+        self.local.set((name, variant), etag, body)
+        try:
+            pipe = self.r.pipeline(transaction=True)
+            pipe.hset(entry_key(name, variant), mapping={"etag": etag, "body": body})
+            pipe.expire(entry_key(name, variant), self.redis_ttl)
+            pipe.sadd(index_key(name), variant)
+            pipe.expire(index_key(name), self.redis_ttl)
+            pipe.execute()
+        except Exception:
+            pass  # the local tier still has it
+        return etag
+
+    def handle_event(self, data: dict):
+        """Apply a cache_invalidate pubsub event to the local tier."""
+        self.local.drop(data.get("name"), data.get("variants"))
+
+    @staticmethod
+    def _respond(etag: str, body: str, cache_control: str) -> Response:
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        else:
+            resp = Response(body, mimetype="application/json")
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = cache_control
+        return resp
+
+    def cached(self, name: str, variant, cache_control: str = "no-cache"):
+        """
+        Decorator for a view returning a JSON response.
+
+        variant() returns the cache variant for the current request, or None
+        to bypass the cache. Only 200 responses are stored.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key = variant()
+                if key is None:
+                    return view(*args, **kwargs)
+                key = str(key)
+
+                hit = self.get(name, key)
+                if hit is not None:
+                    return self._respond(*hit, cache_control)
+
+                resp = view(*args, **kwargs)
+                if not isinstance(resp, Response) or resp.status_code != 200:
+                    return resp
+                etag = self.set(name, key, resp.get_data(as_text=True))
+                return self._respond(etag, resp.get_data(as_text=True), cache_control)
+            return wrapper
+        return decorator
+
+
+def invalidate(r, name: str, variants=None):
+    """
+    Drop cached responses for name (only the given variants, or all of
+    them) from Redis and tell every web process to drop its local copies.
+    """
+    if variants is None:
+        cached_script(r, INVALIDATE_ALL_LUA)(keys=[index_key(name)], args=[entry_prefix(name)], client=r)
+    else:
+        variants = [str(v) for v in variants]
+        pipe = r.pipeline(transaction=True)
+        pipe.delete(*(entry_key(name, v) for v in variants))
+        pipe.srem(index_key(name), *variants)
+        pipe.execute()
+    r.publish(EVENT_CHANNEL, json.dumps({"type": INVALIDATE_EVENT, "name": name, "variants": variants}))
@@ -0,0 +1,180 @@
+# room_cache.py
+"""
+Per-process cache of room state for the web tier.
+
+A room's meta (players, duration, start and end time) never changes, and
+a player's secret word only changes when they solve it. The RoomCache
+keeps both in a bounded LRU so the hot paths don't re-read them:
+submit_guess evaluates a wrong guess against the cached word without
+reading the room, and only a correct guess goes to Redis (through
+game.resolve_guess, which scores it atomically); match_info and
+surrender take the players from the cache. (A guess still costs the rate
+limiter's one round trip, which runs before anything else; see
+ratelimit.) After resolve_guess the process writes the new word into
+its own entry straight away rather than waiting for the notification.
+
+Entries are invalidated by the writes that change them: resolve_guess
+and mark_ended publish on the room's state channel
+(game.room_state_channel) from inside their scripts when they store a
+new word or end the game, and end_game_cleanup publishes when it deletes
+the room. Score updates publish nothing, since scores are never cached.
+While a socket in this process is in a room, the event router holds that
+channel and any message on it drops the entry. A room is only cached
+while its channel is live, fills that race with an invalidation are
+discarded, and the whole cache is cleared when the router reconnects.
+A room hash that simply expires announces nothing; MAX_AGE bounds how
+long its entry can outlive it.
+
+ROOM_CACHE_ENABLED=0 turns the cache off: callers go straight to Redis
+(submit_guess resolves every guess with the one resolve_guess round
+trip) and no state channels are subscribed.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import game as game_module
+
+ROOM_CACHE_ENABLED = os.environ.get("ROOM_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+CACHE_SIZE = int(os.environ.get("ROOM_CACHE_SIZE", "4096"))
+# Upper bound on an entry's life in case an invalidation is ever lost
+MAX_AGE = float(os.environ.get("ROOM_CACHE_MAX_AGE", "120"))
+
+IMMUTABLE_FIELDS = ("p1", "p2", "duration", "started_at", "ends_at")
+
+
+class RoomState:
+    """Cached view of one room: immutable meta and each player's current word."""
+
+    __slots__ = ("meta", "words", "loaded_at")
+
+    def __init__(self, meta: dict, words: dict):
+        self.meta = meta
+        self.words = words
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def from_hash(cls, data: dict) -> "RoomState":
+        meta = {k: data[k] for k in IMMUTABLE_FIELDS if k in data}
+        words = {k[len("word:"):]: v for k, v in data.items() if k.startswith("word:")}
+        return cls(meta, words)
+
+
+class RoomCache:
+    """
+    Args:
+        redis_client: Redis client (decode_responses=True)
+        router: The process's EventRouter, which owns the state channel subscriptions
+        size: Most rooms kept
+        max_age: Seconds an entry is trusted without being re-read
+        enabled: False bypasses the cache for every lookup
+        on_lookup: Called with "hit", "miss" or "bypass" for each lookup
+        on_invalidate: Called once per dropped entry
+    """
+
+    def __init__(self, redis_client, router, size: int = CACHE_SIZE, max_age: float = MAX_AGE,
+                 enabled: bool = ROOM_CACHE_ENABLED, on_lookup=None, on_invalidate=None):
+        self.r = redis_client
+        self.router = router
+        self.size = size
+        self.max_age = max_age
+        self.on_lookup = on_lookup
+        self.on_invalidate = on_invalidate
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._filling = {}  # room -> token of the fill in progress
+        self._lock = threading.Lock()
+        router.on_reset(self.clear)
+
+    # ---- invalidation plumbing ----
+    def channel(self, room: str) -> str:
+        return game_module.room_state_channel(room)
+
+    def is_invalidation(self, channel: str) -> bool:
+        return channel.startswith(game_module.room_state_channel(""))
+
+    def handle_invalidation(self, channel: str):
+        """Drop the room a state-channel message is about."""
+        self.invalidate(channel[len(game_module.room_state_channel("")):])
+
+    def caches(self, room: str) -> bool:
+        """
+        Whether lookups for the room are served from the cache; counts a
+        bypass when they aren't, so callers can skip get() and go straight
+        to Redis.
+        """
+        live = self._live(room)
+        if not live:
+            self._count("bypass")
+        return live
+
+    def _live(self, room: str) -> bool:
+        return self.enabled and self.router.is_live(self.channel(room))
+
+    # ---- cache ----
+    def get(self, room: str) -> RoomState | None:
+        """The room's state (from cache or Redis), or None if it's gone or has ended."""
+        live = self._live(room)
+        token = object()
+        with self._lock:
+            entry = self._entries.get(room)
+            if entry is not None:
+                if live and time.monotonic() - entry.loaded_at < self.max_age:
+                    self._entries.move_to_end(room)
+                else:
+                    del self._entries[room]
+                    entry = None
+            if entry is None and live:
+                self._filling[room] = token
+        if entry is not None:
+            self._count("hit")
+            return entry
+        self._count("miss" if live else "bypass")
+
+        data = self.r.hgetall(game_module.room_key(room))
+        if not data or data.get("ended"):
+            with self._lock:
+                if self._filling.get(room) is token:
+                    del self._filling[room]
+            return None
+        state = RoomState.from_hash(data)
+        if live:
+            with self._lock:
+                # Only if nothing invalidated the room while we were reading
+                if self._filling.get(room) is token:
+                    del self._filling[room]
+                    self._entries[room] = state
+                    while len(self._entries) > self.size:
+                        self._entries.popitem(last=False)
+        return state
+
+    def meta(self, room: str) -> dict:
+        """Immutable meta fields (no scores); {} if the room is gone or has ended."""
+        state = self.get(room)
+        return dict(state.meta) if state else {}
+
+    def update_word(self, room: str, player_id, word: str):
+        """Store a player's word as just read or written in Redis, if the room is cached."""
+        with self._lock:
+            # A fill that read the room before this change must not land
+            self._filling.pop(room, None)
+            entry = self._entries.get(room)
+            if entry is not None:
+                entry.words = {**entry.words, str(player_id): word}
+
+    def invalidate(self, room: str):
+        with self._lock:
+            self._filling.pop(room, None)
+            dropped = self._entries.pop(room, None) is not None
+        if dropped and self.on_invalidate:
+            self.on_invalidate()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._filling.clear()
+
+    def _count(self, result: str):
+        if self.on_lookup:
+            self.on_lookup(result)
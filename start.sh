@@ -4,6 +4,17 @@ set -euo pipefail
 
 echo "Starting Wordle Battle services..."
 
+# Bring the database schema up to date
+python3 migrate.py
+
+# Seed the Redis leaderboards from the matches table if they're missing
+python3 leaderboard.py rebuild --if-missing
+
+# Build the shared binary dictionary and guess-feedback matrix once so
+# every process just maps them
+python3 word_dictionary.py build
+python3 feedback_matrix.py build
+
 # Start matchmaker worker in background
 python3 matchmaker_worker.py &
 MATCHMAKER_PID=$!
@@ -14,9 +25,16 @@ python3 game_worker.py &
 GAME_WORKER_PID=$!
 echo "Game worker started (PID: $GAME_WORKER_PID)"
 
+# Web processes share their metrics through this directory so /metrics
+# reports all of them; it must start empty
+# (web processes only; the workers serve their own registries)
+METRICS_DIR=/tmp/wordle-web-metrics
+rm -rf "$METRICS_DIR" && mkdir -p "$METRICS_DIR"
+
 # Start web server in foreground
 echo "Starting web server on port $PORT"
-gunicorn --worker-class eventlet -w 1 app:app --bind 0.0.0.0:$PORT
+PROMETHEUS_MULTIPROC_DIR=$METRICS_DIR \
+    gunicorn --worker-class eventlet -w ${WEB_CONCURRENCY:-1} app:app --bind 0.0.0.0:$PORT
 
 # If gunicorn exits, kill background workers
 kill $MATCHMAKER_PID $GAME_WORKER_PID 2>/dev/null
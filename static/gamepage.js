@@ -1,7 +1,9 @@
 // gamepage.js - Multiplayer game client with active match restore + name display + surrender
 // UPDATED: auto-join matchmaking queue on /game load + cancel queue button
 
-const socket = io();
+// WebSocket only: with several web processes behind one port, polling
+// requests for one session could land on different processes
+const socket = io({ transports: ["websocket"] });
 
 let currentRoom = null;
 let isPlayer1 = null;
@@ -16,6 +18,13 @@ let currentGuesses = [];
 const maxRows = 6;
 
 let heartbeatInterval = null;
+let queueStatusInterval = null;
+
+// Game clock: the server sends an authoritative deadline (ends_at) and we
+// count down locally, correcting with each low-frequency resync.
+let endsAtMs = null;
+let clockOffsetMs = 0; // server time minus local time
+let clockInterval = null;
 
 // DOM elements
 const waitingArea = document.getElementById("waitingArea");
@@ -55,6 +64,31 @@ function stopHeartbeat() {
   heartbeatInterval = null;
 }
 
+function startQueueStatusPolling() {
+  stopQueueStatusPolling();
+  const ask = () => {
+    if (!matchStarted && socket && socket.connected) socket.emit("queue_status");
+  };
+  ask();
+  queueStatusInterval = setInterval(ask, 5000);
+}
+
+function stopQueueStatusPolling() {
+  if (queueStatusInterval) clearInterval(queueStatusInterval);
+  queueStatusInterval = null;
+}
+
+function renderQueueStatus(status) {
+  if (matchStarted || !status || !status.queued) return;
+  let text = `Searching for a match... You are #${status.position} of ${status.waiting} in queue`;
+  if (status.estimated_wait != null) {
+    text += status.estimated_wait > 0
+      ? ` (about ${formatTime(status.estimated_wait)} left)`
+      : " (any moment now)";
+  }
+  waitingStatus.textContent = text;
+}
+
 async function postJson(path, body = null) {
   const opts = { method: "POST", headers: { "Content-Type": "application/json" } };
   if (body) opts.body = JSON.stringify(body);
@@ -71,10 +105,12 @@ async function queueForMatch() {
     const res = await postJson("/queue");
     if (res.queued) {
       waitingStatus.textContent = "Searching for a match...";
+      startQueueStatusPolling();
       return true;
     }
     if (res._status === 400 && (res.error || "").toLowerCase().includes("already")) {
       waitingStatus.textContent = "Searching for a match...";
+      startQueueStatusPolling();
       return true;
     }
     waitingStatus.textContent = res.error || "Failed to join queue";
@@ -101,6 +137,26 @@ function formatTime(seconds) {
   return `${mins}:${secs.toString().padStart(2, "0")}`;
 }
 
+function renderClock() {
+  if (endsAtMs === null || matchEnded) return;
+  const remainingMs = endsAtMs - (Date.now() + clockOffsetMs);
+  timerElement.textContent = formatTime(Math.max(0, Math.ceil(remainingMs / 1000)));
+}
+
+function syncClock(data) {
+  if (data?.ends_at == null) return false;
+  endsAtMs = Number(data.ends_at);
+  if (data.server_now != null) clockOffsetMs = Number(data.server_now) - Date.now();
+  if (!clockInterval) clockInterval = setInterval(renderClock, 250);
+  renderClock();
+  return true;
+}
+
+function stopClock() {
+  if (clockInterval) clearInterval(clockInterval);
+  clockInterval = null;
+}
+
 function initGrid() {
   wordGrid.innerHTML = "";
   currentWordRow = 0;
@@ -180,6 +236,7 @@ function handleGameOver(data) {
   matchEnded = true;
   disableInputs(true);
   stopHeartbeat();
+  stopClock();
 
   gameResults.classList.remove("hidden");
 
@@ -267,9 +324,14 @@ socket.on("connected", (data) => {
   });
 });
 
+socket.on("queue_status", (status) => {
+  renderQueueStatus(status);
+});
+
 socket.on("match_found", (data) => {
   if (matchStarted && currentRoom) return;
   matchStarted = true;
+  stopQueueStatusPolling();
   matchEnded = false;
 
   currentRoom = data.room;
@@ -296,6 +358,7 @@ socket.on("match_found", (data) => {
 
 socket.on("timer_update", (data) => {
   if (matchEnded) return;
+  if (syncClock(data)) return;
   const t = Number(data.time_left ?? 0);
   timerElement.textContent = formatTime(Math.max(0, t));
 });
@@ -383,6 +446,7 @@ if (cancelQueueBtn) {
       waitingStatus.textContent = "Canceling queue...";
       await postJson("/queue/cancel");
       stopHeartbeat();
+      stopQueueStatusPolling();
       window.location.href = "/lobby";
     } catch (_) {
       cancelQueueBtn.disabled = false;
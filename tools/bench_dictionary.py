@@ -0,0 +1,81 @@
+"""
+Benchmark: text-file word set vs. the memory-mapped binary dictionary.
+
+Each loader runs in a fresh subprocess and reports the time to load the
+word list, the RSS it added, and the cost of a membership check and a
+random pick. "legacy" reproduces the old wordle_logic import (upper-case
+set plus list built from the text file); "binary" uses word_dictionary.
+
+Usage:
+    python tools/bench_dictionary.py
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def rss_kb() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def run_child(mode: str) -> dict:
+    import random
+
+    rss_before = rss_kb()
+    t0 = time.perf_counter()
+    if mode == "legacy":
+        with open(os.path.join(ROOT, "data", "valid_words.txt")) as f:
+            words = set(w.strip().upper() for w in f if w.strip())
+        words_list = list(words)
+        contains = words.__contains__
+        pick = lambda: random.choice(words_list)  # noqa: E731
+    else:
+        import word_dictionary
+        d = word_dictionary.get_dictionary()
+        contains = d.__contains__
+        pick = d.random
+    load_ms = (time.perf_counter() - t0) * 1000
+    rss_delta = rss_kb() - rss_before
+
+    n = 100_000
+    contains_ns = timeit.timeit(lambda: contains("CRANE"), number=n) / n * 1e9
+    random_ns = timeit.timeit(pick, number=n) / n * 1e9
+    return {
+        "mode": mode,
+        "load_ms": round(load_ms, 2),
+        "rss_delta_kb": rss_delta,
+        "contains_ns": round(contains_ns),
+        "random_ns": round(random_ns),
+    }
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        print(json.dumps(run_child(sys.argv[2])))
+        return
+
+    # Make sure the binary exists so "binary" measures the steady state
+    subprocess.run([sys.executable, os.path.join(ROOT, "word_dictionary.py"), "build"],
+                   check=True, capture_output=True)
+
+    print(f"{'loader':<8} {'load ms':>8} {'rss KiB':>8} {'contains ns':>12} {'random ns':>10}")
+    for mode in ("legacy", "binary"):
+        out = subprocess.run([sys.executable, __file__, "--child", mode],
+                             check=True, capture_output=True, text=True).stdout
+        res = json.loads(out.strip().splitlines()[-1])
+        print(f"{res['mode']:<8} {res['load_ms']:>8} {res['rss_delta_kb']:>8} "
+              f"{res['contains_ns']:>12} {res['random_ns']:>10}")
+
+
+if __name__ == "__main__":
+    main()
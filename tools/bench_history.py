@@ -0,0 +1,112 @@
+"""
+Benchmark: match history page fetch, keyset cursor vs. OFFSET.
+
+Seeds one player with --matches games against a pool of opponents (split
+between the p1 and p2 sides), then times fetching a page at increasing
+depths: match_history.user_history walking the cursor chain vs. the
+equivalent OR query with OFFSET. Keyset time should stay flat with depth.
+
+Runs against a throwaway SQLite file by default; --database-url points it
+at another scratch database (its tables are dropped and recreated).
+
+Usage:
+    python tools/bench_history.py --matches 50000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import insert, or_  # noqa: E402
+from db import db  # noqa: E402
+from models import Match, User  # noqa: E402
+import match_history  # noqa: E402
+
+PLAYER = 1
+OPPONENTS = 200
+REPEATS = 20
+
+
+def seed(matches: int):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(insert(User), [
+        {"id": i, "username": f"bench{i}", "password_hash": "x"} for i in range(1, OPPONENTS + 2)
+    ])
+    start = datetime(2024, 1, 1)
+    rows = []
+    for i in range(matches):
+        opponent = 2 + i % OPPONENTS
+        p1, p2 = (PLAYER, opponent) if i % 2 else (opponent, PLAYER)
+        rows.append({"room": f"bench-{i}", "p1_id": p1, "p2_id": p2, "score_p1": i % 7,
+                     "score_p2": i % 5, "winner_id": p1, "duration": 300,
+                     "created_at": start + timedelta(seconds=37 * i)})
+    for chunk in range(0, len(rows), 5000):
+        db.session.execute(insert(Match), rows[chunk:chunk + 5000])
+    db.session.commit()
+
+
+def time_call(fn) -> float:
+    t0 = time.perf_counter()
+    for _ in range(REPEATS):
+        fn()
+    return (time.perf_counter() - t0) / REPEATS * 1000
+
+
+def offset_page(offset: int, limit: int):
+    return (Match.query
+            .filter(or_(Match.p1_id == PLAYER, Match.p2_id == PLAYER))
+            .order_by(Match.created_at.desc(), Match.id.desc())
+            .offset(offset).limit(limit).all())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--matches", type=int, default=50000)
+    parser.add_argument("--limit", type=int, default=match_history.DEFAULT_PAGE_SIZE)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    tmp = None
+    url = args.database_url
+    if not url:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        url = f"sqlite:///{tmp.name}"
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = url
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+
+    try:
+        with app.app_context():
+            seed(args.matches)
+            pages = args.matches // args.limit
+            depths = sorted({0, pages // 100, pages // 10, pages // 2, pages - 1})
+
+            # Collect the cursor for each depth by walking the chain once
+            cursors = {}
+            cursor = None
+            for page in range(pages):
+                if page in depths:
+                    cursors[page] = cursor
+                cursor = match_history.user_history(PLAYER, args.limit, cursor)["next_cursor"]
+
+            print(f"{'page':>6} {'keyset ms':>10} {'offset ms':>10}")
+            for page in depths:
+                keyset = time_call(lambda: match_history.user_history(PLAYER, args.limit, cursors[page]))
+                offset = time_call(lambda: offset_page(page * args.limit, args.limit))
+                print(f"{page:>6} {keyset:>10.2f} {offset:>10.2f}")
+            db.drop_all()
+    finally:
+        if tmp is not None:
+            os.unlink(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark: match persistence, per-match transactions vs. batched writes.
+
+"per-match" replays the old finalization path for every result: insert a
+Match, load both users, read-modify-write their totals and commit.
+"batched" feeds the same results through match_results.persist_batch in
+batches of --batch-size. Both start from a fresh schema with --users
+players. Reports matches persisted per second.
+
+Runs against a throwaway SQLite file by default; pass --database-url
+(repeatable) to also measure e.g. PostgreSQL. The benchmark drops and
+recreates the tables it uses, so only point it at a scratch database.
+
+Usage:
+    python tools/bench_match_writer.py --matches 5000 --batch-size 500 \\
+        --database-url postgresql://localhost/wordle_bench
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from db import db  # noqa: E402
+from models import Match, User  # noqa: E402
+import match_results  # noqa: E402
+import ratings  # noqa: E402
+
+
+def make_app(url: str) -> Flask:
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = url
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    return app
+
+
+def reset(users: int):
+    db.drop_all()
+    db.create_all()
+    db.session.add_all(User(id=i, username=f"bench{i}", password_hash="x") for i in range(1, users + 1))
+    db.session.commit()
+
+
+def make_results(n: int, users: int) -> list:
+    results = []
+    now = time.time()
+    for i in range(n):
+        p1, p2 = random.sample(range(1, users + 1), 2)
+        s1, s2 = random.randint(0, 8), random.randint(0, 8)
+        winner = p1 if s1 > s2 else p2 if s2 > s1 else None
+        results.append({
+            "room": f"bench-{i}", "p1_id": p1, "p2_id": p2, "score_p1": s1, "score_p2": s2,
+            "winner_id": winner, "duration": 300, "ended_at": now + i * 1e-3,
+        })
+    return results
+
+
+def per_match(results):
+    for res in results:
+        db.session.add(Match(room=res["room"], p1_id=res["p1_id"], p2_id=res["p2_id"],
+                             score_p1=res["score_p1"], score_p2=res["score_p2"],
+                             winner_id=res["winner_id"], duration=res["duration"]))
+        user1 = db.session.get(User, res["p1_id"])
+        user2 = db.session.get(User, res["p2_id"])
+        slot = None if res["winner_id"] is None else (1 if res["winner_id"] == user1.id else 2)
+        d1, d2 = ratings.rating_deltas(user1.rating, user2.rating, slot,
+                                       user1.total_games, user2.total_games)
+        user1.rating += d1
+        user2.rating += d2
+        for user in (user1, user2):
+            user.total_games += 1
+            if res["winner_id"] == user.id:
+                user.total_wins += 1
+        db.session.commit()
+
+
+def batched(results, batch_size: int):
+    for start in range(0, len(results), batch_size):
+        match_results.persist_batch(results[start:start + batch_size])
+
+
+def run(url: str, matches: int, users: int, batch_size: int):
+    app = make_app(url)
+    results = make_results(matches, users)
+    label = url.split("://")[0]
+    with app.app_context():
+        for mode in ("per-match", "batched"):
+            reset(users)
+            t0 = time.perf_counter()
+            if mode == "batched":
+                batched(results, batch_size)
+            else:
+                per_match(results)
+            elapsed = time.perf_counter() - t0
+            saved = Match.query.count()
+            games = db.session.query(db.func.sum(User.total_games)).scalar()
+            print(f"{label:<12} {mode:<10} {matches / elapsed:>9.1f} matches/s  "
+                  f"({saved} rows, {games} player-games)")
+        db.drop_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--matches", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=match_results.FLUSH_BATCH)
+    parser.add_argument("--database-url", action="append", default=[])
+    args = parser.parse_args()
+
+    urls = list(args.database_url)
+    tmp = None
+    if not urls:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        urls.append(f"sqlite:///{tmp.name}")
+    try:
+        for url in urls:
+            run(url, args.matches, args.users, args.batch_size)
+    finally:
+        if tmp is not None:
+            os.unlink(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark: matchmaking throughput, single vs. batch vs. rating pairing.
+
+Queues N synthetic online players, then times how long each mode takes to
+pair all of them and reports matches per second. Rating mode gives players
+normally distributed ratings (or, with --tied, everyone the default rating
+as for a queue of new players) and is timed over the first half of the
+matches (the tail waits for windows to widen); run it at several --players
+sizes to check that throughput doesn't fall as the queue grows. Uses REDIS_URL (a local
+Redis is expected; the benchmark writes bench-scoped user ids and cleans
+up the rooms it creates) or fakeredis with --fake.
+
+Usage:
+    python tools/bench_matchmaker.py --players 2000 --batch-size 100
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import game  # noqa: E402
+import matchmaker_worker  # noqa: E402
+import matchmaking  # noqa: E402
+import presence  # noqa: E402
+from ratings import DEFAULT_RATING  # noqa: E402
+
+USER_ID_BASE = 900_000_000  # well clear of real user ids
+
+
+def make_redis(fake: bool):
+    if fake:
+        import fakeredis
+        return fakeredis.FakeRedis(decode_responses=True)
+    import redis
+    return redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379/0"),
+                          decode_responses=True)
+
+
+def seed(r, n: int, rated: bool = False, tied: bool = False) -> list:
+    uids = [str(USER_ID_BASE + i) for i in range(n)]
+    pipe = r.pipeline(transaction=False)
+    for uid in uids:
+        pipe.setex(presence.online_key(uid), presence.ONLINE_TTL, "1")
+        pipe.delete(game.active_match_key(uid))
+    now = time.time()
+    pipe.zadd(matchmaking.QUEUE_KEY, {uid: now + i * 1e-6 for i, uid in enumerate(uids)})
+    if rated:
+        pipe.zadd(matchmaking.RATING_KEY, {
+            uid: DEFAULT_RATING if tied else random.gauss(DEFAULT_RATING, 200) for uid in uids
+        })
+    pipe.execute()
+    return uids
+
+
+def cleanup(r, uids):
+    pipe = r.pipeline(transaction=False)
+    for uid in uids:
+        match = r.get(game.active_match_key(uid))
+        if match:
+            room = match.rpartition("|")[0]
+            pipe.delete(game.room_key(room))
+            pipe.zrem(game.DEADLINE_INDEX_KEY, room)
+        pipe.delete(game.active_match_key(uid), presence.online_key(uid))
+    pipe.zrem(matchmaking.QUEUE_KEY, *uids)
+    pipe.zrem(matchmaking.RATING_KEY, *uids)
+    pipe.execute()
+
+
+def run(r, mode: str, n: int, batch_size: int, tied: bool = False) -> float:
+    uids = seed(r, n, rated=mode == "rating", tied=tied)
+    expected = n // 4 if mode == "rating" else n // 2
+    made = 0
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        while made < expected:
+            if mode == "batch":
+                made += matchmaker_worker.match_batch(batch_size, timeout=1)
+            elif mode == "rating":
+                made += matchmaker_worker.match_by_rating()
+            else:
+                made += matchmaker_worker.match_one_pair()
+    elapsed = time.perf_counter() - t0
+    cleanup(r, uids)
+    return made / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--players", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--modes", default="single,batch,rating")
+    parser.add_argument("--fake", action="store_true", help="use fakeredis instead of REDIS_URL")
+    parser.add_argument("--tied", action="store_true", help="rating mode: give every player the same rating")
+    args = parser.parse_args()
+
+    r = make_redis(args.fake)
+    matchmaker_worker.r = r
+    # Keep the benchmark's events, start messages and wait stats away from
+    # any real web processes and game workers
+    game.EVENT_CHANNEL = "bench:events"
+    game.START_GAME_STREAM = "bench:stream:start_game"
+    matchmaking.WAIT_STATS_KEY = "bench:matchmaking:wait_stats"
+
+    for mode in args.modes.split(","):
+        rate = run(r, mode, args.players, args.batch_size, tied=args.tied)
+        print(f"{mode:<7} {args.players:>6} players  {rate:>9.1f} matches/s")
+
+    r.delete(game.START_GAME_STREAM, matchmaking.WAIT_STATS_KEY)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark: thread-per-room timers vs. the shared RoomScheduler.
+
+Starts N fake rooms in Redis, lets each timer model run for a fixed window
+and reports process RSS, CPU time and thread count for both.
+
+The legacy model DECRs and publishes every second per room. The scheduler
+only wakes rooms for resync broadcasts and expiry; pass --resync 30 to see
+the production setting, or leave the default of 1 s for a like-for-like
+comparison.
+
+Usage:
+    python tools/bench_timers.py --rooms 100 1000 5000 --seconds 5
+    python tools/bench_timers.py --fake   # in-memory Redis (needs fakeredis)
+
+Each model runs in its own subprocess so memory numbers don't bleed
+between runs.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game import room_key
+
+EVENT_CHANNEL = "bench:timer_events"
+
+
+def rss_kb() -> int:
+    """Resident set size of this process in KiB (Linux)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def make_redis(fake: bool):
+    if fake:
+        import fakeredis
+        return fakeredis.FakeRedis(decode_responses=True)
+    import redis
+    return redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379/0"),
+                          decode_responses=True)
+
+
+def seed_rooms(r, n: int, duration: int) -> list:
+    rooms = [f"bench-{uuid.uuid4()}" for _ in range(n)]
+    pipe = r.pipeline(transaction=False)
+    for room in rooms:
+        pipe.hset(room_key(room), mapping={
+            "p1": "1", "p2": "2", "duration": duration,
+            "ends_at": int((time.time() + duration) * 1000),
+        })
+        pipe.set(f"bench:{room}:time_left", duration)
+        pipe.expire(room_key(room), 600)
+        pipe.expire(f"bench:{room}:time_left", 600)
+    pipe.execute()
+    return rooms
+
+
+def drop_rooms(r, rooms):
+    pipe = r.pipeline(transaction=False)
+    for room in rooms:
+        pipe.delete(room_key(room), f"bench:{room}:time_left")
+    pipe.execute()
+
+
+def legacy_timer(r, room: str, stop: threading.Event):
+    """The original per-room loop from game_worker.run_timer_for_room."""
+    timer_key = f"bench:{room}:time_left"
+    while not stop.is_set():
+        if r.hexists(room_key(room), "ended") or not r.exists(room_key(room)):
+            break
+        time_left = r.decr(timer_key)
+        if time_left <= 0:
+            break
+        r.publish(EVENT_CHANNEL, json.dumps(
+            {"type": "timer_update", "room": room, "time_left": int(time_left)}))
+        time.sleep(1)
+
+
+def run_one(model: str, n: int, seconds: float, fake: bool, resync: float) -> dict:
+    import game_worker  # imported up front so both models pay the same baseline
+    import game
+    game.EVENT_CHANNEL = EVENT_CHANNEL  # room channels become bench:timer_events:room:<room>
+
+    r = make_redis(fake)
+    rooms = seed_rooms(r, n, duration=int(seconds) + 60)
+
+    rss_before = rss_kb()
+    cpu_before = time.process_time()
+    stop = threading.Event()
+
+    if model == "threads":
+        for room in rooms:
+            threading.Thread(target=legacy_timer, args=(r, room, stop), daemon=True).start()
+    else:
+        scheduler = game_worker.RoomScheduler(r, on_expire=lambda room: None,
+                                              resync_interval=resync)
+        for room in rooms:
+            scheduler.add_room(room)
+        scheduler.start()
+
+    time.sleep(seconds)
+    result = {
+        "model": model,
+        "rooms": n,
+        "threads": threading.active_count(),
+        "rss_delta_kb": rss_kb() - rss_before,
+        "cpu_s": round(time.process_time() - cpu_before, 3),
+        "cpu_pct": round(100 * (time.process_time() - cpu_before) / seconds, 1),
+    }
+    stop.set()
+    drop_rooms(r, rooms)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rooms", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--resync", type=float, default=1.0,
+                        help="scheduler resync interval; 1.0 matches the legacy per-second updates")
+    parser.add_argument("--fake", action="store_true", help="use fakeredis instead of REDIS_URL")
+    parser.add_argument("--child", nargs=2, metavar=("MODEL", "ROOMS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        model, n = args.child
+        print(json.dumps(run_one(model, int(n), args.seconds, args.fake, args.resync)))
+        return
+
+    print(f"{'model':<10} {'rooms':>6} {'threads':>8} {'rss MiB':>9} {'cpu s':>7} {'cpu %':>7}")
+    for n in args.rooms:
+        for model in ("threads", "scheduler"):
+            cmd = [sys.executable, __file__, "--child", model, str(n),
+                   "--seconds", str(args.seconds), "--resync", str(args.resync)]
+            if args.fake:
+                cmd.append("--fake")
+            out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+            res = json.loads(out.strip().splitlines()[-1])
+            print(f"{res['model']:<10} {res['rooms']:>6} {res['threads']:>8} "
+                  f"{res['rss_delta_kb'] / 1024:>9.1f} {res['cpu_s']:>7} {res['cpu_pct']:>7}")
+
+
+if __name__ == "__main__":
+    main()
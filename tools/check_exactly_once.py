@@ -0,0 +1,206 @@
+"""
+Check: with several web processes, every client gets each event exactly once.
+
+Starts --procs web processes (gunicorn, eventlet, one worker each, on
+consecutive ports) against --redis-url and a scratch SQLite database,
+registers two players per process and connects every player's Socket.IO
+client to a different process than their opponent's. Then, for each pair:
+
+    - game.create_match() publishes match_found to both user channels,
+      exactly as the matchmaker does
+    - both players join the room; the web tier answers each with a
+      timer_update, and one more is published on the room channel as the
+      game worker would
+    - half the rooms end with a game_over published on the room channel
+      (the game worker path), the other half by one player surrendering
+      (the web tier emits through the Socket.IO message queue)
+
+and finally checks that every client received match_found, game_over once
+and timer_update twice. Exits non-zero on any mismatch.
+
+With --single-port it instead starts one `gunicorn -w PROCS` on one port,
+as the Procfile and start.sh run the web tier, and the kernel spreads
+connections over the workers; it then plays 4 x PROCS pairs by default so
+most opponents still land on different processes.
+
+Needs a local Redis (use a scratch database; the default is db 15) and the
+dev requirements (requests, python-socketio[client]).
+
+Usage:
+    python tools/check_exactly_once.py --procs 4
+    python tools/check_exactly_once.py --procs 4 --single-port
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import redis  # noqa: E402
+import requests  # noqa: E402
+import socketio  # noqa: E402
+
+import game  # noqa: E402
+import game_worker  # noqa: E402
+
+EXPECTED = {"match_found": 1, "timer_update": 2, "game_over": 1}
+SETTLE = 2.0  # seconds to wait for stragglers (and duplicates) to arrive
+
+
+def start_web(port: int, env: dict, workers: int = 1) -> subprocess.Popen:
+    return subprocess.Popen(
+        ["gunicorn", "--worker-class", "eventlet", "-w", str(workers), "app:app",
+         "--bind", f"127.0.0.1:{port}"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_ready(url: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+class Player:
+    def __init__(self, base_url: str, username: str):
+        self.base_url = base_url
+        self.username = username
+        self.http = requests.Session()
+        self.counts = Counter()
+        self.connected = threading.Event()
+        self.user_id = None
+        self.sio = socketio.Client(reconnection=False)
+        for event in EXPECTED:
+            self.sio.on(event, self._counter(event))
+        self.sio.on("connected", lambda data: self.connected.set())
+
+    def _counter(self, event):
+        def handler(*_):
+            self.counts[event] += 1
+        return handler
+
+    def login(self):
+        creds = {"username": self.username, "password": "password123"}
+        self.http.post(f"{self.base_url}/register", json=creds).raise_for_status()
+        resp = self.http.post(f"{self.base_url}/login", json=creds)
+        resp.raise_for_status()
+        self.user_id = resp.json()["user_id"]
+
+    def connect(self):
+        cookie = "; ".join(f"{k}={v}" for k, v in self.http.cookies.items())
+        self.sio.connect(self.base_url, headers={"Cookie": cookie}, transports=["websocket"])
+        if not self.connected.wait(5):
+            raise RuntimeError(f"{self.username} was not accepted by {self.base_url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--procs", type=int, default=4)
+    parser.add_argument("--base-port", type=int, default=5100)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--single-port", action="store_true",
+                        help="one gunicorn with --procs workers on one port, as deployed")
+    parser.add_argument("--pairs", type=int,
+                        help="player pairs (default: --procs, or 4 x --procs with --single-port)")
+    args = parser.parse_args()
+    pairs_wanted = args.pairs or (4 * args.procs if args.single_port else args.procs)
+
+    db_file = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    env = dict(os.environ,
+               REDIS_URL=args.redis_url,
+               DATABASE_URL=f"sqlite:///{db_file.name}",
+               SECRET_KEY=os.environ.get("SECRET_KEY", "exactly-once-check"),
+               # Every player registers from 127.0.0.1
+               RATELIMIT_ENABLED="0")
+    subprocess.run([sys.executable, "migrate.py"], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+
+    r = redis.from_url(args.redis_url, decode_responses=True)
+    if args.single_port:
+        urls = [f"http://127.0.0.1:{args.base_port}"]
+        procs = [start_web(args.base_port, env, workers=args.procs)]
+    else:
+        urls = [f"http://127.0.0.1:{args.base_port + i}" for i in range(args.procs)]
+        procs = [start_web(args.base_port + i, env) for i in range(args.procs)]
+    players = []
+    try:
+        for url in urls:
+            wait_ready(url)
+
+        # With a port per process, player 2k goes to process k and player
+        # 2k+1 to process k+1, so every opponent lives on a different
+        # process; on a single port the kernel picks the process
+        run_id = uuid.uuid4().hex[:6]
+        pairs = []
+        for k in range(pairs_wanted):
+            a = Player(urls[k % len(urls)], f"eo{run_id}a{k}")
+            b = Player(urls[(k + 1) % len(urls)], f"eo{run_id}b{k}")
+            for p in (a, b):
+                p.login()
+                p.connect()
+            players += [a, b]
+            pairs.append((a, b))
+        time.sleep(0.5)  # let each process subscribe to its users' channels
+
+        rooms = [game.create_match(r, a.user_id, b.user_id) for a, b in pairs]
+        time.sleep(0.5)
+
+        for room, (a, b) in zip(rooms, pairs):
+            for p in (a, b):
+                p.sio.emit("join_room", {"room": room})
+        time.sleep(0.5)  # room channel subscriptions
+
+        for room in rooms:
+            ends_at = game.get_ends_at(r, room) or time.time() + 60
+            r.publish(game.room_channel(room), json.dumps(game_worker.timer_sync_payload(room, ends_at)))
+
+        for i, (room, (a, b)) in enumerate(zip(rooms, pairs)):
+            if i % 2:
+                a.sio.emit("surrender", {"room": room})
+            else:
+                r.publish(game.room_channel(room), json.dumps({
+                    "type": "game_over", "room": room,
+                    "final_scores": {"p1": 0, "p2": 0}, "winner_id": None,
+                }))
+        time.sleep(SETTLE)
+
+        failures = 0
+        for p in players:
+            got = {event: p.counts[event] for event in EXPECTED}
+            ok = got == EXPECTED
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {p.username:<16} {p.base_url}  {got}")
+
+        for room, (a, b) in zip(rooms, pairs):
+            game.end_game_cleanup(r, room, players=(a.user_id, b.user_id))
+
+        print(f"{len(players) - failures}/{len(players)} clients received every event exactly once")
+        sys.exit(1 if failures else 0)
+    finally:
+        for p in players:
+            try:
+                p.sio.disconnect()
+            except Exception:
+                pass
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait(timeout=10)
+        os.unlink(db_file.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+Load test: simulated players against a full local deployment.
+
+Starts its own stack - a redis-server on a spare port, a scratch SQLite
+database, the web tier (gunicorn, eventlet, --web-workers processes), the
+matchmaker and a game worker - then drives --players synthetic players,
+each of which:
+
+    registers and logs in (/register, /login), connects a Socket.IO client,
+    joins the queue (/queue), waits for match_found, joins the room and
+    submits guesses at --guess-interval seconds on average (exponentially
+    distributed), narrowing its candidates from the feedback like a real
+    player, until game_over, then waits for match_saved; --games times.
+
+and reports:
+
+    - match formation: matches formed per second and queue -> match_found
+      latency percentiles
+    - guess round trip: submit_guess -> guess_feedback percentiles
+    - timer-update lag: receive time minus the server_now stamped by the
+      game worker (same host, so clocks agree)
+    - persistence latency: game_over -> match_saved (the write-behind match
+      writer's flush delay)
+
+Games are shortened with GAME_DURATION (--game-seconds), and rate limiting
+is turned off for the stack since every player comes from one address
+(RATELIMIT_ENABLED=0). Needs redis-server on PATH (or --redis-url for an
+existing scratch Redis) and the dev requirements (pip install -r
+requirements-dev.txt). Each player uses a few client threads, so a single
+harness process tops out in the low thousands of players; run several with
+distinct --prefix values for more.
+
+Usage:
+    python tools/loadtest.py --players 500 --web-workers 4 --game-seconds 30
+    python tools/loadtest.py --players 200 --json > loadtest.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket as socketlib
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+import requests  # noqa: E402
+import socketio  # noqa: E402
+
+from feedback_matrix import COLOR_NAMES  # noqa: E402
+from wordle_logic import feedback_matrix, random_word  # noqa: E402
+
+
+def free_port() -> int:
+    with socketlib.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(check, what: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if check():
+                return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{what} did not come up")
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {"n": 0}
+    arr = np.asarray(values, dtype=float)
+    return {
+        "n": len(values),
+        "p50": round(float(np.percentile(arr, 50)), 2),
+        "p90": round(float(np.percentile(arr, 90)), 2),
+        "p99": round(float(np.percentile(arr, 99)), 2),
+        "max": round(float(arr.max()), 2),
+    }
+
+
+class Stack:
+    """Redis, SQLite and every service, started in the background."""
+
+    def __init__(self, args):
+        self.args = args
+        self.procs = []
+        self.tmpdir = tempfile.mkdtemp(prefix="wordle-loadtest-")
+        self.web_port = free_port()
+        self.redis_url = args.redis_url
+        self.base_url = f"http://127.0.0.1:{self.web_port}"
+
+    def _spawn(self, cmd, env, name):
+        log = open(os.path.join(self.tmpdir, f"{name}.log"), "w")
+        proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        self.procs.append(proc)
+        return proc
+
+    def start(self):
+        if not self.redis_url:
+            server = shutil.which("redis-server")
+            if not server:
+                raise SystemExit("redis-server not found; install it or pass --redis-url")
+            port = free_port()
+            self._spawn([server, "--port", str(port), "--save", "", "--appendonly", "no"],
+                        os.environ.copy(), "redis")
+            self.redis_url = f"redis://127.0.0.1:{port}/0"
+            import redis
+            client = redis.from_url(self.redis_url)
+            wait_for(client.ping, "redis-server")
+
+        env = dict(os.environ,
+                   REDIS_URL=self.redis_url,
+                   DATABASE_URL=f"sqlite:///{os.path.join(self.tmpdir, 'loadtest.db')}",
+                   SECRET_KEY="loadtest",
+                   GAME_DURATION=str(self.args.game_seconds),
+                   MATCHMAKER_MODE=self.args.matchmaker_mode,
+                   # Every simulated player shares 127.0.0.1, so the per-IP
+                   # buckets would cap the whole run
+                   RATELIMIT_ENABLED="0",
+                   PYTHONUNBUFFERED="1")
+        subprocess.run([sys.executable, "migrate.py"], cwd=ROOT, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+
+        self._spawn([sys.executable, "matchmaker_worker.py"], env, "matchmaker")
+        self._spawn([sys.executable, "game_worker.py"], env, "game_worker")
+        self._spawn(["gunicorn", "--worker-class", "eventlet", "-w", str(self.args.web_workers),
+                     "app:app", "--bind", f"127.0.0.1:{self.web_port}"], env, "web")
+        wait_for(lambda: requests.get(self.base_url, timeout=1).ok, "web tier")
+
+    def stop(self):
+        for proc in reversed(self.procs):
+            proc.terminate()
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if self.args.keep_logs:
+            print(f"Logs kept in {self.tmpdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {"queue_to_match_ms": [], "guess_rtt_ms": [], "timer_lag_ms": [],
+                        "persist_ms": [], "login_ms": []}
+        self.match_times = []
+        self.counts = {"games": 0, "guesses": 0, "solved": 0, "errors": 0, "timeouts": 0}
+
+    def add(self, name, value):
+        with self.lock:
+            self.samples[name].append(value)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] += n
+
+
+class Player:
+    """One synthetic player driving the HTTP API and a Socket.IO client."""
+
+    def __init__(self, base_url: str, name: str, metrics: Metrics, args):
+        self.base_url = base_url
+        self.name = name
+        self.metrics = metrics
+        self.args = args
+        self.http = requests.Session()
+        self.sio = socketio.Client(reconnection=False)
+        self.matrix = feedback_matrix(wait=True)
+
+        self.match_found = threading.Event()
+        self.game_over = threading.Event()
+        self.match_saved = threading.Event()
+        self.reply = threading.Event()
+        self.room = None
+        self.last_feedback = None
+        self.game_over_at = None
+        self.candidates = None
+
+        self.sio.on("match_found", self._on_match_found)
+        self.sio.on("timer_update", self._on_timer_update)
+        self.sio.on("guess_feedback", self._on_feedback)
+        self.sio.on("guess_error", self._on_error)
+        self.sio.on("new_word", lambda data: self._reset_candidates())
+        self.sio.on("game_over", self._on_game_over)
+        self.sio.on("match_saved", lambda data: self.match_saved.set())
+
+    # ---- socket handlers ----
+    def _on_match_found(self, data):
+        self.room = data.get("room")
+        self.match_found.set()
+
+    def _on_timer_update(self, data):
+        server_now = data.get("server_now")
+        if server_now:
+            self.metrics.add("timer_lag_ms", time.time() * 1000 - server_now)
+
+    def _on_feedback(self, data):
+        self.last_feedback = data
+        self.reply.set()
+
+    def _on_error(self, data):
+        self.last_feedback = None
+        self.reply.set()
+
+    def _on_game_over(self, data):
+        self.game_over_at = time.perf_counter()
+        self.game_over.set()
+
+    # ---- guessing ----
+    def _reset_candidates(self):
+        self.candidates = None
+
+    def _next_guess(self) -> str:
+        if self.matrix is None or self.candidates is None or not len(self.candidates):
+            return random_word()
+        return self.matrix.words[int(random.choice(self.candidates))]
+
+    def _narrow(self, guess: str, colors):
+        if self.matrix is None:
+            return
+        code = sum(COLOR_NAMES.index(c) * 3 ** i for i, c in enumerate(colors))
+        if self.candidates is None:
+            self.candidates = np.arange(self.matrix.n)
+        keep = self.matrix.score_many(guess, self.candidates) == code
+        self.candidates = self.candidates[keep]
+
+    # ---- lifecycle ----
+    def login(self):
+        creds = {"username": self.name, "password": "loadtest123"}
+        t0 = time.perf_counter()
+        self.http.post(f"{self.base_url}/register", json=creds).raise_for_status()
+        self.http.post(f"{self.base_url}/login", json=creds).raise_for_status()
+        self.metrics.add("login_ms", (time.perf_counter() - t0) * 1000)
+        cookie = "; ".join(f"{k}={v}" for k, v in self.http.cookies.items())
+        self.sio.connect(self.base_url, headers={"Cookie": cookie}, transports=["websocket"])
+
+    def play_one(self):
+        for event in (self.match_found, self.game_over, self.match_saved):
+            event.clear()
+        self.candidates = None
+
+        t_queue = time.perf_counter()
+        self.http.post(f"{self.base_url}/queue").raise_for_status()
+        if not self.match_found.wait(self.args.match_timeout):
+            self.metrics.count("timeouts")
+            self.http.post(f"{self.base_url}/queue/cancel")
+            return
+        now = time.perf_counter()
+        self.metrics.add("queue_to_match_ms", (now - t_queue) * 1000)
+        with self.metrics.lock:
+            self.metrics.match_times.append(time.time())
+
+        self.sio.emit("join_room", {"room": self.room})
+        while not self.game_over.is_set():
+            if self.game_over.wait(random.expovariate(1.0 / self.args.guess_interval)):
+                break
+            guess = self._next_guess()
+            self.reply.clear()
+            t0 = time.perf_counter()
+            self.sio.emit("submit_guess", {"room": self.room, "guess": guess})
+            if not self.reply.wait(10):
+                self.metrics.count("timeouts")
+                continue
+            self.metrics.add("guess_rtt_ms", (time.perf_counter() - t0) * 1000)
+            self.metrics.count("guesses")
+            feedback = self.last_feedback
+            if feedback is None:
+                self.metrics.count("errors")
+            elif feedback.get("solved"):
+                self.metrics.count("solved")
+                self.candidates = None
+            else:
+                self._narrow(guess, feedback["colors"])
+
+        if self.match_saved.wait(self.args.persist_timeout):
+            self.metrics.add("persist_ms", (time.perf_counter() - self.game_over_at) * 1000)
+        else:
+            self.metrics.count("timeouts")
+        self.metrics.count("games")
+
+    def run(self):
+        try:
+            self.login()
+            for _ in range(self.args.games):
+                self.play_one()
+        except Exception as e:
+            print(f"{self.name}: {e}", file=sys.stderr)
+            self.metrics.count("errors")
+        finally:
+            try:
+                self.sio.disconnect()
+            except Exception:
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--games", type=int, default=1, help="games per player")
+    parser.add_argument("--ramp", type=float, default=10.0, help="seconds over which players start")
+    parser.add_argument("--guess-interval", type=float, default=4.0, help="mean seconds between guesses")
+    parser.add_argument("--game-seconds", type=int, default=30)
+    parser.add_argument("--web-workers", type=int, default=1)
+    parser.add_argument("--matchmaker-mode", default="rating")
+    parser.add_argument("--match-timeout", type=float, default=60.0)
+    parser.add_argument("--persist-timeout", type=float, default=30.0)
+    parser.add_argument("--redis-url", help="use this (scratch) Redis instead of starting one")
+    parser.add_argument("--prefix", default=None, help="username prefix (default: random)")
+    parser.add_argument("--keep-logs", action="store_true")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    stack = Stack(args)
+    metrics = Metrics()
+    prefix = args.prefix or f"lt{uuid.uuid4().hex[:6]}"
+    try:
+        stack.start()
+        t0 = time.time()
+        threads = []
+        for i in range(args.players):
+            player = Player(stack.base_url, f"{prefix}_{i}", metrics, args)
+            t = threading.Thread(target=player.run, daemon=True)
+            t.start()
+            threads.append(t)
+            time.sleep(args.ramp / max(1, args.players))
+        for t in threads:
+            t.join()
+        elapsed = time.time() - t0
+    finally:
+        stack.stop()
+
+    matches = len(metrics.match_times) // 2
+    span = (max(metrics.match_times) - min(metrics.match_times)) if len(metrics.match_times) > 1 else 0
+    report = {
+        "players": args.players,
+        "web_workers": args.web_workers,
+        "elapsed_s": round(elapsed, 1),
+        "matches": matches,
+        "match_rate_per_s": round(matches / span, 2) if span else None,
+        "counts": metrics.counts,
+        **{name: percentiles(values) for name, values in metrics.samples.items()},
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.players} players, {args.web_workers} web workers, {report['elapsed_s']}s")
+    print(f"matches formed: {matches} ({report['match_rate_per_s']}/s)   counts: {metrics.counts}")
+    for name in metrics.samples:
+        p = report[name]
+        if p["n"]:
+            print(f"  {name:<18} n={p['n']:<6} p50={p['p50']:<8} p90={p['p90']:<8} "
+                  f"p99={p['p99']:<8} max={p['max']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Microbenchmarks for the hot primitives, with a saved baseline.
+
+Covers:
+    - wordle_logic: evaluate_guess (matrix lookup and the direct fallback),
+      is_valid_word (hit and miss), random_word
+    - game: create_game, increment_score, resolve_guess (a wrong guess and
+      a solve, the submit_guess hot path), get_scores, end_game_cleanup,
+      against fakeredis and, when reachable, a real Redis (--redis-url; use a
+      scratch database, the default is db 15)
+    - game over: game_worker.handle_game_over on its own, and followed by
+      the match writer persisting the result into a scratch SQLite database
+
+Each benchmark is calibrated to run at least --min-time seconds per
+repeat; the best of --repeats is reported as ns/op (the median is kept for
+reference). Results can be written as JSON (--json), saved as a baseline
+(--save-baseline) and compared against one (--baseline): any benchmark
+slower than the baseline by more than --threshold is flagged and the
+script exits 1, so a change to these modules can be checked with
+
+    python tools/microbench.py --save-baseline bench.json   # before
+    python tools/microbench.py --baseline bench.json        # after
+
+Compare runs from the same machine only.
+
+Usage:
+    python tools/microbench.py
+    python tools/microbench.py --only game. --backends fake
+    python tools/microbench.py --json results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import Flask  # noqa: E402
+from db import db  # noqa: E402
+from models import User  # noqa: E402
+import game  # noqa: E402
+import game_worker  # noqa: E402
+import match_results  # noqa: E402
+import wordle_logic  # noqa: E402
+
+USERS = 200
+
+
+def make_redis(backend: str, url: str):
+    if backend == "fake":
+        import fakeredis
+        return fakeredis.FakeRedis(decode_responses=True)
+    import redis
+    r = redis.from_url(url, decode_responses=True)
+    r.ping()
+    return r
+
+
+def make_app(url: str) -> Flask:
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = url
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(User(id=i, username=f"bench{i}", password_hash="x")
+                           for i in range(1, USERS + 1))
+        db.session.commit()
+    return app
+
+
+def timed(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return time.perf_counter() - t0
+
+
+# ---- benchmarks: each takes n and returns the seconds spent on n ops ----
+
+def wordle_benchmarks() -> dict:
+    wordle_logic.feedback_matrix(wait=True)  # don't time the direct fallback while it builds
+    words = list(wordle_logic.get_dictionary())
+    secret, guess = words[0], words[len(words) // 2]
+    return {
+        "wordle_logic.evaluate_guess": lambda n: timed(
+            lambda: wordle_logic.evaluate_guess(secret, guess), n),
+        "wordle_logic.evaluate_guess_direct": lambda n: timed(
+            lambda: wordle_logic._evaluate_direct(secret, guess), n),
+        "wordle_logic.is_valid_word.hit": lambda n: timed(
+            lambda: wordle_logic.is_valid_word(guess), n),
+        "wordle_logic.is_valid_word.miss": lambda n: timed(
+            lambda: wordle_logic.is_valid_word("QZXQZ"), n),
+        "wordle_logic.random_word": lambda n: timed(wordle_logic.random_word, n),
+    }
+
+
+def game_benchmarks(r) -> dict:
+    def rooms(n):
+        pipe = r.pipeline(transaction=False)
+        made = [f"bench-{uuid.uuid4()}" for _ in range(n)]
+        for room in made:
+            game._queue_game_state(pipe, room, 1, 2, game.DEFAULT_DURATION)
+        pipe.execute()
+        return made
+
+    def cleanup(made):
+        for room in made:
+            game.end_game_cleanup(r, room, players=("1", "2"))
+
+    def create_game(n):
+        t0 = time.perf_counter()
+        made = [game.create_game(r, 1, 2) for _ in range(n)]
+        elapsed = time.perf_counter() - t0
+        cleanup(made)
+        return elapsed
+
+    def on_one_room(op):
+        def bench(n):
+            (room,) = rooms(1)
+            elapsed = timed(lambda: op(room), n)
+            cleanup([room])
+            return elapsed
+        return bench
+
+    def resolve_guess(solve: bool):
+        # Player 1's word is pinned, and a solve rotates in the same word,
+        # so every call takes the same branch
+        def bench(n):
+            (room,) = rooms(1)
+            r.hset(game.room_key(room), game.word_field(1), "CRANE")
+            guess = "CRANE" if solve else "SLATE"
+            elapsed = timed(lambda: game.resolve_guess(r, room, 1, guess, "CRANE"), n)
+            cleanup([room])
+            return elapsed
+        return bench
+
+    def end_game_cleanup(n):
+        made = rooms(n)
+        t0 = time.perf_counter()
+        for room in made:
+            game.end_game_cleanup(r, room)
+        return time.perf_counter() - t0
+
+    return {
+        "game.create_game": create_game,
+        "game.increment_score": on_one_room(lambda room: game.increment_score(r, room, 1)),
+        "game.resolve_guess.miss": resolve_guess(solve=False),
+        "game.resolve_guess.solve": resolve_guess(solve=True),
+        "game.get_scores": on_one_room(lambda room: game.get_scores(r, room)),
+        "game.end_game_cleanup": end_game_cleanup,
+    }
+
+
+def game_over_benchmarks(r, app) -> dict:
+    game_worker.r = r
+    match_results.ensure_group(r)
+    writer = match_results.MatchResultWriter(r, app, consumer="microbench")
+
+    def finished_rooms(n):
+        made = []
+        pipe = r.pipeline(transaction=False)
+        for i in range(n):
+            room = f"bench-{uuid.uuid4()}"
+            p1 = 1 + i % USERS
+            p2 = 1 + (i + 1) % USERS
+            game._queue_game_state(pipe, room, p1, p2, game.DEFAULT_DURATION)
+            pipe.hset(game.room_key(room), mapping={"score_p1": i % 5, "score_p2": i % 3})
+            made.append(room)
+        pipe.execute()
+        return made
+
+    def drain():
+        """Flush everything queued for the writer; returns results saved."""
+        saved = 0
+        while True:
+            response = r.xreadgroup(match_results.RESULTS_GROUP, "microbench",
+                                    {match_results.RESULTS_STREAM: ">"},
+                                    count=writer.batch_size)
+            messages = [m for _, batch in response or [] for m in batch]
+            if not messages:
+                return saved
+            saved += writer.flush(messages)
+
+    def handle_game_over(n):
+        made = finished_rooms(n)
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            for room in made:
+                game_worker.handle_game_over(room)
+            elapsed = time.perf_counter() - t0
+            drain()
+        return elapsed
+
+    def handle_game_over_persist(n):
+        made = finished_rooms(n)
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            for room in made:
+                game_worker.handle_game_over(room)
+            saved = drain()
+            elapsed = time.perf_counter() - t0
+        if saved != n:
+            raise RuntimeError(f"persisted {saved} of {n} results")
+        return elapsed
+
+    return {
+        "game_worker.handle_game_over": handle_game_over,
+        "game_worker.handle_game_over+persist": handle_game_over_persist,
+    }
+
+
+# ---- measurement ----
+
+def measure(bench, min_time: float, repeats: int) -> dict:
+    n = 1
+    while True:
+        elapsed = bench(n)
+        if elapsed >= min_time or n >= 1_000_000:
+            break
+        n = max(n * 2, int(n * min_time / max(elapsed, 1e-9) * 1.2))
+    per_op = [elapsed / n] + [bench(n) / n for _ in range(repeats - 1)]
+    return {
+        "ns_per_op": round(min(per_op) * 1e9, 1),
+        "median_ns_per_op": round(statistics.median(per_op) * 1e9, 1),
+        "ops_per_s": round(1 / min(per_op), 1),
+        "n": n,
+        "repeats": repeats,
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Benchmarks slower than baseline by more than threshold, as (name, ratio)."""
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = res["ns_per_op"] / base["ns_per_op"]
+        res["baseline_ns_per_op"] = base["ns_per_op"]
+        res["ratio"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backends", default="fake,redis",
+                        help="comma-separated Redis backends: fake, redis")
+    parser.add_argument("--redis-url", default=os.environ.get("BENCH_REDIS_URL", "redis://localhost:6379/15"))
+    parser.add_argument("--only", default="", help="run only benchmarks whose name starts with this")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per repeat")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write results as the new baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against this baseline")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="flag benchmarks this much slower than baseline (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    benches = dict(wordle_benchmarks())
+    skipped = {}
+    db_file = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    db_file.close()
+    try:
+        app = make_app(f"sqlite:///{db_file.name}")
+        for backend in filter(None, args.backends.split(",")):
+            try:
+                r = make_redis(backend, args.redis_url)
+            except Exception as e:
+                skipped[backend] = str(e)
+                print(f"skipping {backend} backend: {e}", file=sys.stderr)
+                continue
+            for name, bench in {**game_benchmarks(r), **game_over_benchmarks(r, app)}.items():
+                benches[f"{name}[{backend}]"] = bench
+
+        results = {}
+        for name, bench in benches.items():
+            if not name.startswith(args.only):
+                continue
+            results[name] = measure(bench, args.min_time, args.repeats)
+            res = results[name]
+            print(f"{name:<48} {res['ns_per_op']:>12,.0f} ns/op  {res['ops_per_s']:>12,.0f} ops/s")
+    finally:
+        os.unlink(db_file.name)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+        for name, ratio in regressions:
+            print(f"REGRESSION {name}: {ratio:.2f}x baseline")
+        if not regressions:
+            print(f"no regressions beyond {args.threshold:.0%} of baseline")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "skipped_backends": skipped,
+        "results": results,
+    }
+    for path in filter(None, (args.json, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# word_dictionary.py
+"""
+Compact, memory-mapped word list.
+
+The dictionary is stored as fixed-width 5-byte upper-case ASCII records,
+sorted and de-duplicated, with no separators. Record i starts at byte 5*i,
+so random selection is O(1) and membership is a binary search over the
+records (narrowed by a two-letter prefix table filled in by bisection as
+prefixes are first seen). The binary file is built from data/valid_words.txt on first use
+and memory-mapped read-only, so every process on a host shares one copy
+instead of each building its own set and list.
+
+Rebuild explicitly with:
+    python word_dictionary.py build
+"""
+import mmap
+import os
+import random
+import sys
+import threading
+
+WORD_LENGTH = 5
+
+_here = os.path.dirname(__file__)
+TEXT_PATH = os.path.join(_here, "data", "valid_words.txt")
+BINARY_PATH = os.environ.get("WORDLE_DICT_PATH") or os.path.join(_here, "data", "valid_words.bin")
+
+
+def build_records(text_path: str = TEXT_PATH) -> bytes:
+    """Read the text word list and return sorted fixed-width records."""
+    with open(text_path, "r") as f:
+        words = {w.strip().upper() for w in f if w.strip()}
+    words = sorted(w for w in words if len(w) == WORD_LENGTH and w.isascii() and w.isalpha())
+    return "".join(words).encode("ascii")
+
+
+class WordDictionary:
+    """
+    Sorted word list backed by a flat buffer of 5-byte records.
+
+    Args:
+        records: bytes-like buffer (mmap or bytes) of sorted records
+    """
+
+    def __init__(self, records):
+        self._buf = records
+        self._n = len(records) // WORD_LENGTH
+        self._starts = [None] * (26 * 26 + 1)
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError("word index out of range")
+        start = i * WORD_LENGTH
+        return self._buf[start:start + WORD_LENGTH].decode("ascii")
+
+    def __iter__(self):
+        for i in range(self._n):
+            yield self[i]
+
+    def _bisect(self, key: bytes) -> int:
+        """Index of the first record >= key."""
+        buf = self._buf
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = mid * WORD_LENGTH
+            if buf[start:start + WORD_LENGTH] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _prefix_start(self, p: int) -> int:
+        """
+        First record index for two-letter prefix number p (AA=0 .. ZZ=675,
+        676 = end), found by bisection the first time it is needed.
+        """
+        start = self._starts[p]
+        if start is None:
+            if p == 26 * 26:
+                start = self._n
+            else:
+                start = self._bisect(bytes((65 + p // 26, 65 + p % 26)))
+            self._starts[p] = start
+        return start
+
+    def index(self, word: str) -> int:
+        """Position of word in the sorted list; ValueError if absent."""
+        i = self._find(word)
+        if i is None:
+            raise ValueError(f"{word!r} is not in the dictionary")
+        return i
+
+    def _find(self, word: str) -> int | None:
+        if len(word) != WORD_LENGTH:
+            return None
+        try:
+            key = word.upper().encode("ascii")
+        except UnicodeEncodeError:
+            return None
+        if not key.isalpha():
+            return None
+
+        # The prefix table narrows the search to a handful of records; the
+        # scan inside that bucket runs in C, which beats slicing records
+        # out of the mmap one bisect step at a time.
+        p = (key[0] - 65) * 26 + (key[1] - 65)
+        lo = self._prefix_start(p) * WORD_LENGTH
+        hi = self._prefix_start(p + 1) * WORD_LENGTH
+        pos = self._buf.find(key, lo, hi)
+        while pos != -1 and (pos - lo) % WORD_LENGTH:
+            pos = self._buf.find(key, pos + 1, hi)
+        return None if pos == -1 else pos // WORD_LENGTH
+
+    def __contains__(self, word) -> bool:
+        return isinstance(word, str) and self._find(word) is not None
+
+    def random(self) -> str:
+        return self[random.randrange(self._n)]
+
+
+def _write_binary(records: bytes, path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(records)
+    os.replace(tmp, path)  # atomic, so concurrent builders are harmless
+
+
+def load_dictionary(text_path: str = TEXT_PATH, binary_path: str = BINARY_PATH) -> WordDictionary:
+    """
+    Memory-map the binary dictionary, (re)building it from the text file
+    when it is missing or older than the text file. Falls back to holding
+    the records in process memory if the binary can't be written.
+    """
+    try:
+        stale = (not os.path.exists(binary_path)
+                 or os.path.getmtime(binary_path) < os.path.getmtime(text_path))
+    except OSError:
+        stale = not os.path.exists(binary_path)
+
+    if stale:
+        records = build_records(text_path)
+        try:
+            _write_binary(records, binary_path)
+        except OSError as e:
+            print(f"Could not write binary dictionary at {binary_path}: {e}")
+            return WordDictionary(records)
+
+    with open(binary_path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return WordDictionary(mm)
+
+
+_dictionary = None
+_dictionary_lock = threading.Lock()
+
+
+def get_dictionary() -> WordDictionary:
+    """Process-wide dictionary, loaded on first use."""
+    global _dictionary
+    if _dictionary is None:
+        with _dictionary_lock:
+            if _dictionary is None:
+                _dictionary = load_dictionary()
+    return _dictionary
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["build"]:
+        print("usage: python word_dictionary.py build")
+        sys.exit(2)
+
+    records = build_records()
+    _write_binary(records, BINARY_PATH)
+    print(f"Wrote {len(records) // WORD_LENGTH} words to {BINARY_PATH}")
@@ -1,27 +1,49 @@
-# Load valid words from text file
-import os
-import random
-
-_here = os.path.dirname(__file__)
-
-# Prefer ./data/valid_words.txt (production layout), but fall back to ./valid_words.txt
-words_file = os.path.join(_here, 'data', 'valid_words.txt')
-if not os.path.exists(words_file):
-    words_file = os.path.join(_here, 'valid_words.txt')
-
-with open(words_file, 'r') as f:
-    VALID_WORDS = set(word.strip().upper() for word in f if word.strip())
-
-# Convert to list for random.choice() - sets are not subscriptable
-VALID_WORDS_LIST = list(VALID_WORDS)
+# Valid words come from the shared, memory-mapped binary dictionary
+# (see word_dictionary.py), which is built from data/valid_words.txt and
+# only loaded on first use.
+from word_dictionary import get_dictionary
+
+
+def __getattr__(name):
+    """Build the legacy set/list views lazily for callers that still use them."""
+    if name == 'VALID_WORDS':
+        value = set(get_dictionary())
+    elif name == 'VALID_WORDS_LIST':
+        value = list(get_dictionary())
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+_matrix = None
+_matrix_unavailable = False
+
+
+def feedback_matrix(wait: bool = False):
+    """
+    Shared precomputed feedback matrix (see feedback_matrix.py), loaded on
+    first use. Returns None if it can't be loaded or, unless wait is set,
+    while it is still being built in the background; callers then fall
+    back to computing feedback directly.
+    """
+    global _matrix, _matrix_unavailable
+    if _matrix is None and not _matrix_unavailable:
+        try:
+            import feedback_matrix as fm
+            _matrix = fm.get_matrix(get_dictionary(), wait=wait)
+        except Exception as e:
+            print(f"Feedback matrix unavailable, using direct evaluation: {e}")
+            _matrix_unavailable = True
+    return _matrix
 
 
 def random_word():
-    return random.choice(VALID_WORDS_LIST)
+    return get_dictionary().random()
 
 
 def is_valid_word(word: str) -> bool:
-    return word.upper() in VALID_WORDS
+    return word in get_dictionary()
 
 
 def evaluate_guess(secret: str, guess: str) -> dict:
@@ -31,6 +53,37 @@ def evaluate_guess(secret: str, guess: str) -> dict:
     if len(guess) != len(secret):
         return {'colors': [], 'solved': False, 'error': 'Invalid word length'}
 
+    # O(1) lookup when both words are in the dictionary
+    matrix = feedback_matrix()
+    colors = matrix.colors(guess, secret) if matrix else None
+    if colors is not None:
+        return {'colors': colors, 'solved': guess == secret}
+
+    return _evaluate_direct(secret, guess)
+
+
+def evaluate_guess_batch(guess: str, secrets):
+    """
+    Score one guess against many secrets in a single vectorized call.
+
+    Args:
+        guess: A dictionary word
+        secrets: Dictionary words, or an integer array of word indices
+
+    Returns:
+        numpy uint8 array of packed feedback codes, one per secret; decode
+        with feedback_matrix.decode(). Raises KeyError for unknown words.
+    """
+    matrix = feedback_matrix(wait=True)
+    if matrix is None:
+        raise RuntimeError("Feedback matrix unavailable")
+    if not hasattr(secrets, 'dtype'):
+        secrets = [w.upper() for w in secrets]
+    return matrix.score_many(guess.upper(), secrets)
+
+
+def _evaluate_direct(secret: str, guess: str) -> dict:
+    """Two-pass Wordle evaluation for words outside the precomputed matrix."""
     colors = [None] * len(guess)
     secret_letters = list(secret)
 